@@ -18,11 +18,11 @@
 #
 
 
-from panda3d.core import LVector3d, LQuaterniond
+from panda3d.core import LPoint3d, LVector3d, LQuaterniond
 
 from . import units
 
-from math import pow, log, log10, exp, sqrt, asin, pi, atan2
+from math import pow, log, log10, exp, sqrt, asin, pi, atan2, sin, cos
 
 # Brightness increase factor for one magnitude
 magnitude_brightness_ratio = pow(10.0, 0.4)
@@ -99,6 +99,12 @@ def position_to_equatorial(position):
         right_ascension = 0.0
     return (right_ascension, declination)
 
+def equatorial_to_position(right_ascension, declination, distance):
+    position = LPoint3d(cos(declination) * cos(right_ascension),
+                        cos(declination) * sin(right_ascension),
+                        sin(declination)) * distance
+    return LPoint3d(units.J2000_Orientation.xform(position))
+
 def orientation_to_equatorial(orientation):
     axis = orientation.xform(LVector3d.up())
     projected = units.J2000_Orientation.conjugate().xform(axis)
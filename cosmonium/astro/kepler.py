@@ -23,3 +23,6 @@ except ImportError as e:
     print("WARNING: Could not load Kepler C implementation, fallback on python implementation")
     print("\t", e)
     from .pyastro.kepler import kepler_pos
+
+from .pyastro.kepler import kepler_elliptic_array, kepler_parabolic_array, kepler_hyperbolic_array, kepler_pos_array
+from .pyastro.kepler import elliptic_pos_array, parabolic_pos_array, hyperbolic_pos_array
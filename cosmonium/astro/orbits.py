@@ -25,3 +25,108 @@ except ImportError as e:
     print("WARNING: Could not load Orbits C implementation, fallback on python implementation")
     print("\t", e)
     from .pyastro.orbits import Orbit, FixedPosition, AbsoluteFixedPosition, LocalFixedPosition, EllipticalOrbit, FunctionOrbit
+
+from panda3d.core import LPoint3d, LVector3d
+
+from .frame import J2000EclipticReferenceFrame, J2000EquatorialReferenceFrame, CelestialReferenceFrame
+from .kepler import kepler_pos_array
+
+import numpy
+
+def get_frame_positions_at(orbit, times):
+    """
+    Return the positions of the orbit in its frame at the given times as a (n, 3) array.
+    """
+    times = numpy.asarray(times, dtype=numpy.float64)
+    if isinstance(orbit, EllipticalOrbit):
+        mean_anomalies = (times - orbit.epoch) * orbit.mean_motion + orbit.mean_anomaly
+        return kepler_pos_array(orbit.pericenter_distance, orbit.eccentricity, mean_anomalies)
+    return numpy.array([tuple(orbit.get_frame_position_at(time)) for time in times]).reshape(-1, 3)
+
+def get_local_transform(orbit, time):
+    """
+    Return the matrix and the origin that transform the positions in the orbit frame into local positions,
+    using the rotation of the orbit at the given time.
+    """
+    rotation = orbit.get_frame_rotation_at(time)
+    origin = LPoint3d(orbit.frame.get_local_position(LPoint3d()))
+    axes = [LVector3d.unit_x(), LVector3d.unit_y(), LVector3d.unit_z()]
+    matrix = numpy.array([tuple(orbit.frame.get_local_position(LPoint3d(rotation.xform(axis))) - origin) for axis in axes])
+    return matrix, numpy.array(tuple(origin))
+
+def frame_to_local_positions(orbit, time, positions):
+    """
+    Convert an array of positions in the orbit frame into local positions, using the rotation of the orbit at the given time.
+    """
+    matrix, origin = get_local_transform(orbit, time)
+    return numpy.dot(positions, matrix) + origin
+
+def get_local_positions_at(orbit, times):
+    """
+    Return the local positions of the orbit at the given times as a (n, 3) array.
+    """
+    times = numpy.asarray(times, dtype=numpy.float64)
+    if isinstance(orbit, EllipticalOrbit):
+        return frame_to_local_positions(orbit, times[0] if len(times) > 0 else 0.0, get_frame_positions_at(orbit, times))
+    return numpy.array([tuple(orbit.get_local_position_at(time)) for time in times]).reshape(-1, 3)
+
+class EllipticalOrbitSet(object):
+    """
+    Evaluate the positions of many elliptical orbits at the same time in a single call.
+
+    The elements and the orientation of the orbits are copied into arrays, update() must be called
+    when they are modified. Only the orbits defined in a frame with a fixed orientation can be part of a set,
+    the origin of the frames is retrieved once per frame anchor at each evaluation.
+    """
+    fixed_frames = (J2000EclipticReferenceFrame, J2000EquatorialReferenceFrame, CelestialReferenceFrame)
+
+    def __init__(self, orbits):
+        self.orbits = list(orbits)
+        self.update()
+
+    def __len__(self):
+        return len(self.orbits)
+
+    @classmethod
+    def accept(cls, orbit):
+        return isinstance(orbit, EllipticalOrbit) and isinstance(orbit.frame, cls.fixed_frames)
+
+    def update(self):
+        orbits = self.orbits
+        self.epochs = numpy.array([orbit.epoch for orbit in orbits], dtype=numpy.float64)
+        self.mean_motions = numpy.array([orbit.mean_motion for orbit in orbits], dtype=numpy.float64)
+        self.mean_anomalies = numpy.array([orbit.mean_anomaly for orbit in orbits], dtype=numpy.float64)
+        self.pericenter_distances = numpy.array([orbit.pericenter_distance for orbit in orbits], dtype=numpy.float64)
+        self.eccentricities = numpy.array([orbit.eccentricity for orbit in orbits], dtype=numpy.float64)
+        self.matrices = numpy.zeros((len(orbits), 3, 3))
+        self.anchors = []
+        anchor_indices = {}
+        self.anchor_indices = numpy.zeros(len(orbits), dtype=numpy.int64)
+        for (i, orbit) in enumerate(orbits):
+            self.matrices[i] = get_local_transform(orbit, 0.0)[0]
+            anchor = orbit.frame.anchor
+            index = anchor_indices.get(id(anchor))
+            if index is None:
+                index = len(self.anchors)
+                anchor_indices[id(anchor)] = index
+                self.anchors.append(anchor)
+            self.anchor_indices[i] = index
+
+    def get_frame_positions_at(self, time):
+        mean_anomalies = (time - self.epochs) * self.mean_motions + self.mean_anomalies
+        return kepler_pos_array(self.pericenter_distances, self.eccentricities, mean_anomalies)
+
+    def get_local_positions_at(self, time):
+        """
+        Return the local positions of all the orbits at the given time as a (n, 3) array.
+        """
+        positions = numpy.einsum('ni,nij->nj', self.get_frame_positions_at(time), self.matrices)
+        origins = numpy.array([tuple(anchor.get_local_position()) for anchor in self.anchors]).reshape(-1, 3)
+        return positions + origins[self.anchor_indices]
+
+    def get_absolute_reference_points(self):
+        """
+        Return the absolute reference point of each orbit.
+        """
+        reference_points = [anchor.get_absolute_reference_point() for anchor in self.anchors]
+        return [reference_points[index] for index in self.anchor_indices.tolist()]
@@ -21,6 +21,7 @@
 from panda3d.core import LPoint3d
 
 from math import sqrt, cos, sin, fabs, pi, atan2, exp, log, fmod, atan, sinh, cosh
+import numpy
 
 THRESH = 1.0e-12
 MIN_THRESH = 1.0e-14
@@ -171,3 +172,120 @@ def kepler_pos(pericenter, ecc, mean_anom):
         x = a * (ecc - cosh(ecc_anom) )
         y = a * sqrt(ecc * ecc - 1) * sinh(ecc_anom)
         return LPoint3d(x, y, 0.0)
+
+NEAR_PARABOLIC_ECC = 0.99
+
+def near_parabolic_array(ecc_anom, e):
+    """
+    Array version of near_parabolic(), evaluate E - e sin(E) (or e sinh(E) - E for hyperbolic orbits, with the
+    opposite sign) without the cancellation that occurs when e is close to 1.
+    """
+    anom2 = numpy.where(e > 1.0, 1.0, -1.0) * ecc_anom * ecc_anom
+    term = e * anom2 * ecc_anom / 6.0
+    rval = (1.0 - e) * ecc_anom - term
+    n = 4
+    while numpy.any(numpy.abs(term) > 1e-15):
+        term = term * anom2 / (n * (n + 1))
+        rval -= term
+        n += 2
+    return rval
+
+def kepler_elliptic_array(ecc, mean_anom):
+    """
+    Solve the elliptic Kepler equation for arrays of eccentricity and mean anomaly.
+    The starting point is always above the root, the Newton iterations then converge monotonically.
+    The near-parabolic series is used for the small anomalies when the eccentricity is close to 1.
+    """
+    ecc, mean_anom = numpy.broadcast_arrays(numpy.asarray(ecc, dtype=numpy.float64),
+                                            numpy.asarray(mean_anom, dtype=numpy.float64))
+    shape = mean_anom.shape
+    ecc = ecc.ravel()
+    mean_anom = mean_anom.ravel()
+    reduced = numpy.where(numpy.abs(mean_anom) > pi, numpy.remainder(mean_anom + pi, 2.0 * pi) - pi, mean_anom)
+    offset = mean_anom - reduced
+    sign = numpy.where(reduced < 0.0, -1.0, 1.0)
+    reduced = numpy.abs(reduced)
+    curr = numpy.minimum(reduced + ecc, pi)
+    near = (ecc > NEAR_PARABOLIC_ECC) & (reduced < 1.0)
+    # E - sin(E) > E^3 / 6 - E^5 / 120, which gives a starting point closer to the root for small anomalies
+    curr = numpy.where(near, numpy.minimum(curr, 1.1 * numpy.cbrt(6.0 * reduced)), curr)
+    for i in range(MAX_ITERATIONS):
+        err = curr - ecc * numpy.sin(curr) - reduced
+        if numpy.any(near):
+            err[near] = near_parabolic_array(curr[near], ecc[near]) - reduced[near]
+        delta_curr = err / (1.0 - ecc * numpy.cos(curr))
+        curr = curr - delta_curr
+        if numpy.all(numpy.abs(delta_curr) <= THRESH): break
+    return (offset + sign * curr).reshape(shape)
+
+def kepler_parabolic_array(mean_anom):
+    a = 3.0 / (2 * sqrt(2)) * numpy.asarray(mean_anom, dtype=numpy.float64)
+    b = numpy.cbrt(a + numpy.sqrt(a * a + 1))
+    return 2 * numpy.arctan(b - 1 / b)
+
+def kepler_hyperbolic_array(ecc, mean_anom):
+    """
+    Solve the hyperbolic Kepler equation for arrays of eccentricity and mean anomaly.
+    Both asinh(M / (e - 1)) and cbrt(6 M) are above the root, the Newton iterations then converge monotonically.
+    The near-parabolic series is used for the small anomalies when the eccentricity is close to 1.
+    """
+    ecc, mean_anom = numpy.broadcast_arrays(numpy.asarray(ecc, dtype=numpy.float64),
+                                            numpy.asarray(mean_anom, dtype=numpy.float64))
+    shape = mean_anom.shape
+    ecc = ecc.ravel()
+    mean_anom = mean_anom.ravel()
+    sign = numpy.where(mean_anom < 0.0, -1.0, 1.0)
+    reduced = numpy.abs(mean_anom)
+    curr = numpy.minimum(numpy.arcsinh(reduced / (ecc - 1.0)), numpy.cbrt(6.0 * reduced))
+    near = (ecc < 2.0 - NEAR_PARABOLIC_ECC) & (reduced < 1.0)
+    for i in range(MAX_ITERATIONS * 2):
+        err = ecc * numpy.sinh(curr) - curr - reduced
+        if numpy.any(near):
+            err[near] = -near_parabolic_array(curr[near], ecc[near]) - reduced[near]
+        delta_curr = err / (ecc * numpy.cosh(curr) - 1.0)
+        curr = curr - delta_curr
+        if numpy.all(numpy.abs(delta_curr) <= THRESH * numpy.maximum(curr, 1.0)): break
+    return (sign * curr).reshape(shape)
+
+def elliptic_pos_array(pericenter, ecc, ecc_anom):
+    a = pericenter / (1.0 - ecc)
+    positions = numpy.zeros(numpy.shape(ecc_anom) + (3,))
+    positions[..., 0] = a * (numpy.cos(ecc_anom) - ecc)
+    positions[..., 1] = a * numpy.sqrt(1 - ecc * ecc) * numpy.sin(ecc_anom)
+    return positions
+
+def parabolic_pos_array(pericenter, true_anom):
+    r = 2 * pericenter / (1 + numpy.cos(true_anom))
+    positions = numpy.zeros(numpy.shape(true_anom) + (3,))
+    positions[..., 0] = r * numpy.cos(true_anom)
+    positions[..., 1] = r * numpy.sin(true_anom)
+    return positions
+
+def hyperbolic_pos_array(pericenter, ecc, ecc_anom):
+    a = pericenter / (ecc - 1.0)
+    positions = numpy.zeros(numpy.shape(ecc_anom) + (3,))
+    positions[..., 0] = a * (ecc - numpy.cosh(ecc_anom))
+    positions[..., 1] = a * numpy.sqrt(ecc * ecc - 1) * numpy.sinh(ecc_anom)
+    return positions
+
+def kepler_pos_array(pericenter, ecc, mean_anom):
+    """
+    Array version of kepler_pos(), return the positions in the orbital plane as a (..., 3) array.
+    """
+    pericenter, ecc, mean_anom = numpy.broadcast_arrays(numpy.asarray(pericenter, dtype=numpy.float64),
+                                                        numpy.asarray(ecc, dtype=numpy.float64),
+                                                        numpy.asarray(mean_anom, dtype=numpy.float64))
+    positions = numpy.zeros(mean_anom.shape + (3,))
+    elliptic = ecc < 1.0
+    if numpy.any(elliptic):
+        ecc_anom = kepler_elliptic_array(ecc[elliptic], mean_anom[elliptic])
+        positions[elliptic] = elliptic_pos_array(pericenter[elliptic], ecc[elliptic], ecc_anom)
+    parabolic = ecc == 1.0
+    if numpy.any(parabolic):
+        true_anom = kepler_parabolic_array(mean_anom[parabolic])
+        positions[parabolic] = parabolic_pos_array(pericenter[parabolic], true_anom)
+    hyperbolic = ecc > 1.0
+    if numpy.any(hyperbolic):
+        ecc_anom = kepler_hyperbolic_array(ecc[hyperbolic], mean_anom[hyperbolic])
+        positions[hyperbolic] = hyperbolic_pos_array(pericenter[hyperbolic], ecc[hyperbolic], ecc_anom)
+    return positions
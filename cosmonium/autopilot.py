@@ -29,6 +29,7 @@ from .astro.frame import J2000EclipticReferenceFrame, J2000EquatorialReferenceFr
 from .astro.frame import SynchroneReferenceFrame
 from .astro import units
 from .utils import isclose
+from .prefetcher import ease_in_out
 from .objects.systems import SimpleSystem
 from . import settings
 
@@ -45,6 +46,8 @@ class AutoPilot(object):
         self.fake = None
         self.start_pos = LPoint3d()
         self.end_pos = LPoint3d()
+        self.move_interval = None
+        self.move_ease = False
 
     def set_controller(self, controller):
         self.controller = controller
@@ -56,6 +59,7 @@ class AutoPilot(object):
         if self.current_interval != None:
             self.current_interval.pause()
             self.current_interval = None
+        self.move_interval = None
         if self.timed_interval != None:
             self.timed_interval.pause()
             self.timed_interval = None
@@ -73,6 +77,7 @@ class AutoPilot(object):
         self.controller.set_frame_position(position)
         if step == 1.0:
             self.current_interval = None
+            self.move_interval = None
 
     def move_to(self, new_pos, absolute=True, duration=0, ease=True):
         if settings.debug_jump: duration = 0
@@ -97,8 +102,36 @@ class AutoPilot(object):
                 duration=duration,
                 blendType=blend_type,
                 name=None)
+            self.move_interval = self.current_interval
+            self.move_ease = ease
             self.current_interval.start()
 
+    def is_moving(self):
+        return self.move_interval is not None
+
+    def predict_local_move(self, delay):
+        """
+        Return the displacement, in local coordinates, of the observer in delay seconds due to the current move,
+        or None if there is no move running.
+        """
+        if self.move_interval is None: return None
+        duration = self.move_interval.getDuration()
+        if duration <= 0: return None
+        step = min(1.0, (self.move_interval.getT() + delay) / duration)
+        if self.move_ease:
+            step = ease_in_out(step)
+        frame_delta = self.end_pos * step + self.start_pos * (1.0 - step) - self.controller.get_frame_position()
+        # The frame of the anchor can be rotated, project the frame displacement on the local axes
+        anchor = self.controller.anchor
+        local_position = self.controller.get_local_position()
+        origin = anchor.calc_frame_position_of_local(local_position)
+        delta = LVector3d()
+        for i in range(3):
+            axis = LVector3d()
+            axis[i] = 1.0
+            delta[i] = (anchor.calc_frame_position_of_local(local_position + axis) - origin).dot(frame_delta)
+        return delta
+
     def do_update_func(self, step, func, extra):
         delta = globalClock.getRealTime() - self.last_interval_time
         self.last_interval_time = globalClock.getRealTime()
@@ -131,6 +164,7 @@ class AutoPilot(object):
         self.controller.set_frame_position(position)
         if step == 1.0:
             self.current_interval = None
+            self.move_interval = None
 
     def move_and_rotate_to(self, new_pos, new_rot, absolute=True, duration=0, start_rotation=0.0, end_rotation=0.5):
         if settings.debug_jump: duration = 0
@@ -172,6 +206,8 @@ class AutoPilot(object):
                                  blendType='easeInOut',
                                  name=None)
             parallel = Parallel(nodepath_lerp, func_lerp)
+            self.move_interval = func_lerp
+            self.move_ease = True
             self.current_interval = parallel
             self.current_interval.start()
 
@@ -16,7 +16,11 @@
 #You should have received a copy of the GNU General Public License
 #along with Cosmonium.  If not, see <https://www.gnu.org/licenses/>.
 #
-from .utils import int_to_color
+from .nameindex import NameIndex
+
+from array import array
+from contextlib import contextmanager
+from sys import intern, getsizeof
 
 class ObjectsDB(object):
     def __init__(self):
@@ -42,39 +46,287 @@ class ObjectsDB(object):
         return result
 
 class GlobalObjectsDB(object):
+    """
+    Registry of the objects, indexed by oid and by name.
+
+    The objects are stored in an array indexed by their oid, the oids of the removed objects are reused.
+    The upper-cased names are interned and map to the oid of their object. The objects added within a bulk()
+    block get their oid immediately but their names are only registered at once at the end of the block.
+    """
+    # Approximate size in bytes of a name entry in the dict and in the name index, and of an oid entry
+    name_entry_size = 72
+    oid_entry_size = 10
+
     def __init__(self):
         self.db = {}
         self.oids = []
+        self.free_oids = []
+        self.providers = []
+        self.index = NameIndex(self.get_rank)
+        self.catalogs = ['default']
+        self.catalog_ids = {'default': 0}
+        self.oid_catalogs = array('H')
+        self.catalog_objects = [0]
+        self.catalog_names = [0]
+        self.catalog_name_sizes = [0]
+        self.current_catalog = 0
+        self.bulk_level = 0
+        self.pending = []
+        self.reserved_oid = None
+        self.reserved_ranges = []
 
-    def add(self, body):
-        body.oid = len(self.oids)
-        body.oid_color = int_to_color(body.oid)
-        self.oids.append(body)
-        for name in body.names:
-            self.db[name.upper()] = body
-        for name in body.source_names:
-            self.db[name.upper()] = body
+    @staticmethod
+    def get_rank(body):
+        magnitude = body.get_abs_magnitude()
+        return magnitude if magnitude is not None else 1000.0
+
+    def get_catalog_id(self, catalog):
+        if catalog is None:
+            return self.current_catalog
+        catalog_id = self.catalog_ids.get(catalog)
+        if catalog_id is None:
+            catalog_id = len(self.catalogs)
+            self.catalogs.append(catalog)
+            self.catalog_ids[catalog] = catalog_id
+            self.catalog_objects.append(0)
+            self.catalog_names.append(0)
+            self.catalog_name_sizes.append(0)
+        return catalog_id
+
+    def allocate_oid(self, body, catalog_id):
+        if self.reserved_oid is not None:
+            oid = self.reserved_oid
+            self.reserved_oid = None
+            self.oids[oid] = body
+            catalog_id = self.oid_catalogs[oid]
+        elif len(self.free_oids) > 0:
+            oid = self.free_oids.pop()
+            self.oids[oid] = body
+            self.oid_catalogs[oid] = catalog_id
+        else:
+            oid = len(self.oids)
+            self.oids.append(body)
+            self.oid_catalogs.append(catalog_id)
+        self.catalog_objects[catalog_id] += 1
+        body.oid = oid
+        # The picking color is derived from the oid
+        body._oid_color = None
+        return oid
+
+    @contextmanager
+    def reserved(self, oid):
+        """
+        Give the object created in the block the given oid, reserved by its provider.
+        """
+        self.reserved_oid = oid
+        try:
+            yield
+        finally:
+            self.reserved_oid = None
+
+    @contextmanager
+    def bulk(self, catalog=None):
+        """
+        Defer the registration of the names of the objects added in the block, the catalog is used for the memory report.
+        """
+        saved_catalog = self.current_catalog
+        self.current_catalog = self.get_catalog_id(catalog)
+        self.bulk_level += 1
+        try:
+            yield
+        finally:
+            self.bulk_level -= 1
+            self.current_catalog = saved_catalog
+            if self.bulk_level == 0:
+                self.flush()
+
+    def flush(self):
+        if len(self.pending) == 0: return
+        pending = self.pending
+        self.pending = []
+        self.register_names(pending)
+
+    def add(self, body, catalog=None):
+        self.allocate_oid(body, self.get_catalog_id(catalog))
+        if self.bulk_level > 0:
+            self.pending.append(body)
+        else:
+            self.register_names([body])
+
+    def get_keys(self, body):
+        keys = [intern(name.upper()) for name in body.names]
+        keys += [intern(name.upper()) for name in body.source_names]
+        return keys
+
+    def register_names(self, bodies):
+        keys = []
+        values = []
+        catalog_names = self.catalog_names
+        catalog_name_sizes = self.catalog_name_sizes
+        for body in bodies:
+            body_keys = self.get_keys(body)
+            catalog_id = self.oid_catalogs[body.oid]
+            catalog_names[catalog_id] += len(body_keys)
+            catalog_name_sizes[catalog_id] += sum(getsizeof(key) for key in body_keys)
+            keys += body_keys
+            values += [body] * len(body_keys)
+        for key in keys:
+            previous = self.db.get(key)
+            if previous is not None and self.oids[previous] is not None:
+                self.index.remove(key, self.oids[previous])
+        self.db.update(zip(keys, [body.oid for body in values]))
+        if len(keys) >= self.index.merge_size:
+            self.index.add_many(keys, values)
+        else:
+            for (key, body) in zip(keys, values):
+                self.index.add(key, body)
+
+    def reserve_oids(self, count, provider):
+        """
+        Reserve a range of oids for the lazily created objects of the provider.
+        The provider will be queried when an object is not found by name or oid.
+        """
+        start = len(self.oids)
+        self.reserved_ranges.append((start, start + count, provider))
+        self.oids.extend([provider] * count)
+        self.oid_catalogs.extend([self.get_catalog_id(getattr(provider, 'name', None))] * count)
+        self.providers.append(provider)
+        return start
 
     def get(self, name):
-        return self.db.get(name.upper(), None)
+        self.flush()
+        name = name.upper()
+        oid = self.db.get(name, None)
+        body = self.oids[oid] if oid is not None else None
+        if body is None:
+            for provider in self.providers:
+                body = provider.get(name)
+                if body is not None: break
+        return body
+
+    def get_existing(self, name):
+        """
+        Return the object registered under name, the objects of the providers are not created.
+        """
+        self.flush()
+        oid = self.db.get(name.upper(), None)
+        return self.oids[oid] if oid is not None else None
+
+    def remove_from_providers(self, name):
+        """
+        Remove the object known under name from the providers without creating it.
+        """
+        name = name.upper()
+        for provider in self.providers:
+            if provider.remove(name): break
 
     def get_oid(self, oid):
         if oid < len(self.oids):
-            return self.oids[oid]
+            body = self.oids[oid]
+            if body in self.providers:
+                body = body.get_oid(oid)
+            return body
         else:
             return None
 
     def remove(self, body):
-        for name in body.names:
-            self.db.pop(name.upper(), None)
-        self.oids[body.oid] = None
+        self.flush()
+        catalog_id = self.oid_catalogs[body.oid]
+        for key in self.get_keys(body):
+            if self.db.get(key) == body.oid:
+                del self.db[key]
+                self.index.remove(key, body)
+                self.catalog_names[catalog_id] -= 1
+                self.catalog_name_sizes[catalog_id] -= getsizeof(key)
+        self.catalog_objects[catalog_id] -= 1
+        provider = self.get_provider(body.oid)
+        if provider is not None:
+            # The oid stays reserved for the provider
+            self.oids[body.oid] = provider
+        else:
+            self.oids[body.oid] = None
+            self.free_oids.append(body.oid)
 
-    def startswith(self, text):
+    def get_provider(self, oid):
+        for (start, end, provider) in self.reserved_ranges:
+            if start <= oid < end:
+                return provider
+        return None
+
+    def get_memory_usage(self):
+        """
+        Return the number of objects and names and the approximate memory used by the registry for each catalog.
+        """
+        usage = []
+        for (catalog_id, catalog) in enumerate(self.catalogs):
+            objects = self.catalog_objects[catalog_id]
+            names = self.catalog_names[catalog_id]
+            if objects == 0 and names == 0: continue
+            size = objects * self.oid_entry_size + names * self.name_entry_size + self.catalog_name_sizes[catalog_id]
+            usage.append((catalog, objects, names, size))
+        for provider in self.providers:
+            usage.append((provider.name, *provider.get_memory_usage()))
+        return usage
+
+    def print_memory_usage(self):
+        usage = self.get_memory_usage()
+        print("Objects registry: %d objects, %d names, %.1f MB" % (sum(entry[1] for entry in usage),
+                                                                 sum(entry[2] for entry in usage),
+                                                                 sum(entry[3] for entry in usage) / 1024 / 1024))
+        for (catalog, objects, names, size) in sorted(usage, key=lambda x: x[3], reverse=True):
+            print("\t%.1f MB %d objects %d names %s" % (size / 1024 / 1024, objects, names, catalog))
+
+    def merge_results(self, results, count):
+        """
+        Merge the (rank, name, body) results of the database and the providers, the objects already
+        created by a provider are also found in the database and are only kept once.
+        """
+        results.sort(key=lambda x: x[0])
+        seen = set()
+        merged = []
+        for (rank, name, body) in results:
+            key = name.upper()
+            if key in seen: continue
+            seen.add(key)
+            merged.append((name, body))
+            if count is not None and len(merged) >= count: break
+        return merged
+
+    def startswith(self, text, count=None):
+        """
+        Return the (name, body) of the objects having a name starting with text, the brightest first.
+        The body is None for the objects of the providers that are not yet created.
+        """
+        self.flush()
         text = text.upper()
-        result = []
-        for (key, value) in self.db.items():
-            if key.startswith(text):
-                result.append((value.get_exact_name(key), value))
+        result = [(rank, body.get_exact_name(key), body) for (rank, key, body) in self.index.startswith(text, count)]
+        for provider in self.providers:
+            result += provider.startswith(text, count)
+        return self.merge_results(result, count)
+
+    def contains(self, text, count=None):
+        """
+        Return the (name, body) of the objects having a name containing text, the brightest first.
+        """
+        self.flush()
+        text = text.upper()
+        result = [(rank, body.get_exact_name(key), body) for (rank, key, body) in self.index.contains(text, count)]
+        for provider in self.providers:
+            result += provider.contains(text, count)
+        return self.merge_results(result, count)
+
+    def search(self, text, count=None):
+        """
+        Return the objects whose name starts with text, completed by the objects whose name contains text
+        when there are fewer than count of them.
+        """
+        result = self.startswith(text, count)
+        if count is not None and len(result) < count and len(text) >= 2:
+            known = set(name for (name, body) in result)
+            for (name, body) in self.contains(text, count):
+                if name in known: continue
+                result.append((name, body))
+                if len(result) >= count: break
         return result
 
 objectsDB = GlobalObjectsDB()
@@ -0,0 +1,146 @@
+#
+#This file is part of Cosmonium.
+#
+#Copyright (C) 2018-2022 Laurent Deru.
+#
+#Cosmonium is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#Cosmonium is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with Cosmonium.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+
+from panda3d.core import LPoint3d, ClockObject
+
+from .catalogs import objectsDB
+from .pstats import levelpstat
+from . import settings
+
+from heapq import heappush, heappop
+from math import inf
+
+class CatalogStreamer(object):
+    """
+    Instantiate the items of the parsed catalogs nearest first.
+
+    The items are queued with the distance between their position and the origin, the items without known
+    position are queued last. The position of the queued items is kept so that the items referring to them
+    are queued at the same distance. Items at the same distance are instantiated in the order they were queued,
+    so a catalog can still refer to objects defined in a previous catalog.
+    The items near the origin are instantiated during the startup, the remaining ones are instantiated by a task
+    within a per-frame time budget once the scene is running.
+    """
+    def __init__(self, universe):
+        self.universe = universe
+        self.origin = LPoint3d()
+        self.clock = ClockObject.get_global_clock()
+        self.queue = []
+        self.seq = 0
+        self.positions = {}
+        self.touched = set()
+        self.task = None
+        self.start_time = 0.0
+        self.instanciated = 0
+        self.time_pstat = levelpstat('time', 'Catalog')
+        self.queue_pstat = levelpstat('queue', 'Catalog')
+
+    def set_origin(self, position):
+        self.origin = LPoint3d(position)
+
+    def find_position(self, name):
+        name = name.upper()
+        position = self.positions.get(name)
+        if position is None:
+            body = objectsDB.get(name)
+            if body is not None:
+                position = body.anchor.orbit.get_absolute_reference_point_at(0.0)
+        return position
+
+    def add_items(self, items, item_position, instanciate_item, item_names=None, catalog=None):
+        """
+        Queue the parsed items of a catalog, item_position(streamer, item) returns the position of the item
+        or None if it is not known, item_names(item) returns the names under which the item can be referred to
+        and instanciate_item(universe, *item) creates the object. The objects are registered under the given catalog.
+        """
+        for item in items:
+            position = item_position(self, item)
+            if position is not None:
+                distance = (position - self.origin).length()
+                if item_names is not None:
+                    for name in item_names(item):
+                        self.positions[name.upper()] = position
+            else:
+                distance = inf
+            heappush(self.queue, (distance, self.seq, instanciate_item, item, catalog))
+            self.seq += 1
+
+    def instanciate_next(self):
+        (distance, seq, instanciate_item, item, catalog) = heappop(self.queue)
+        with objectsDB.bulk(catalog):
+            body = instanciate_item(self.universe, *item)
+        if body is not None:
+            self.touched.add(body)
+        self.instanciated += 1
+
+    def load_until(self, distance):
+        """
+        Instantiate immediately all the queued items closer than the given distance.
+        """
+        with objectsDB.bulk():
+            while len(self.queue) > 0 and self.queue[0][0] <= distance:
+                self.instanciate_next()
+        self.touched.clear()
+        if len(self.queue) == 0:
+            self.positions = {}
+
+    def rebuild_touched(self):
+        """
+        Rebuild the top-level systems containing the new objects, the universe is only rebuilt when
+        objects were added directly to it.
+        """
+        systems = set()
+        top_level = False
+        for body in self.touched:
+            if body.parent is self.universe:
+                top_level = True
+            while body.parent is not None and body.parent is not self.universe:
+                body = body.parent
+            systems.add(body)
+        for system in systems:
+            system.anchor.rebuild()
+        if top_level:
+            self.universe.rebuild()
+        self.touched.clear()
+
+    def start(self):
+        if len(self.queue) == 0: return
+        print("Streaming", len(self.queue), "catalog items")
+        self.start_time = self.clock.get_real_time()
+        self.task = taskMgr.add(self.stream_task, "catalog-streamer-task", sort=5)
+
+    def stream_task(self, task):
+        start = self.clock.get_real_time()
+        end = start + settings.catalog_stream_budget / 1000.0
+        with objectsDB.bulk():
+            self.instanciate_next()
+            while len(self.queue) > 0 and self.clock.get_real_time() < end:
+                self.instanciate_next()
+        self.rebuild_touched()
+        self.time_pstat.set_level((self.clock.get_real_time() - start) * 1000.0)
+        self.queue_pstat.set_level(len(self.queue))
+        if len(self.queue) > 0:
+            return task.cont
+        print("Catalogs streamed in", self.clock.get_real_time() - self.start_time)
+        if settings.debug_load_stats:
+            objectsDB.print_memory_usage()
+        self.positions = {}
+        self.task = None
+        return task.done
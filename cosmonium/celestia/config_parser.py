@@ -21,7 +21,15 @@
 from ply import lex
 from ply import yacc
 
+from ..cache import create_path_for
+from .. import settings
+
+import hashlib
+import pickle
 import sys
+import os
+import io
+import re
 
 tokens = ('STRING', 'NAME', 'INT', 'FLOAT', 'BOOL')
 
@@ -269,13 +277,198 @@ def p_error(p):
 
 parser = yacc.yacc(tabmodule='ssc_parsetab', write_tables=False, debug=False)
 
-def parse(data, debug=0):
+def parse_ply(data, debug=0):
     parser.error = 0
+    lexer.lineno = 1
     p = parser.parse(data, lexer=lexer, debug=debug)
     if parser.error:
         return None
     return p
 
+# Hand-written parser, it produces the same result as the PLY parser but is faster.
+# The token patterns are the same as the PLY lexer and are tried in the same order, the ignored
+# characters, new lines and comments preceding a token are consumed with it.
+
+token_re = re.compile(r"""(?:[ \t]+|\#.*|(?:\r?\n)+)*(?:
+     (true|false)
+    |([a-zA-Z_][a-zA-Z0-9_]*)
+    |\"(.*?)\"
+    |([\+-]?(?:(?:\d*\.\d+)(?:[eE][\+-]?\d+)?|[\+-]?(?:[1-9]\d*[eE][\+-]?\d+)))
+    |([\+-]?\d+)
+    |([()\[\]{}]))""", re.VERBOSE)
+trailing_re = re.compile(r"(?:[ \t]+|\#.*|(?:\r?\n)+)*\Z")
+token_kinds = (None, 'BOOL', 'NAME', 'STRING', 'FLOAT', 'INT', 'LITERAL')
+
+class ConfigSyntaxError(Exception):
+    pass
+
+def tokenize(data):
+    tokens = []
+    append = tokens.append
+    kinds = token_kinds
+    position = 0
+    for m in token_re.finditer(data):
+        if m.start() != position:
+            break
+        position = m.end()
+        index = m.lastindex
+        value = m.group(index)
+        if index == 4:
+            value = float(value)
+        elif index == 5:
+            value = int(value)
+        elif index == 1:
+            value = value == 'true'
+        append((value if index == 6 else kinds[index], value))
+    if trailing_re.match(data, position) is None:
+        raise ConfigSyntaxError("Illegal character '%s'" % data[position:position+1])
+    append((None, None))
+    return tokens
+
+class FastConfigParser(object):
+    def __init__(self, data):
+        self.tokens = tokenize(data)
+        self.position = 0
+
+    def error(self):
+        kind, value = self.tokens[self.position]
+        return ConfigSyntaxError("Syntax error at token %s : %s" % (kind, value))
+
+    def expect(self, kind):
+        if self.tokens[self.position][0] != kind:
+            raise self.error()
+        self.position += 1
+
+    def parse(self):
+        definitions = []
+        while self.tokens[self.position][0] is not None:
+            definitions.append(self.parse_definition())
+        if len(definitions) == 0:
+            raise self.error()
+        return definitions
+
+    def parse_definition(self):
+        tokens = self.tokens
+        names = []
+        while tokens[self.position][0] == 'NAME' and len(names) < 2:
+            names.append(tokens[self.position][1])
+            self.position += 1
+        values = []
+        while tokens[self.position][0] in ('INT', 'STRING') and len(values) < 2:
+            values.append(tokens[self.position])
+            self.position += 1
+        item_parent = None
+        item_alias = None
+        if len(names) == 2:
+            disposition, item_type = names
+        elif len(names) == 1:
+            disposition = 'Add'
+            item_type = names[0]
+        else:
+            disposition = 'Add'
+            item_type = 'Body'
+        if len(values) == 0:
+            if len(names) != 1:
+                raise self.error()
+            item_name = None
+        else:
+            item_name = values[0][1]
+            if len(values) == 2:
+                if values[1][0] != 'STRING':
+                    self.position -= 1
+                    raise self.error()
+                if values[0][0] == 'INT':
+                    item_alias = values[1][1]
+                else:
+                    item_parent = values[1][1]
+        self.expect('{')
+        item_data = self.parse_entry_list()
+        self.expect('}')
+        return [disposition, item_type, item_name, item_parent, item_alias, item_data]
+
+    def parse_entry_list(self):
+        tokens = self.tokens
+        position = self.position
+        entries = {}
+        while tokens[position][0] == 'NAME':
+            name = tokens[position][1]
+            kind, value = tokens[position + 1]
+            if kind in ('FLOAT', 'INT', 'STRING', 'BOOL'):
+                position += 2
+            elif kind == '[':
+                position += 2
+                value = []
+                while tokens[position][0] in ('FLOAT', 'INT'):
+                    value.append(tokens[position][1])
+                    position += 1
+                if tokens[position][0] != ']':
+                    self.position = position
+                    raise self.error()
+                position += 1
+            elif kind == '{':
+                self.position = position + 2
+                value = self.parse_entry_list()
+                self.expect('}')
+                position = self.position
+            else:
+                self.position = position + 1
+                raise self.error()
+            entries[name] = value
+        self.position = position
+        return entries
+
+def parse(data, debug=0):
+    try:
+        return FastConfigParser(data).parse()
+    except ConfigSyntaxError:
+        # Use the PLY parser to report the errors
+        return parse_ply(data, debug)
+
+cache_version = 1
+
+def load_from_cache(filepath, key):
+    config_path = create_path_for('celestia')
+    md5 = hashlib.md5(filepath.encode()).hexdigest()
+    cache_file = os.path.join(config_path, md5 + ".dat")
+    if not os.path.exists(cache_file): return None
+    try:
+        with open(cache_file, "rb") as f:
+            if pickle.load(f) != key: return None
+            print("Loading %s (cached)" % filepath)
+            return pickle.load(f)
+    except (IOError, ValueError, EOFError, pickle.UnpicklingError) as e:
+        print("Could not read cache for", filepath, cache_file, ':', e)
+    return None
+
+def store_to_cache(filepath, key, items):
+    config_path = create_path_for('celestia')
+    md5 = hashlib.md5(filepath.encode()).hexdigest()
+    cache_file = os.path.join(config_path, md5 + ".dat")
+    try:
+        with open(cache_file, "wb") as f:
+            pickle.dump(key, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(items, f, pickle.HIGHEST_PROTOCOL)
+    except IOError as e:
+        print("Could not write cache for", filepath, cache_file, ':', e)
+
+def load_file(filepath):
+    """
+    Return the parsed definitions of a Celestia catalog file, the result is cached and is invalidated
+    when the size or the modification time of the file changes.
+    """
+    items = None
+    if settings.cache_celestia:
+        stat = os.stat(filepath)
+        key = (cache_version, filepath, stat.st_size, stat.st_mtime_ns)
+        if not settings.rebuild_cache:
+            items = load_from_cache(filepath, key)
+    if items is None:
+        data = io.open(filepath, encoding='latin-1').read()
+        items = parse(data)
+        if items is not None and settings.cache_celestia:
+            store_to_cache(filepath, key, items)
+    return items
+
 if __name__ == '__main__':
     if len(sys.argv) == 2:
         data = open(sys.argv[1]).read()
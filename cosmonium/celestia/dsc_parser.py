@@ -27,11 +27,11 @@ from ..astro.orbits import FixedPosition
 from ..astro.rotations import FixedRotation
 from ..astro.frame import J2000EquatorialReferenceFrame
 from ..astro import units
+from ..catalogs import objectsDB
 from ..dircontext import defaultDirContext
 from .. import utils
 
 import sys
-import io
 
 def names_list(name):
     return name.split(':')
@@ -107,10 +107,10 @@ def parse_file(filename, universe, context=defaultDirContext):
     if filepath is not None:
         print("Loading", filepath)
         base.splash.set_text("Loading %s" % filepath)
-        data = io.open(filepath, encoding='latin-1').read()
-        items = config_parser.parse(data)
+        items = config_parser.load_file(filepath)
         if items is not None:
-            instanciate(items, universe)
+            with objectsDB.bulk(filepath):
+                instanciate(items, universe)
     else:
         print("File not found", filename)
 
@@ -43,11 +43,11 @@ from ..astro.rotations import FixedRotation, UniformRotation, SynchronousRotatio
 from ..astro.astro import calc_orientation_from_incl_an
 from ..astro import units
 from ..astro.frame import J2000EclipticReferenceFrame, EquatorialReferenceFrame
+from ..catalogs import objectsDB
 from ..dircontext import defaultDirContext
 
 from time import time
 from math import pi
-import io
 
 def get_color(value):
     if len(value) == 4:
@@ -442,7 +442,14 @@ def instanciate_item(universe, disposition, item_type, item_name, item_parent, i
     elif item_type == 'ReferencePoint':
         body = instanciate_reference_point(universe, names, is_planet, item_data, parent)
     parent.add_child_fast(body)
-    
+    return body
+
+def item_position(streamer, item):
+    item_parent = item[3]
+    if item_parent is None:
+        return None
+    return streamer.find_position(body_path(item_parent)[0])
+
 def instanciate(items_list, universe):
     for item in items_list:
         instanciate_item(universe, *item)
@@ -453,15 +460,33 @@ def parse_file(filename, universe, context=defaultDirContext):
         start = time()
         print("Loading", filepath)
         base.splash.set_text("Loading %s" % filepath)
-        data = io.open(filepath, encoding='latin-1').read()
-        items = config_parser.parse(data)
+        items = config_parser.load_file(filepath)
         if items is not None:
-            instanciate(items, universe)
+            with objectsDB.bulk(filepath):
+                instanciate(items, universe)
         end = time()
         print("Load time:", end - start)
     else:
         print("File not found", filename)
 
+def stream_file(filename, streamer, context=defaultDirContext):
+    filepath = context.find_data(filename)
+    if filepath is not None:
+        print("Loading", filepath)
+        base.splash.set_text("Loading %s" % filepath)
+        items = config_parser.load_file(filepath)
+        if items is not None:
+            streamer.add_items(items, item_position, instanciate_item, catalog=filepath)
+    else:
+        print("File not found", filename)
+
+def stream(ssc, streamer):
+    if isinstance(ssc, list):
+        for ssc in ssc:
+            stream_file(ssc, streamer)
+    else:
+        stream_file(ssc, streamer)
+
 def load(config_parser, universe):
     if isinstance(config_parser, list):
         for config_parser in config_parser:
@@ -18,14 +18,13 @@
 #
 
 
-from panda3d.core import LVector3d
-
 from ..objects.universe import Universe
 from ..objects.star import Star
+from ..objects.startable import StarTable
 from ..astro.spectraltype import spectralTypeStringDecoder, spectralTypeIntDecoder
 from ..astro.orbits import FixedPosition
 from ..astro.rotations import UnknownRotation
-from ..astro.frame import J2000BarycentricEclipticReferenceFrame, J2000BarycentricEquatorialReferenceFrame
+from ..astro.frame import J2000BarycentricEquatorialReferenceFrame
 from ..astro.astro import app_to_abs_mag
 from ..astro import bayer
 from ..astro import units
@@ -34,6 +33,7 @@ from ..dircontext import defaultDirContext
 from .bodies import celestiaStarSurfaceFactory
 
 from time import time
+import numpy
 import struct
 import sys
 import io
@@ -81,38 +81,50 @@ def load_text(filename, names, universe, context=defaultDirContext):
         print("File not found", filename)
         return {}
 
-def do_load_bin(filepath, names, universe):
-    start = time()
-    print("Loading", filepath)
-    base.splash.set_text("Loading %s" % filepath)
+# Layout of a record of a Celestia binary star catalog, matches the "<ifffhh" struct format
+star_record_dtype = numpy.dtype([('catalog', '<i4'),
+                                 ('position', '<f4', (3,)),
+                                 ('abs_magnitude', '<i2'),
+                                 ('spectral_type', '<u2')])
+
+def read_bin(filepath):
     data = open(filepath, 'rb')
     field=data.read(8+2+4)
     header, version, count = struct.unpack("<8shi", field)
     if not header == b"CELSTARS":
         print("Invalid header", header)
-        return
+        return None
     if not version == 0x0100:
         print("Invalid version", version)
-        return
+        return None
     print("Found", count, "stars")
-    fmt="<ifffhh"
-    size=struct.calcsize(fmt)
-    for i in range(count):
-        fields = data.read(size)
-        catNo, x, y, z, abs_magnitude, spectral_type = struct.unpack(fmt, fields)
-        if catNo in names:
-            name = names[catNo]
-        else:
-            name = "HIP %d" % catNo
-        position = LVector3d(x * units.Ly, -z * units.Ly, y * units.Ly)
-        orbit = FixedPosition(position=position, frame=J2000BarycentricEclipticReferenceFrame())
-        star = Star(name, source_names=[],
-                    surface_factory=celestiaStarSurfaceFactory,
-                    spectral_type=spectralTypeIntDecoder.decode(spectral_type),
-                    abs_magnitude=abs_magnitude / 256.0,
-                    orbit=orbit,
-                    rotation=UnknownRotation())
-        universe.add_child_fast(star)
+    records = numpy.fromfile(data, dtype=star_record_dtype, count=count)
+    data.close()
+    if len(records) != count:
+        print("Truncated catalog, found only", len(records), "stars")
+    catalog = records['catalog']
+    # Celestia catalogs are in equatorial Y-up Ly, convert to ecliptic Z-up Km
+    file_positions = records['position'].astype(numpy.float64)
+    positions = numpy.empty_like(file_positions)
+    positions[:, 0] = file_positions[:, 0] * units.Ly
+    positions[:, 1] = -file_positions[:, 2] * units.Ly
+    positions[:, 2] = file_positions[:, 1] * units.Ly
+    abs_magnitudes = records['abs_magnitude'] / 256.0
+    # Only a few hundred distinct spectral types exist, decode each of them only once
+    values, spectral_indices = numpy.unique(records['spectral_type'], return_inverse=True)
+    spectral_types = [spectralTypeIntDecoder.decode(int(value)) for value in values]
+    return catalog, positions, abs_magnitudes, spectral_indices.reshape(-1), spectral_types
+
+def do_load_bin(filepath, names, universe):
+    start = time()
+    print("Loading", filepath)
+    base.splash.set_text("Loading %s" % filepath)
+    result = read_bin(filepath)
+    if result is None:
+        return
+    catalog, positions, abs_magnitudes, spectral_indices, spectral_types = result
+    star_table = StarTable(filepath, universe, catalog, positions, abs_magnitudes, spectral_indices, spectral_types, names, celestiaStarSurfaceFactory)
+    universe.add_star_table(star_table)
     end = time()
     print("Load time:", end - start)
 
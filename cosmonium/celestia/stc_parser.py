@@ -24,7 +24,7 @@ from ..catalogs import objectsDB
 from ..astro.orbits import FixedPosition
 from ..astro.rotations import UnknownRotation
 from ..astro.frame import J2000BarycentricEquatorialReferenceFrame
-from ..astro.astro import app_to_abs_mag
+from ..astro.astro import app_to_abs_mag, equatorial_to_position
 from ..astro import bayer
 from ..astro import units
 from ..objects.star import Star
@@ -38,7 +38,6 @@ from . import config_parser
 
 from time import time
 import sys
-import io
 
 def names_list(name):
     return name.split(':')
@@ -167,12 +166,13 @@ def instanciate_barycenter(universe, item_name, item_alias, item_data):
             orbit = instanciate_custom_orbit(value, parent)
         else:
             print("Key of Barycenter", key, "not supported")
-    existing_star = objectsDB.get(names[-1])
+    existing_star = objectsDB.get_existing(names[-1])
     if existing_star:
         #print("Replacing star", names, "with barycenter")
         objectsDB.remove(existing_star)
         if existing_star.parent is not None:
             existing_star.parent.remove_child_fast(existing_star)
+    objectsDB.remove_from_providers(names[-1])
     if orbit is None:
         orbit = FixedPosition(right_asc=ra, declination=decl, distance=distance, distance_unit=units.Ly)
     orbit.set_frame(J2000BarycentricEquatorialReferenceFrame())
@@ -185,13 +185,28 @@ def instanciate_item(universe, disposition, item_type, item_name, item_parent, i
         print("Disposition", disposition, "not supported")
         return
     if item_type == 'Body':
-        instanciate_star(universe, item_name, item_alias, item_data)
+        return instanciate_star(universe, item_name, item_alias, item_data)
     elif item_type == 'Barycenter':
-        instanciate_barycenter(universe, item_name, item_alias, item_data)
+        return instanciate_barycenter(universe, item_name, item_alias, item_data)
     else:
         print("Type", item_type, "not supported")
         return
 
+def item_position(streamer, item):
+    item_data = item[5]
+    ra = item_data.get('RA')
+    decl = item_data.get('Dec')
+    distance = item_data.get('Distance')
+    if ra is not None and decl is not None and distance is not None:
+        return equatorial_to_position(ra * units.Deg, decl * units.Deg, distance * units.Ly)
+    parent_name = item_data.get('OrbitBarycenter')
+    if parent_name is not None:
+        return streamer.find_position(bayer.canonize_name(parent_name))
+    return None
+
+def item_names(item):
+    return parse_names(item[2], item[4])
+
 def instanciate(items_list, universe):
     for item in items_list:
         instanciate_item(universe, *item)
@@ -202,15 +217,33 @@ def parse_file(filename, universe, context=defaultDirContext):
         start = time()
         print("Loading", filepath)
         base.splash.set_text("Loading %s" % filepath)
-        data = io.open(filepath, encoding='latin-1').read()
-        items = config_parser.parse(data)
+        items = config_parser.load_file(filepath)
         if items is not None:
-            instanciate(items, universe)
+            with objectsDB.bulk(filepath):
+                instanciate(items, universe)
         end = time()
         print("Load time:", end - start)
     else:
         print("File not found", filename)
 
+def stream_file(filename, streamer, context=defaultDirContext):
+    filepath = context.find_data(filename)
+    if filepath is not None:
+        print("Loading", filepath)
+        base.splash.set_text("Loading %s" % filepath)
+        items = config_parser.load_file(filepath)
+        if items is not None:
+            streamer.add_items(items, item_position, instanciate_item, item_names, catalog=filepath)
+    else:
+        print("File not found", filename)
+
+def stream(stc, streamer):
+    if isinstance(stc, list):
+        for stc in stc:
+            stream_file(stc, streamer)
+    else:
+        stream_file(stc, streamer)
+
 def load(stc, universe):
     if isinstance(stc, list):
         for stc in stc:
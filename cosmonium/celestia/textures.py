@@ -20,6 +20,7 @@
 
 from ..textures import VirtualTextureSource, TextureSourceFactory, AutoTextureSource
 from ..dircontext import defaultDirContext
+from ..tilearchive import open_tile_index, scan_celestia_tiles
 
 import os
 
@@ -32,13 +33,17 @@ class CelestiaVirtualTextureSource(VirtualTextureSource):
     def set_offset(self, offset):
         self.offset = offset
 
-    def get_patch_name(self, patch, scale=1):
+    def get_patch_coord(self, patch):
         x = patch.x
         y = (1 << patch.lod) - patch.y - 1
         if self.offset != 0:
             s_div = 2 << patch.lod
             x += s_div // 2
             x %= s_div
+        return (x, y)
+
+    def get_patch_name(self, patch, scale=1):
+        (x, y) = self.get_patch_coord(patch)
         return "%s%d_%d.%s" % (self.prefix, x * scale, y * scale, self.ext)
 
     def child_texture_name(self, patch):
@@ -47,6 +52,17 @@ class CelestiaVirtualTextureSource(VirtualTextureSource):
     def texture_name(self, patch):
         return os.path.join(self.root, 'level%d' % patch.lod, self.get_patch_name(patch))
 
+    def create_tile_index(self, path):
+        return open_tile_index(path, scan_celestia_tiles, self.ext, self.prefix)
+
+    def child_texture_key(self, patch):
+        (x, y) = self.get_patch_coord(patch)
+        return (-1, patch.lod + 1, x * 2, y * 2, '')
+
+    def texture_key(self, patch):
+        (x, y) = self.get_patch_coord(patch)
+        return (-1, patch.lod, x, y, '')
+
     def get_recommended_shape(self):
         return 'patched-sphere'
 
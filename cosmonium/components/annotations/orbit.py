@@ -19,12 +19,14 @@
 
 
 from panda3d.core import LColor, OmniBoundingVolume
-from panda3d.core import GeomVertexFormat, GeomVertexData, GeomVertexWriter, GeomVertexRewriter, InternalName
-from panda3d.core import Geom, GeomNode, GeomLines
+from panda3d.core import GeomVertexFormat, GeomVertexData
+from panda3d.core import Geom, GeomNode, GeomLinestrips
 from panda3d.core import NodePath
 
 from ...foundation import VisibleObject
-from ...astro.orbits import FixedPosition
+from ...astro.orbits import FixedPosition, EllipticalOrbit, frame_to_local_positions, get_local_positions_at
+from ...astro.kepler import kepler_parabolic_array, kepler_hyperbolic_array
+from ...astro.kepler import elliptic_pos_array, parabolic_pos_array, hyperbolic_pos_array
 from ...bodyclass import bodyClasses
 from ...shaders.rendering import RenderingShader
 from ...shaders.lighting.flat import FlatLightingModel
@@ -33,6 +35,33 @@ from ...appearances import ModelAppearance
 from ...utils import srgb_to_linear
 from ... import settings
 
+from math import pi, cos, floor
+import numpy
+
+def refine_path(func, params, max_angle, max_passes):
+    """
+    Sample the path func(params) and subdivide it where the angle between two consecutive segments
+    is larger than max_angle. The parameters must be sorted.
+    """
+    points = func(params)
+    min_cos = cos(max_angle)
+    for i in range(max_passes):
+        segments = points[1:] - points[:-1]
+        lengths = numpy.sqrt(numpy.einsum('ij,ij->i', segments, segments))
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            cosines = numpy.einsum('ij,ij->i', segments[:-1], segments[1:]) / (lengths[:-1] * lengths[1:])
+        sharp = cosines < min_cos
+        split = numpy.zeros(len(segments), dtype=bool)
+        split[:-1] |= sharp
+        split[1:] |= sharp
+        if not numpy.any(split): break
+        new_params = (params[:-1][split] + params[1:][split]) / 2.0
+        params = numpy.concatenate((params, new_params))
+        points = numpy.concatenate((points, func(new_params)))
+        order = numpy.argsort(params, kind='stable')
+        params = params[order]
+        points = points[order]
+    return points
 
 class Orbit(VisibleObject):
     ignore_light = True
@@ -41,6 +70,8 @@ class Orbit(VisibleObject):
     appearance = None
     shader = None
     default_camera_mask = VisibleObject.AnnotationCameraFlag
+    max_segment_angle = 1.5 * pi / 180
+    max_refine_passes = 6
 
     def __init__(self, body):
         VisibleObject.__init__(self, body.get_ascii_name() + '-orbit')
@@ -49,6 +80,8 @@ class Orbit(VisibleObject):
         self.orbit = self.find_orbit(self.body)
         self.color = None
         self.fade = 0.0
+        self.path = None
+        self.path_key = None
         if not self.orbit:
             print("No orbit for", self.get_name())
             self.visible = False
@@ -92,30 +125,80 @@ class Orbit(VisibleObject):
         if self.instance:
             self.instance.setColor(srgb_to_linear(self.color * self.fade))
 
-    def create_instance(self):
-        self.vertexData = GeomVertexData('vertexData', GeomVertexFormat.getV3(), Geom.UHStatic)
-        self.vertexWriter = GeomVertexWriter(self.vertexData, 'vertex')
-        delta = self.body.parent.anchor.get_local_position()
-        if self.orbit.is_periodic():
-            epoch = self.context.time.time_full - self.orbit.period / 2
-            step = self.orbit.period / (self.nbOfPoints - 1)
+    def create_keplerian_path(self):
+        """
+        Sample the orbit in the orbital plane using the eccentric anomaly, which spreads the points evenly
+        along the path, the segments are then refined around the periapsis of the very eccentric orbits.
+        """
+        pericenter = self.orbit.pericenter_distance
+        ecc = self.orbit.eccentricity
+        if ecc < 1.0:
+            params = numpy.linspace(-pi, pi, self.nbOfPoints)
+            func = lambda ecc_anom: elliptic_pos_array(pericenter, ecc, ecc_anom)
+        elif ecc == 1.0:
+            #TODO: Properly calculate orbit start and end time
+            max_anom = kepler_parabolic_array(10 * pi)
+            params = numpy.linspace(-max_anom, max_anom, self.nbOfPoints)
+            func = lambda true_anom: parabolic_pos_array(pericenter, true_anom)
         else:
             #TODO: Properly calculate orbit start and end time
-            epoch = self.orbit.get_time_of_perihelion() - self.orbit.period * 5.0
-            step = self.orbit.period * 10.0 / (self.nbOfPoints - 1)
-        for i in range(self.nbOfPoints):
-            time = epoch + step * i
-            pos = self.orbit.get_local_position_at(time) - delta
-            self.vertexWriter.addData3f(*pos)
-        self.lines = GeomLines(Geom.UHStatic)
-        for i in range(self.nbOfPoints-1):
-            self.lines.addVertex(i)
-            self.lines.addVertex(i+1)
-        if self.orbit.is_periodic() and self.orbit.is_closed():
-            self.lines.addVertex(self.nbOfPoints-1)
-            self.lines.addVertex(0)
+            max_anom = kepler_hyperbolic_array(ecc, 10 * pi)
+            params = numpy.linspace(-max_anom, max_anom, self.nbOfPoints)
+            func = lambda ecc_anom: hyperbolic_pos_array(pericenter, ecc, ecc_anom)
+        return refine_path(func, params, self.max_segment_angle, self.max_refine_passes)
+
+    def get_path(self):
+        """
+        Return the points of the orbit path relative to the parent body.
+        The path is only regenerated when the shape of the orbit or the sampled time window change.
+        """
+        time = self.context.time.time_full
+        if isinstance(self.orbit, EllipticalOrbit):
+            key = (self.orbit.pericenter_distance, self.orbit.eccentricity, self.nbOfPoints)
+            if key != self.path_key:
+                self.path = self.create_keplerian_path()
+                self.path_key = key
+            points = frame_to_local_positions(self.orbit, time, self.path)
+        else:
+            if self.orbit.is_periodic():
+                duration = self.orbit.period
+                step = duration / (self.nbOfPoints - 1)
+                start = floor((time - duration / 2) / step) * step
+            else:
+                #TODO: Properly calculate orbit start and end time
+                duration = self.orbit.period * 10.0
+                start = self.orbit.get_time_of_perihelion() - self.orbit.period * 5.0
+            key = (start, duration, self.nbOfPoints)
+            if key != self.path_key:
+                times = numpy.linspace(start, start + duration, self.nbOfPoints)
+                self.path = refine_path(lambda times: get_local_positions_at(self.orbit, times), times,
+                                        self.max_segment_angle, self.max_refine_passes)
+                self.path_key = key
+            points = self.path
+        return points - tuple(self.body.parent.anchor.get_local_position())
+
+    def fill_geom(self, geom, points):
+        count = len(points)
+        vdata = geom.modify_vertex_data()
+        array_data = vdata.modify_array(0)
+        array_data.unclean_set_num_rows(count)
+        if count > 0:
+            view = memoryview(array_data).cast('B')
+            data = numpy.frombuffer(view, dtype=numpy.float32).reshape(count, 3)
+            data[:] = points
+            del data
+            view.release()
+        lines = geom.modify_primitive(0)
+        lines.clear_vertices()
+        lines.add_consecutive_vertices(0, count)
+        lines.close_primitive()
+
+    def create_instance(self):
+        self.vertexData = GeomVertexData('vertexData', GeomVertexFormat.getV3(), Geom.UHStatic)
+        self.lines = GeomLinestrips(Geom.UHStatic)
         self.geom = Geom(self.vertexData)
         self.geom.addPrimitive(self.lines)
+        self.fill_geom(self.geom, self.get_path())
         self.node = GeomNode(self.body.get_ascii_name() + '-orbit')
         self.node.addGeom(self.geom)
         self.instance = NodePath(self.node)
@@ -138,22 +221,7 @@ class Orbit(VisibleObject):
         self.instance.show(self.default_camera_mask)
 
     def update_geom(self):
-        geom = self.node.modify_geom(0)
-        vdata = geom.modify_vertex_data()
-        vwriter = GeomVertexRewriter(vdata, InternalName.get_vertex())
-        #TODO: refactor with above code !!!
-        delta = self.body.parent.get_local_position()
-        if self.orbit.is_periodic():
-            epoch = self.context.time.time_full - self.orbit.period
-            step = self.orbit.period / (self.nbOfPoints - 1)
-        else:
-            #TODO: Properly calculate orbit start and end time
-            epoch = self.orbit.get_time_of_perihelion() - self.orbit.period * 5.0
-            step = self.orbit.period * 10.0 / (self.nbOfPoints - 1)
-        for i in range(self.nbOfPoints):
-            time = epoch + step * i
-            pos = self.orbit.get_local_position_at(time) - delta
-            vwriter.setData3f(*pos)
+        self.fill_geom(self.node.modify_geom(0), self.get_path())
 
     def check_visibility(self, frustum, pixel_size):
         if self.body.parent.anchor.visible and self.body.parent.scene_anchor.instance is not None and self.body.shown and self.orbit:
@@ -23,6 +23,7 @@ from ...shadows import SphereShadowCaster, CustomShadowMapShadowCaster
 from ...shaders.shadows.ellipsoid import ShaderSphereSelfShadow
 
 from math import floor, ceil
+import numpy
 from panda3d.core import LVector3, LQuaternion
 
 class SurfaceCategory(object):
@@ -283,6 +284,39 @@ class HeightmapSurface(EllipsoidSurface):
             height = self.radius
         return height
 
+    def get_mesh_heights_uv(self, heightmap, us, vs, density):
+        x = us * density
+        y = vs * density
+        x0 = numpy.floor(x) / density * heightmap.width
+        y0 = numpy.floor(y) / density * heightmap.height
+        x1 = numpy.ceil(x) / density * heightmap.width
+        y1 = numpy.ceil(y) / density * heightmap.height
+        dx = us * heightmap.width - x0
+        dx = numpy.divide(dx, x1 - x0, out=dx, where=x1 != x0)
+        dy = vs * heightmap.height - y0
+        dy = numpy.divide(dy, y1 - y0, out=dy, where=y1 != y0)
+        h_00 = heightmap.get_heights(x0, y0)
+        h_01 = heightmap.get_heights(x0, y1)
+        h_10 = heightmap.get_heights(x1, y0)
+        h_11 = heightmap.get_heights(x1, y1)
+        return h_00 + (h_10 - h_00) * dx + (h_01 - h_00) * dy + (h_00 + h_11 - h_01 - h_10) * dx * dy
+
+    def get_heights_patch(self, patch, us, vs, strict=False):
+        """
+        Vectorized version of get_height_patch(), us and vs are arrays of coordinates in the patch.
+        """
+        us = numpy.asarray(us, dtype=numpy.float64)
+        vs = numpy.asarray(vs, dtype=numpy.float64)
+        patch_data = self.heightmap.get_patch_data(patch)
+        if patch_data is not None and patch_data.data_ready:
+            h = self.get_mesh_heights_uv(patch_data, us, vs, patch.density)
+            heights = h * self.height_scale + self.heightmap_base
+        elif strict:
+            heights = None
+        else:
+            heights = numpy.full(us.shape, self.radius)
+        return heights
+
 class FlatSurface(Surface):
     @property
     def size(self):
@@ -365,3 +399,36 @@ class HeightmapFlatSurface(FlatSurface):
             #print("Patch data not found for", patch.str_id())
             height = self.heightmap_base
         return height
+
+    def get_mesh_heights_uv(self, heightmap, us, vs, density):
+        x = us * density
+        y = vs * density
+        x0 = numpy.floor(x) / density * heightmap.width
+        y0 = numpy.floor(y) / density * heightmap.height
+        x1 = numpy.ceil(x) / density * heightmap.width
+        y1 = numpy.ceil(y) / density * heightmap.height
+        dx = us * heightmap.width - x0
+        dx = numpy.divide(dx, x1 - x0, out=dx, where=x1 != x0)
+        dy = vs * heightmap.height - y0
+        dy = numpy.divide(dy, y1 - y0, out=dy, where=y1 != y0)
+        h_00 = heightmap.get_heights(x0, y0)
+        h_01 = heightmap.get_heights(x0, y1)
+        h_10 = heightmap.get_heights(x1, y0)
+        h_11 = heightmap.get_heights(x1, y1)
+        return h_00 + (h_10 - h_00) * dx + (h_01 - h_00) * dy + (h_00 + h_11 - h_01 - h_10) * dx * dy
+
+    def get_heights_patch(self, patch, us, vs, strict=False):
+        """
+        Vectorized version of get_height_patch(), us and vs are arrays of coordinates in the patch.
+        """
+        us = numpy.asarray(us, dtype=numpy.float64)
+        vs = numpy.asarray(vs, dtype=numpy.float64)
+        patch_data = self.heightmap.get_patch_data(patch)
+        if patch_data is not None and patch_data.data_ready:
+            h = self.get_mesh_heights_uv(patch_data, us, vs, patch.density)
+            heights = h * self.height_scale + self.heightmap_base
+        elif strict:
+            heights = None
+        else:
+            heights = numpy.full(us.shape, self.heightmap_base)
+        return heights
@@ -40,6 +40,7 @@ from .dircontext import defaultDirContext
 from .opengl import OpenGLConfig
 from .pipeline.scenepipeline import ScenePipeline
 from .objects.universe import Universe
+from .catalogstreamer import CatalogStreamer
 from .objects.stellarobject import StellarObject
 from .objects.systems import StellarSystem, SimpleSystem
 from .objects.stellarbody import StellarBody
@@ -48,6 +49,7 @@ from .engine.c_settings import c_settings
 from .engine.anchors import StellarAnchor, CartesianAnchor
 from .engine.traversers import UpdateTraverser, FindClosestSystemTraverser, FindLightSourceTraverser, FindShadowCastersTraverser
 from .lights import SurrogateLight, LightSources
+from .shadowcasters import ShadowCastersFinder, ShadowQueries
 from .components.annotations.grid import Grid
 from .astro.frame import BodyReferenceFrame
 from .astro.frame import AbsoluteReferenceFrame, SynchroneReferenceFrame, OrbitReferenceFrame
@@ -60,6 +62,8 @@ from .parsers import parsers
 
 from .bodyclass import bodyClasses
 from .autopilot import AutoPilot
+from .prefetcher import motionPredictor
+from .lodscheduler import lodScheduler
 from .controllers import ShipMover
 from .camera import CameraHolder, CameraController, FixedCameraController, TrackCameraController, LookAroundCameraController, FollowCameraController
 from .timecal import Time
@@ -79,6 +83,7 @@ from .fonts import fontsManager
 from .pstats import pstat
 from . import utils
 from . import workers
+from .texturecache import TextureCache
 from . import cache
 from . import mesh
 from . import settings
@@ -152,6 +157,7 @@ class CosmoniumBase(ShowBase):
 
         self.common_state.setShaderAuto()
 
+        workers.textureCache = TextureCache(settings.texture_cache_size)
         workers.asyncTextureLoader = workers.AsyncTextureLoader(self)
         workers.syncTextureLoader = workers.SyncTextureLoader()
 
@@ -399,6 +405,7 @@ class Cosmonium(CosmoniumBase):
         self.sync = None
         self.track = None
         self.extra = []
+        self.extra_set = set()
         self.fly = False
         self.nav_controllers = []
         self.nav = None
@@ -414,6 +421,7 @@ class Cosmonium(CosmoniumBase):
         self.global_light_sources = []
         self.orbits = []
         self.shadow_casters = []
+        self.shadow_casters_finder = ShadowCastersFinder()
         self.nearest_system = None
         self.nearest_body = None
         self.hdr = 0
@@ -434,6 +442,7 @@ class Cosmonium(CosmoniumBase):
 
         self.worlds = Worlds()
         self.universe = Universe(self)
+        self.catalog_streamer = CatalogStreamer(self.universe)
         self.background = ObserverCenteredWorld("background")
         self.background.background = True
         self.worlds.add_world(self.background)
@@ -447,6 +456,7 @@ class Cosmonium(CosmoniumBase):
             self.oid_texture = None
         self.observer = CameraHolder()
         self.autopilot = AutoPilot(self)
+        motionPredictor.set_observer(self.observer, self.autopilot)
         self.mouse = Mouse(self, self.oid_texture)
         if self.near_cam is not None:
             self.observer.add_linked_cam(self.near_cam)
@@ -560,6 +570,7 @@ class Cosmonium(CosmoniumBase):
         self.window_event(None)
 
         taskMgr.add(self.time_task, "time-task", sort=10)
+        self.catalog_streamer.start()
 
         self.time_task(None)
         self.start_universe()
@@ -1069,6 +1080,8 @@ class Cosmonium(CosmoniumBase):
     def update_universe(self, time, dt):
         traverser = UpdateTraverser(time, self.observer.anchor, settings.lowest_app_magnitude, self.update_id)
         self.universe.anchor.traverse(traverser)
+        for star_table in self.universe.star_tables:
+            star_table.update_observer(self.observer, settings.lowest_app_magnitude, traverser)
         self.visibles = list(traverser.get_collected())
         self.visibles.sort(key=lambda v: v.z_distance)
         self.controllers_to_update = []
@@ -1101,11 +1114,13 @@ class Cosmonium(CosmoniumBase):
             self._add_extra(to_add.orbit.frame.anchor)
         if isinstance(to_add.rotation.frame, BodyReferenceFrame):
             self._add_extra(to_add.rotation.frame.anchor)
-        if not to_add in self.extra:
+        if not to_add in self.extra_set:
+            self.extra_set.add(to_add)
             self.extra.append(to_add)
 
     def update_extra(self, *args):
         self.extra = []
+        self.extra_set = set()
         #TODO: temporary
         for body in args:
             if body is None: continue
@@ -1134,6 +1149,7 @@ class Cosmonium(CosmoniumBase):
     def update_states(self):
         visibles = []
         resolved = []
+        collected = set(self.visibles)
         for anchor in self.visibles:
             visible = anchor.resolved or anchor._app_magnitude < settings.lowest_app_magnitude
             if visible:
@@ -1147,7 +1163,7 @@ class Cosmonium(CosmoniumBase):
                     self.no_longer_visibles.append(anchor)
             anchor.visible = visible
         for anchor in self.extra:
-            if anchor in self.visibles: continue
+            if anchor in collected: continue
             if not (anchor._app_magnitude < settings.lowest_app_magnitude):
                 if anchor.was_visible:
                     self.no_longer_visibles.append(anchor)
@@ -1155,7 +1171,7 @@ class Cosmonium(CosmoniumBase):
         for world in self.worlds.worlds:
             resolved.append(world.anchor)
         for anchor in self.old_visibles:
-            if not anchor in self.visibles:
+            if not anchor in collected:
                 self.no_longer_visibles.append(anchor)
                 anchor.was_visible = anchor.visible
                 anchor.visible = False
@@ -1164,8 +1180,9 @@ class Cosmonium(CosmoniumBase):
         for anchor in resolved:
             if not anchor.was_resolved:
                 self.becoming_resolved.append(anchor)
+        resolved = set(resolved)
         for anchor in self.old_resolved:
-            if not anchor in self.resolved:
+            if not anchor in resolved:
                 self.no_longer_resolved.append(anchor)
 
     @pstat
@@ -1194,25 +1211,50 @@ class Cosmonium(CosmoniumBase):
         if self.nearest_system is None or not self.nearest_system.anchor.resolved: return
         if len(self.global_light_sources) == 0: return
         reflectives = []
+        shadow_casters = set()
         for anchor in self.resolved:
             if anchor.content & StellarAnchor.System != 0: continue
             if anchor.content & StellarAnchor.Reflective == 0: continue
             anchor.body.start_shadows_update()
             reflectives.append(anchor)
 
-        for light_source in self.global_light_sources:
-            for reflective in reflectives:
-                surrogate_light = reflective.body.lights.get_light_for(light_source.body)
-                if surrogate_light is None: continue
-                reflective.body.self_shadows_update(surrogate_light)
-                #print("TEST", reflective.body.get_name())
-                traverser = FindShadowCastersTraverser(reflective, -surrogate_light.light_direction, surrogate_light.light_distance, light_source.get_bounding_radius())
-                self.nearest_system.anchor.traverse(traverser)
-                #print("SHADOWS", list(map(lambda x: x.body.get_name(), traverser.anchors)))
-                for occluder in traverser.get_collected():
-                    if not occluder in self.shadow_casters:
+        if settings.shadow_casters_index:
+            pairs = []
+            directions = []
+            distances = []
+            light_radii = []
+            for light_source in self.global_light_sources:
+                for reflective in reflectives:
+                    surrogate_light = reflective.body.lights.get_light_for(light_source.body)
+                    if surrogate_light is None: continue
+                    reflective.body.self_shadows_update(surrogate_light)
+                    pairs.append((reflective, light_source, surrogate_light))
+                    directions.append(-surrogate_light.light_direction)
+                    distances.append(surrogate_light.light_distance)
+                    light_radii.append(light_source.get_bounding_radius())
+            queries = ShadowQueries([pair[0] for pair in pairs], directions, distances, light_radii)
+            occluders = self.shadow_casters_finder.find(self.nearest_system.anchor, queries, [pair[:2] for pair in pairs])
+            for ((reflective, light_source, surrogate_light), pair_occluders) in zip(pairs, occluders):
+                for occluder in pair_occluders:
+                    if not occluder in shadow_casters:
+                        shadow_casters.add(occluder)
                         self.shadow_casters.append(occluder)
                     occluder.body.add_shadow_target(surrogate_light, reflective.body)
+        else:
+            for light_source in self.global_light_sources:
+                for reflective in reflectives:
+                    surrogate_light = reflective.body.lights.get_light_for(light_source.body)
+                    if surrogate_light is None: continue
+                    reflective.body.self_shadows_update(surrogate_light)
+                    #print("TEST", reflective.body.get_name())
+                    traverser = FindShadowCastersTraverser(reflective, -surrogate_light.light_direction, surrogate_light.light_distance, light_source.get_bounding_radius())
+                    self.nearest_system.anchor.traverse(traverser)
+                    #print("SHADOWS", list(map(lambda x: x.body.get_name(), traverser.anchors)))
+                    for occluder in traverser.get_collected():
+                        if not occluder in shadow_casters:
+                            shadow_casters.add(occluder)
+                            self.shadow_casters.append(occluder)
+                        occluder.body.add_shadow_target(surrogate_light, reflective.body)
 
         for reflective in reflectives:
             reflective.body.end_shadows_update()
@@ -1288,8 +1330,15 @@ class Cosmonium(CosmoniumBase):
         self.worlds.update_scene_anchor(scene_manager)
         for controller in self.controllers_to_update:
             controller.check_and_update_instance(camera_pos, camera_rot)
+        lodScheduler.process()
         self.gui.update_status()
 
+    @pstat
+    def update_star_tables(self):
+        if not settings.render_sprite_points: return
+        for star_table in self.universe.star_tables:
+            star_table.update_points(self.scene_manager)
+
     @pstat
     def find_nearest_system(self):
         #First iter over the visible object to have a first closest system
@@ -1321,6 +1370,7 @@ class Cosmonium(CosmoniumBase):
             else:
                 print("No more near system")
             self.nearest_system = nearest_system
+            motionPredictor.reset()
 
         nearest_body = None
         distance = float('inf')
@@ -1362,6 +1412,7 @@ class Cosmonium(CosmoniumBase):
         self.update_extra(self.selected, self.follow, self.sync, self.track)
         self.nav.update(self.time.time_full, dt)
         self.camera_controller.update(self.time.time_full, dt)
+        motionPredictor.update(globalClock.get_real_time())
         self.update_extra_observer()
 
         update = pstats.levelpstat('update', 'Bodies')
@@ -1400,6 +1451,7 @@ class Cosmonium(CosmoniumBase):
         self.find_shadows()
         self.update_instances()
         self.scene_manager.build_scene(self.common_state, self.c_camera_holder, self.visible_scene_anchors, self.resolved_scene_anchors)
+        self.update_star_tables()
 
         update.set_level(StellarObject.nb_update)
         obs.set_level(StellarObject.nb_obs)
@@ -1490,6 +1542,8 @@ class Cosmonium(CosmoniumBase):
                     print("\tPosition:", self.selected.scene_anchor.scene_position)
                     print("\tOrientation:", self.selected.scene_anchor.scene_orientation)
                     print("\tScale:", self.selected.scene_anchor.scene_scale_factor)
+        if settings.prefetch_patches:
+            workers.prefetchStats.print_stats()
 
     def init_universe(self):
         pass
@@ -26,3 +26,5 @@ except ImportError as e:
     print("\t", e)
     from .pyengine.octree import OctreeNode
     c_settings = None
+
+from .pyengine.packedoctree import PackedOctree
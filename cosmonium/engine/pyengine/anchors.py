@@ -20,10 +20,11 @@
 
 from panda3d.core import LPoint3d, LVector3d, LQuaterniond, LColor
 
-from ..octree import OctreeNode
+from .octree import ArrayOctreeNode
 from ...astro import units
 from ...astro.astro import abs_to_app_mag, app_to_abs_mag, abs_mag_to_lum, lum_to_abs_mag
 from ...astro.frame import AbsoluteReferenceFrame
+from ...astro.orbits import EllipticalOrbitSet
 from ... import utils
 
 from ... import settings
@@ -68,6 +69,16 @@ class AnchorBase():
     def rebuild(self):
         pass
 
+    def leaf_changed(self, leaf):
+        pass
+
+    def orbit_changed(self):
+        if self.parent is not None:
+            self.parent.child_orbit_changed(self)
+
+    def child_orbit_changed(self, child):
+        pass
+
     def traverse(self, visitor):
         visitor.traverse_anchor(self)
 
@@ -75,6 +86,8 @@ class AnchorBase():
         return self.bounding_radius
 
     def set_bounding_radius(self, bounding_radius):
+        if bounding_radius != self.bounding_radius and self.parent is not None:
+            self.parent.leaf_changed(self)
         self.bounding_radius = bounding_radius
 
     def get_apparent_radius(self):
@@ -336,6 +349,7 @@ class StellarAnchor(AnchorBase):
         self._app_magnitude = 1000.0
         self._equatorial = LQuaterniond()
         self._albedo = 0.5
+        self.orbit_update_id = -1
         #TODO: Should be done properly
         #orbit.body = body
         #rotation.body = body
@@ -371,8 +385,9 @@ class StellarAnchor(AnchorBase):
         if self.update_id == update_id: return
         self._orientation = self.rotation.get_absolute_rotation_at(time)
         self._equatorial = self.rotation.get_equatorial_orientation_at(time)
-        self._local_position = self.orbit.get_local_position_at(time)
-        self._global_position = self.orbit.get_absolute_reference_point_at(time)
+        if self.orbit_update_id != update_id:
+            self._local_position = self.orbit.get_local_position_at(time)
+            self._global_position = self.orbit.get_absolute_reference_point_at(time)
         self._position = self._global_position + self._local_position
 
     def get_luminosity(self, star):
@@ -430,6 +445,8 @@ class SystemAnchor(DynamicStellarAnchor):
         DynamicStellarAnchor.__init__(self, self.System, body, orbit, rotation, point_color)
         self.primary = None
         self.children = []
+        self.orbit_set = None
+        self.orbit_set_anchors = []
 
     def set_primary(self, primary):
         self.primary = primary
@@ -451,6 +468,8 @@ class SystemAnchor(DynamicStellarAnchor):
             self.set_rebuild_needed()
 
     def rebuild(self):
+        previous_radius = self.bounding_radius
+        previous_magnitude = self._abs_magnitude
         content = self.System
         bounding_radius = 0
         for child in self.children:
@@ -474,8 +493,37 @@ class SystemAnchor(DynamicStellarAnchor):
                 self._abs_magnitude = 1000.0
         else:
             self._abs_magnitude = self.primary._abs_magnitude
+        if self.parent is not None and (bounding_radius != previous_radius or self._abs_magnitude != previous_magnitude):
+            self.parent.leaf_changed(self)
+        self.create_orbit_set()
         self.rebuild_needed = False
 
+    def create_orbit_set(self):
+        anchors = [child for child in self.children if EllipticalOrbitSet.accept(getattr(child, 'orbit', None))]
+        if len(anchors) >= settings.orbit_set_min_size:
+            self.orbit_set = EllipticalOrbitSet([anchor.orbit for anchor in anchors])
+            self.orbit_set_anchors = anchors
+        else:
+            self.orbit_set = None
+            self.orbit_set_anchors = []
+
+    def child_orbit_changed(self, child):
+        if self.orbit_set is not None and child in self.orbit_set_anchors:
+            self.orbit_set.update()
+
+    def update_orbit_set(self, time, update_id):
+        """
+        Update the position of all the children in the orbit set, the anchors of their frames are updated first.
+        """
+        for anchor in self.orbit_set.anchors:
+            anchor.update(time, update_id)
+        positions = self.orbit_set.get_local_positions_at(time)
+        reference_points = self.orbit_set.get_absolute_reference_points()
+        for (anchor, position, reference_point) in zip(self.orbit_set_anchors, positions.tolist(), reference_points):
+            anchor._local_position = LPoint3d(*position)
+            anchor._global_position = reference_point
+            anchor.orbit_update_id = update_id
+
     def traverse(self, visitor):
         if visitor.enter_system(self):
             visitor.traverse_system(self)
@@ -488,7 +536,7 @@ class OctreeAnchor(SystemAnchor):
         #TODO: Should be configurable
         abs_mag = app_to_abs_mag(6.0, self.bounding_radius * sqrt(3))
         #TODO: position should be extracted from orbit
-        self.octree = OctreeNode(0, self,
+        self.octree = ArrayOctreeNode(0, self,
                              LPoint3d(10 * units.Ly, 10 * units.Ly, 10 * units.Ly),
                              self.bounding_radius,
                              abs_mag)
@@ -496,9 +544,18 @@ class OctreeAnchor(SystemAnchor):
         self.content = ~0
         self.recreate_octree = True
 
+    def add_child(self, child):
+        SystemAnchor.add_child(self, child)
+        if not self.recreate_octree:
+            #The octree is already created, insert the new child directly
+            child.update(0, None)
+            child.rebuild()
+            self.octree.add(child)
+
     def rebuild(self):
         if self.recreate_octree:
             self.create_octree()
+            self.recreate_octree = False
         if self.octree.rebuild_needed:
             self.octree.rebuild()
         self.rebuild_needed = False
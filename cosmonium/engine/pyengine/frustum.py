@@ -20,6 +20,8 @@
 
 from panda3d.core import LPlaned
 
+import numpy
+
 class InfiniteFrustum(object):
     def __init__(self, frustum, view_mat, view_position, zero_near=True):
         self.planes = []
@@ -44,5 +46,10 @@ class InfiniteFrustum(object):
             if dist > radius: return False
         return True
 
+    def are_spheres_in(self, centers, radii):
+        planes = numpy.array([tuple(plane) for plane in self.planes])
+        distances = centers @ planes[:, :3].T + planes[:, 3]
+        return numpy.all(distances <= radii[:, numpy.newaxis], axis=1)
+
     def get_position(self):
         return self.position
@@ -20,7 +20,10 @@
 
 from panda3d.core import LPoint3d
 
+from ...astro import units
+
 from math import sqrt
+import numpy
 
 class OctreeNode(object):
     max_level = 200
@@ -61,10 +64,19 @@ class OctreeNode(object):
             self.parent.set_rebuild_needed()
 
     def rebuild(self):
+        for leaf in self.leaves:
+            if leaf.rebuild_needed:
+                leaf.rebuild()
         for child in self.children:
             if child is not None and child.rebuild_needed:
                 child.rebuild()
-        rebuild_needed = False
+        self.rebuild_needed = False
+
+    def leaf_changed(self, leaf):
+        pass
+
+    def child_orbit_changed(self, child):
+        pass
 
     def traverse(self, traverser):
         traverser.traverse_octree_node(self)
@@ -104,7 +116,7 @@ class OctreeNode(object):
                 child_center.z += child_offset
             else:
                 child_center.z -= child_offset
-            child = OctreeNode(self.level + 1, self, child_center, self.width / 2.0, self.threshold + self.child_threshold, index)
+            child = self.__class__(self.level + 1, self, child_center, self.width / 2.0, self.threshold + self.child_threshold, index)
             self.children[index] = child
         self.children[index]._add(obj, position, magnitude)
 
@@ -150,3 +162,51 @@ class OctreeNode(object):
     def print_stats(self):
         print("Nb cells:", self.nb_cells)
         print("Nb leaves:", self.nb_leaves)
+
+class ArrayOctreeNode(OctreeNode):
+    """
+    Octree node keeping the position, absolute magnitude and bounding radius of its leaves in contiguous arrays
+    so that the leaves can be culled with a single vectorized operation.
+    """
+    def __init__(self, level, parent, center, width, threshold, index = -1):
+        OctreeNode.__init__(self, level, parent, center, width, threshold, index)
+        self.arrays_dirty = True
+        self.leaf_positions = None
+        self.leaf_magnitudes = None
+        self.leaf_radii = None
+
+    def _add(self, obj, position, magnitude):
+        OctreeNode._add(self, obj, position, magnitude)
+        self.arrays_dirty = True
+
+    def _split(self):
+        OctreeNode._split(self)
+        self.arrays_dirty = True
+
+    def leaf_changed(self, leaf):
+        self.arrays_dirty = True
+
+    def update_arrays(self):
+        self.leaf_positions = numpy.array([tuple(leaf._global_position) for leaf in self.leaves], dtype=numpy.float64).reshape(-1, 3)
+        self.leaf_magnitudes = numpy.array([leaf._abs_magnitude for leaf in self.leaves], dtype=numpy.float64)
+        self.leaf_radii = numpy.array([leaf.bounding_radius for leaf in self.leaves], dtype=numpy.float64)
+        self.arrays_dirty = False
+
+    def cull_leaves(self, position, limit, frustum=None):
+        """
+        Return the indices of the leaves brighter than the limit magnitude, as seen from position, and
+        inside the frustum if any. Leaves located at position are always kept.
+        """
+        if self.arrays_dirty:
+            self.update_arrays()
+        rel_positions = self.leaf_positions - numpy.array(position)
+        distances = numpy.sqrt(numpy.einsum('ij,ij->i', rel_positions, rel_positions))
+        at_position = distances == 0.0
+        with numpy.errstate(divide='ignore'):
+            app_magnitudes = self.leaf_magnitudes + 5 * (numpy.log10(distances / units.KmPerParsec) - 1)
+        selected = app_magnitudes < limit
+        if frustum is not None:
+            candidates = numpy.nonzero(selected)[0]
+            selected[candidates] = frustum.are_spheres_in(self.leaf_positions[candidates], self.leaf_radii[candidates])
+        selected |= at_position
+        return numpy.nonzero(selected)[0]
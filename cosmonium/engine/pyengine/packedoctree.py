@@ -0,0 +1,166 @@
+#
+#This file is part of Cosmonium.
+#
+#Copyright (C) 2018-2022 Laurent Deru.
+#
+#Cosmonium is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#Cosmonium is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with Cosmonium.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+
+from .octree import OctreeNode
+from ...astro import units
+
+from math import sqrt
+import numpy
+import os
+
+class PackedOctree(object):
+    """
+    Octree over the rows of a columnar table, stored as flat arrays.
+
+    The rows are sorted so that the leaves of each node are a contiguous range of the table,
+    the leaves of node i are the rows leaf_starts[i] to leaf_ends[i]. The node 0 is the root.
+    """
+    max_level = OctreeNode.max_level
+    max_leaves = OctreeNode.max_leaves
+    child_threshold = OctreeNode.child_threshold
+    arrays = ('centers', 'widths', 'thresholds', 'max_magnitudes', 'leaf_starts', 'leaf_ends', 'children')
+
+    def __init__(self, centers, widths, thresholds, max_magnitudes, leaf_starts, leaf_ends, children):
+        self.centers = centers
+        self.widths = widths
+        self.radii = widths / 2.0 * sqrt(3)
+        self.thresholds = thresholds
+        self.max_magnitudes = max_magnitudes
+        self.leaf_starts = leaf_starts
+        self.leaf_ends = leaf_ends
+        self.children = children
+
+    def __len__(self):
+        return len(self.widths)
+
+    def save(self, path):
+        for name in self.arrays:
+            numpy.save(os.path.join(path, name + '.npy'), getattr(self, name))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an octree stored with save(), the arrays are memory-mapped and not read into memory.
+        """
+        arrays = [numpy.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in cls.arrays]
+        return cls(*arrays)
+
+    def gather_leaves(self, nodes):
+        starts = self.leaf_starts[nodes]
+        lengths = self.leaf_ends[nodes] - starts
+        total = lengths.sum()
+        if total == 0:
+            return numpy.empty(0, dtype=numpy.int64)
+        offsets = numpy.cumsum(lengths) - lengths
+        return numpy.repeat(starts - offsets, lengths) + numpy.arange(total)
+
+    def cull(self, position, direction, fov, limit, unbounded_limit):
+        """
+        Return the rows contained in the nodes that could hold objects brighter than the limit magnitude
+        and inside the cone defined by the direction and the half angle fov, as seen from position.
+        The nodes that could hold objects brighter than unbounded_limit are kept regardless of their direction.
+        The whole octree is processed one level at a time.
+        """
+        if len(self) == 0:
+            return numpy.empty(0, dtype=numpy.int64)
+        rows = []
+        frontier = numpy.zeros(1, dtype=numpy.int64)
+        while len(frontier) > 0:
+            vectors = self.centers[frontier] - position
+            center_distances = numpy.sqrt(numpy.einsum('ij,ij->i', vectors, vectors))
+            radii = self.radii[frontier]
+            distances = center_distances - radii
+            inside = distances <= 0.0
+            distances = numpy.maximum(distances, 1e-6)
+            app_magnitudes = self.max_magnitudes[frontier] + 5 * (numpy.log10(distances / units.KmPerParsec) - 1)
+            center_distances = numpy.maximum(center_distances, 1e-6)
+            cos_angles = numpy.clip(numpy.einsum('ij,j->i', vectors, direction) / center_distances, -1.0, 1.0)
+            angular_radii = numpy.arcsin(numpy.minimum(radii / center_distances, 1.0))
+            in_view = numpy.arccos(cos_angles) <= fov + angular_radii
+            accepted = inside | ((app_magnitudes <= limit) & (in_view | (app_magnitudes <= unbounded_limit)))
+            nodes = frontier[accepted]
+            rows.append(self.gather_leaves(nodes))
+            frontier = self.children[nodes].ravel()
+            frontier = frontier[frontier >= 0].astype(numpy.int64)
+        return numpy.concatenate(rows)
+
+    @classmethod
+    def build(cls, positions, magnitudes, bounding_radii, center, width, threshold):
+        """
+        Build the octree over the given rows and return it with the permutation to apply to the rows
+        to make the leaves of each node contiguous.
+        """
+        centers = []
+        widths = []
+        thresholds = []
+        max_magnitudes = []
+        leaf_starts = []
+        leaf_ends = []
+        children = []
+        order = []
+        offset = 0
+        # Depth-first traversal, each entry is (rows, center, width, threshold, level, parent, child index)
+        stack = [(numpy.arange(len(positions)), numpy.array(center, dtype=numpy.float64), width, threshold, 0, -1, 0)]
+        while len(stack) > 0:
+            rows, node_center, node_width, node_threshold, level, parent, index = stack.pop()
+            node = len(widths)
+            if parent >= 0:
+                children[parent][index] = node
+            centers.append(node_center)
+            widths.append(node_width)
+            thresholds.append(node_threshold)
+            children.append([-1] * 8)
+            node_magnitudes = magnitudes[rows]
+            max_magnitudes.append(node_magnitudes.min() if len(rows) > 0 else 1000.0)
+            if len(rows) < cls.max_leaves or level >= cls.max_level:
+                leaves = rows
+                remaining = rows[:0]
+            else:
+                node_positions = positions[rows]
+                distances = numpy.sqrt(((node_positions - node_center) ** 2).sum(axis=1))
+                kept = (node_magnitudes < node_threshold) | (distances < bounding_radii[rows])
+                leaves = rows[kept]
+                remaining = rows[~kept]
+            leaf_starts.append(offset)
+            offset += len(leaves)
+            leaf_ends.append(offset)
+            order.append(leaves)
+            if len(remaining) == 0: continue
+            remaining_positions = positions[remaining]
+            indices = (remaining_positions[:, 0] >= node_center[0]).astype(numpy.int8)
+            indices |= (remaining_positions[:, 1] >= node_center[1]) << 1
+            indices |= (remaining_positions[:, 2] >= node_center[2]) << 2
+            child_offset = node_width / 4.0
+            for child_index in range(7, -1, -1):
+                child_rows = remaining[indices == child_index]
+                if len(child_rows) == 0: continue
+                child_center = node_center.copy()
+                child_center[0] += child_offset if (child_index & 1) != 0 else -child_offset
+                child_center[1] += child_offset if (child_index & 2) != 0 else -child_offset
+                child_center[2] += child_offset if (child_index & 4) != 0 else -child_offset
+                stack.append((child_rows, child_center, node_width / 2.0, node_threshold + cls.child_threshold, level + 1, node, child_index))
+        octree = cls(numpy.array(centers, dtype=numpy.float64).reshape(-1, 3),
+                     numpy.array(widths, dtype=numpy.float64),
+                     numpy.array(thresholds, dtype=numpy.float64),
+                     numpy.array(max_magnitudes, dtype=numpy.float64),
+                     numpy.array(leaf_starts, dtype=numpy.int64),
+                     numpy.array(leaf_ends, dtype=numpy.int64),
+                     numpy.array(children, dtype=numpy.int32).reshape(-1, 8))
+        return octree, numpy.concatenate(order) if len(order) > 0 else numpy.arange(0)
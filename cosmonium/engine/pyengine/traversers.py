@@ -18,7 +18,7 @@
 #
 
 
-from ...astro.astro import abs_to_app_mag, app_to_abs_mag
+from ...astro.astro import abs_to_app_mag
 from ..anchors import StellarAnchor
 
 from math import asin, pi
@@ -62,6 +62,8 @@ class UpdateTraverser(AnchorTraverser):
         return ((anchor.visible or anchor.visibility_override) and anchor.resolved) or anchor.force_update
 
     def traverse_system(self, anchor):
+        if anchor.orbit_set is not None:
+            anchor.update_orbit_set(self.time, self.update_id)
         for child in anchor.children:
             child.traverse(self)
 
@@ -77,26 +79,9 @@ class UpdateTraverser(AnchorTraverser):
 
     def traverse_octree_node(self, octree_node):
         frustum = self.observer.frustum
-        frustum_position = frustum.get_position()
-        distance = (octree_node.center - frustum_position).length() - octree_node.radius
-        if distance > 0.0:
-            faintest = app_to_abs_mag(self.limit, distance)
-        else:
-            faintest = 1000.0
-        for leaf in octree_node.leaves:
-            abs_magnitude = leaf._abs_magnitude
-            traverse = False
-            if abs_magnitude < faintest:
-                direction = leaf._global_position - frustum_position
-                distance = direction.length()
-                if distance > 0.0:
-                    app_magnitude = abs_to_app_mag(abs_magnitude, distance)
-                    if app_magnitude < self.limit:
-                        traverse = frustum.is_sphere_in(leaf._global_position, leaf.bounding_radius)
-                else:
-                    traverse = True
-            if traverse:
-                leaf.traverse(self)
+        leaves = octree_node.leaves
+        for index in octree_node.cull_leaves(frustum.get_position(), self.limit, frustum).tolist():
+            leaves[index].traverse(self)
 
 class FindClosestSystemTraverser(AnchorTraverser):
     def __init__(self, observer, system, distance):
@@ -158,21 +143,9 @@ class FindLightSourceTraverser(AnchorTraverser):
         return True
 
     def traverse_octree_node(self, octree_node):
-        distance = (octree_node.center - self.position).length() - octree_node.radius
-        if distance > 0.0:
-            faintest = app_to_abs_mag(self.limit, distance)
-        else:
-            faintest = 1000.0
-        for leaf in octree_node.leaves:
-            abs_magnitude = leaf._abs_magnitude
-            if abs_magnitude < faintest:
-                distance = (leaf._global_position - self.position).length()
-                if distance > 0.0:
-                    app_magnitude = abs_to_app_mag(abs_magnitude, distance)
-                    if app_magnitude < self.limit:
-                        leaf.traverse(self)
-                else:
-                    leaf.traverse(self)
+        leaves = octree_node.leaves
+        for index in octree_node.cull_leaves(self.position, self.limit).tolist():
+            leaves[index].traverse(self)
 
 class FindShadowCastersTraverser(AnchorTraverser):
     def __init__(self, target, vector_to_light_source, distance_to_light_source, light_source_radius):
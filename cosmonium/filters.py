@@ -24,6 +24,7 @@ from .shaders.filters import TextureNearestFilter, TextureBilinearFilter, Textur
 from . import settings
 
 from math import floor
+import numpy
 
 
 class TexFilter(object):
@@ -61,9 +62,51 @@ class TexFilter(object):
             value = value[0]
         return value
 
+    def get_single_values(self, data, x, y, clamp=True):
+        height, width = data.shape
+        x = x / width
+        y = y / height
+        if clamp:
+            x = numpy.clip(x, 0.0, 1.0)
+            y = numpy.clip(y, 0.0, 1.0)
+        # Same wrapping as TexturePeeker.lookup()
+        i_x = (((x - numpy.floor(x)) * width).astype(numpy.int64)) % width
+        i_y = (((y - numpy.floor(y)) * height).astype(numpy.int64)) % height
+        return data[i_y, i_x]
+
+    def get_bilinear_values(self, data, x, y, clamp=True):
+        height, width = data.shape
+        if clamp:
+            x = numpy.clip(x, 0.0, width)
+            y = numpy.clip(y, 0.0, height)
+        x = x - 0.5
+        y = y - 0.5
+        x0 = numpy.floor(x)
+        y0 = numpy.floor(y)
+        f_x = x - x0
+        f_y = y - y0
+        x0 = x0.astype(numpy.int64)
+        y0 = y0.astype(numpy.int64)
+        # Same clamping as TexturePeeker.lookup_bilinear()
+        x1 = numpy.clip(x0 + 1, 0, width - 1)
+        y1 = numpy.clip(y0 + 1, 0, height - 1)
+        x0 = numpy.clip(x0, 0, width - 1)
+        y0 = numpy.clip(y0, 0, height - 1)
+        p00 = data[y0, x0]
+        p10 = data[y0, x1]
+        p01 = data[y1, x0]
+        p11 = data[y1, x1]
+        return (p00 * (1.0 - f_x) + p10 * f_x) * (1.0 - f_y) + (p01 * (1.0 - f_x) + p11 * f_x) * f_y
+
     def get_value(self, peeker, x, y):
         raise NotImplementedError()
 
+    def get_values(self, data, x, y):
+        """
+        Vectorized version of get_value(), data is the decoded texture as a 2D array and x, y are arrays of texel coordinates.
+        """
+        raise NotImplementedError()
+
     def update_texture_config(self, texture_config):
         raise NotImplementedError()
 
@@ -75,6 +118,9 @@ class NearestFilter(TexFilter):
     def get_value(self, peeker, x, y):
         return self.get_single_value(peeker, x, y)
 
+    def get_values(self, data, x, y):
+        return self.get_single_values(data, x, y)
+
     def update_texture_config(self, texture_config):
         texture_config.minfilter = Texture.FT_nearest
         texture_config.magfilter = Texture.FT_nearest
@@ -87,6 +133,9 @@ class BilinearFilter(TexFilter):
     def get_value(self, peeker, x, y):
         return self.get_bilinear_value(peeker, x, y)
 
+    def get_values(self, data, x, y):
+        return self.get_bilinear_values(data, x, y)
+
     def update_texture_config(self, texture_config):
         texture_config.minfilter = Texture.FT_linear
         texture_config.magfilter = Texture.FT_linear
@@ -110,6 +159,20 @@ class SmoothstepFilter(TexFilter):
 
         return self.get_bilinear_value(peeker, i_x + f_x - 0.5, i_y + f_y - 0.5)
 
+    def get_values(self, data, x, y):
+        x = x + 0.5
+        y = y + 0.5
+
+        i_x = numpy.floor(x)
+        i_y = numpy.floor(y)
+        f_x = x - i_x
+        f_y = y - i_y
+
+        f_x = f_x*f_x*(3.0-2.0*f_x)
+        f_y = f_y*f_y*(3.0-2.0*f_y)
+
+        return self.get_bilinear_values(data, i_x + f_x - 0.5, i_y + f_y - 0.5)
+
     def update_texture_config(self, texture_config):
         texture_config.minfilter = Texture.FT_linear
         texture_config.magfilter = Texture.FT_linear
@@ -133,6 +196,20 @@ class QuinticFilter(TexFilter):
 
         return self.get_bilinear_value(peeker, i_x + f_x - 0.5, i_y + f_y - 0.5)
 
+    def get_values(self, data, x, y):
+        x = x + 0.5
+        y = y + 0.5
+
+        i_x = numpy.floor(x)
+        i_y = numpy.floor(y)
+        f_x = x - i_x
+        f_y = y - i_y
+
+        f_x = f_x*f_x*f_x*(f_x*(f_x*6.0-15.0)+10.0)
+        f_y = f_y*f_y*f_y*(f_y*(f_y*6.0-15.0)+10.0)
+
+        return self.get_bilinear_values(data, i_x + f_x - 0.5, i_y + f_y - 0.5)
+
     def update_texture_config(self, texture_config):
         texture_config.minfilter = Texture.FT_linear
         texture_config.magfilter = Texture.FT_linear
@@ -190,3 +267,33 @@ class BSplineFilter(TexFilter):
         a = mix(p01, p00, sx)
         b = mix(p11, p10, sx)
         return mix(b, a, sy)
+
+    def get_values(self, data, x, y):
+        tc_x = numpy.floor(x - 0.5) + 0.5
+        tc_y = numpy.floor(y - 0.5) + 0.5
+
+        alpha_x = x - tc_x
+        alpha_y = y - tc_y
+        cubic_x = self.cubic(alpha_x)
+        cubic_y = self.cubic(alpha_y)
+
+        s_x = cubic_x[0] + cubic_x[1]
+        s_y = cubic_x[2] + cubic_x[3]
+        s_z = cubic_y[0] + cubic_y[1]
+        s_w = cubic_y[2] + cubic_y[3]
+        offset_x = tc_x - 1 + (cubic_x[1]) / s_x
+        offset_y = tc_x + 1 + (cubic_x[3]) / s_y
+        offset_z = tc_y - 1 + (cubic_y[1]) / s_z
+        offset_w = tc_y + 1 + (cubic_y[3]) / s_w
+
+        sx = s_x / (s_x + s_y)
+        sy = s_z / (s_z + s_w)
+
+        p00 = self.get_bilinear_values(data, offset_x, offset_z)
+        p01 = self.get_bilinear_values(data, offset_y, offset_z)
+        p10 = self.get_bilinear_values(data, offset_x, offset_w)
+        p11 = self.get_bilinear_values(data, offset_y, offset_w)
+
+        a = p01 * (1.0 - sx) + p00 * sx
+        b = p11 * (1.0 - sx) + p10 * sx
+        return b * (1.0 - sy) + a * sy
@@ -28,6 +28,7 @@ from .textures import TextureConfiguration
 from .interpolators import HardwareInterpolator
 from .filters import BilinearFilter
 from .dircontext import defaultDirContext
+from . import settings
 
 import traceback
 import numpy
@@ -35,10 +36,25 @@ import numpy
 #TODO: HeightmapPatch has common code with Heightmap and TextureHeightmapBase, this should be refactored
 #TODO: Texture data should be refactored like appearance to be fully independent from the source
 
+def decode_height_data(np_buffer, scale):
+    """
+    Convert the RAM image of a heightmap into a 2D array of the values returned by the texture peeker.
+    The RAM image is stored in BGRA order.
+    """
+    num_components = np_buffer.shape[2]
+    if settings.encode_float and num_components == 4:
+        data = np_buffer.astype(numpy.float64) / scale
+        return data[:, :, 2] + data[:, :, 1] / 255.0 + data[:, :, 0] / 65025.0 + data[:, :, 3] / 16581375.0
+    elif num_components >= 3:
+        return np_buffer[:, :, 2].astype(numpy.float64) / scale
+    else:
+        return np_buffer[:, :, 0].astype(numpy.float64) / scale
+
 class HeightmapPatch(PatchData):
     def __init__(self, parent, patch, width, height, overlap):
         PatchData.__init__(self, parent, patch, width, height, overlap)
         self.texture_peeker = None
+        self.height_data = None
         self.min_height = None
         self.max_height = None
         self.mean_height = None
@@ -46,6 +62,7 @@ class HeightmapPatch(PatchData):
     def copy_from(self, parent_data):
         PatchData.copy_from(self, parent_data)
         self.texture_peeker = parent_data.texture_peeker
+        self.height_data = parent_data.height_data
         self.min_height = parent_data.min_height
         self.max_height = parent_data.max_height
         self.mean_height = parent_data.mean_height
@@ -69,6 +86,23 @@ class HeightmapPatch(PatchData):
     def get_height_uv(self, u, v):
         return self.get_height(u * self.width, v * self.height)
 
+    def get_heights(self, xs, ys):
+        """
+        Vectorized version of get_height(), xs and ys are arrays of texel coordinates.
+        """
+        if self.height_data is None:
+            print("No height data", self.patch.str_id(), self.patch.instance_ready)
+            return numpy.zeros(numpy.shape(xs))
+        new_x = numpy.asarray(xs) * self.texture_scale[0] + self.texture_offset[0] * self.width
+        new_y = numpy.asarray(ys) * self.texture_scale[1] + self.texture_offset[1] * self.height
+        new_x = numpy.minimum(new_x, self.width - 1)
+        new_y = numpy.minimum(new_y, self.height - 1)
+        heights = self.parent.filter.get_values(self.height_data, new_x, new_y)
+        return heights * self.parent.height_scale + self.parent.height_offset
+
+    def get_heights_uv(self, us, vs):
+        return self.get_heights(numpy.asarray(us) * self.width, numpy.asarray(vs) * self.height)
+
     async def load(self, tasks_tree, patch):
         pass
 
@@ -85,6 +119,7 @@ class HeightmapPatch(PatchData):
     def clear(self, instance):
         PatchData.clear(self, instance)
         self.texture_peeker = None
+        self.height_data = None
 
     def collect_shader_data(self, data):
         # Data is set as RGBA, but stored as BGRA
@@ -130,6 +165,7 @@ class HeightmapPatch(PatchData):
                 scale = 65535.0
         np_buffer = numpy.frombuffer(data, buffer_type)
         np_buffer.shape = (self.texture.getYSize(), self.texture.getXSize(), self.texture.getNumComponents())
+        self.height_data = decode_height_data(np_buffer, scale)
         self.min_height = np_buffer.min() / scale
         self.max_height = np_buffer.max() / scale
         self.mean_height = np_buffer.mean() / scale
@@ -286,6 +322,21 @@ class PatchedHeightmapBase(HeightmapBase, PatchedData):
         else:
             return self.v_scale
 
+    def get_heights(self, patch, xs, ys):
+        """
+        Sample the heightmap of the given patch at the texel coordinates xs and ys in one operation.
+        """
+        patch_data = self.get_patch_data(patch)
+        if patch_data is None:
+            return None
+        return patch_data.get_heights(xs, ys)
+
+    def get_heights_uv(self, patch, us, vs):
+        patch_data = self.get_patch_data(patch)
+        if patch_data is None:
+            return None
+        return patch_data.get_heights_uv(us, vs)
+
     def get_data_source(self, data_store):
         return HeightmapShaderDataSource(self, data_store)
 
@@ -327,6 +378,12 @@ class StackedHeightmapPatch(HeightmapPatch):
             height += patch.get_height(x, y)
         return height
 
+    def get_heights(self, xs, ys):
+        heights = numpy.zeros(numpy.shape(xs))
+        for patch in self.patches:
+            heights += patch.get_heights(xs, ys)
+        return heights
+
     def load(self):
         if self.count != None: return
         for patch in self.patches:
@@ -0,0 +1,114 @@
+#
+#This file is part of Cosmonium.
+#
+#Copyright (C) 2018-2022 Laurent Deru.
+#
+#Cosmonium is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#Cosmonium is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with Cosmonium.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+
+from panda3d.core import ClockObject
+
+from .pstats import levelpstat
+from . import settings
+
+class LodScheduler(object):
+    """
+    Share a per-frame time budget between the split and merge operations of all the patched shapes.
+
+    The shapes register their candidate operations during their LOD check, they are then done once per frame
+    by process(), the splits with the largest screen-space error first, then the merges with the smallest.
+    The operations that do not fit in the budget of the current frame are not kept, they will be found again
+    by the LOD check of the shape during the next frame. At least one operation is always done per frame
+    to guarantee the refinement progresses.
+    """
+    def __init__(self):
+        self.clock = ClockObject.get_global_clock()
+        self.frame = None
+        self.spent = 0.0
+        self.processed = 0
+        self.deferred = 0
+        self.splits = []
+        self.merges = []
+        self.shapes = {}
+        self.time_pstat = levelpstat('time', 'LOD')
+        self.queue_pstat = levelpstat('queue', 'LOD')
+        self.processed_pstat = levelpstat('processed', 'LOD')
+
+    def start_frame(self):
+        frame = self.clock.get_frame_count()
+        if frame == self.frame: return
+        if self.frame is not None:
+            self.time_pstat.set_level(self.spent * 1000.0)
+            self.queue_pstat.set_level(self.deferred)
+            self.processed_pstat.set_level(self.processed)
+        self.frame = frame
+        self.spent = 0.0
+        self.processed = 0
+        self.deferred = 0
+        self.splits = []
+        self.merges = []
+        self.shapes = {}
+
+    def has_budget(self):
+        return self.processed == 0 or self.spent * 1000.0 < settings.lod_frame_budget
+
+    def run(self, operation, *args):
+        """
+        Run the operation if there is still time left in the current frame, return False if it was deferred.
+        """
+        if not self.has_budget():
+            self.deferred += 1
+            return False
+        start = self.clock.get_real_time()
+        operation(*args)
+        self.spent += self.clock.get_real_time() - start
+        self.processed += 1
+        return True
+
+    def defer(self, count):
+        self.deferred += count
+
+    def add_operations(self, shape, to_split, to_merge):
+        self.start_frame()
+        self.splits += [(node.apparent_size / node.density, shape, node) for node in to_split]
+        self.merges += [(node.apparent_size / node.density, shape, node) for node in to_merge]
+        self.shapes[shape] = True
+
+    def process(self):
+        """
+        Do the registered split and merge operations of the current frame within the budget.
+        """
+        self.start_frame()
+        splits = sorted(self.splits, key=lambda x: x[0], reverse=True)
+        merges = sorted(self.merges, key=lambda x: x[0])
+        shapes = self.shapes
+        self.splits = []
+        self.merges = []
+        self.shapes = {}
+        for (i, (error, shape, node)) in enumerate(splits):
+            if shape.instance is None: continue
+            if not self.run(shape.do_split, node.patch):
+                self.defer(len(splits) - i - 1)
+                break
+        for (i, (error, shape, node)) in enumerate(merges):
+            if shape.instance is None: continue
+            if not self.run(shape.do_merge, node.patch):
+                self.defer(len(merges) - i - 1)
+                break
+        for shape in shapes:
+            if shape.instance is None: continue
+            shape.apply_lod_operations()
+
+lodScheduler = LodScheduler()
@@ -0,0 +1,334 @@
+#
+#This file is part of Cosmonium.
+#
+#Copyright (C) 2018-2022 Laurent Deru.
+#
+#Cosmonium is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#Cosmonium is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with Cosmonium.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+
+import numpy
+
+class SortedNameRun(object):
+    """
+    Names sorted in arrays, with their value and their rank, lower is better.
+
+    To find the best ranked names of a prefix without ranking the whole range, the run can be completed
+    by levels holding only its best ranked entries, each level being level_factor times smaller than the previous one.
+
+    The substring search uses an index of the trigrams of the names, each trigram is packed in an integer
+    using the alphabet of the names and points to the sorted positions of the names containing it.
+    The end of a name is indexed as a character so that the two last characters of a name also form a trigram,
+    a two characters text is then found in the range of the trigrams it starts.
+    """
+    level_factor = 8
+    min_level_size = 256
+    max_key = '\U0010ffff'
+    separator = 10
+
+    def __init__(self):
+        self.keys = numpy.empty(0, dtype=object)
+        self.values = numpy.empty(0, dtype=object)
+        self.ranks = numpy.empty(0, dtype=numpy.float32)
+        self.levels = []
+        self.alphabet = None
+        self.grams = None
+        self.gram_starts = None
+        self.gram_positions = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def merge(self, keys, values, ranks, removed):
+        """
+        Merge the given sorted and unique entries, they replace the existing entries with the same name.
+        The removed entries are dropped from the run.
+        """
+        kept = numpy.ones(len(self.keys), dtype=bool)
+        if len(keys) > 0 and len(self.keys) > 0:
+            positions = numpy.searchsorted(self.keys, keys)
+            existing = positions < len(self.keys)
+            existing[existing] = self.keys[positions[existing]] == keys[existing]
+            kept[positions[existing]] = False
+        for ((key, value_id), value) in removed.items():
+            position = numpy.searchsorted(self.keys, key)
+            while position < len(self.keys) and self.keys[position] == key:
+                if self.values[position] is value:
+                    kept[position] = False
+                position += 1
+        self.keys = self.keys[kept]
+        self.values = self.values[kept]
+        self.ranks = self.ranks[kept]
+        if len(keys) > 0:
+            positions = numpy.searchsorted(self.keys, keys)
+            self.keys = numpy.insert(self.keys, positions, keys)
+            self.values = numpy.insert(self.values, positions, values)
+            self.ranks = numpy.insert(self.ranks, positions, ranks)
+        self.grams = None
+
+    def build_levels(self):
+        self.levels = []
+        previous_size = len(self.ranks)
+        size = previous_size // self.level_factor
+        while size >= self.min_level_size:
+            threshold = numpy.partition(self.ranks, size - 1)[size - 1]
+            level = numpy.flatnonzero(self.ranks <= threshold)
+            # Too many ties
+            if len(level) >= previous_size: break
+            self.levels.append(level)
+            previous_size = len(level)
+            size //= self.level_factor
+        self.build_grams()
+
+    def build_grams(self):
+        blob = '\n'.join(self.keys.tolist()) + '\n'
+        codes = numpy.frombuffer(blob.encode('utf-32-le'), dtype=numpy.uint32)
+        # Pack the characters of the names in a dense alphabet
+        present = numpy.bincount(codes, minlength=self.separator + 1) > 0
+        present[self.separator] = False
+        self.alphabet = numpy.flatnonzero(present)
+        alphabet_size = len(self.alphabet) + 1
+        chars = (numpy.cumsum(present) * present).astype(numpy.uint64)[codes]
+        ends = chars == 0
+        names = numpy.cumsum(ends, dtype=numpy.int64) - ends
+        grams = (chars[:-2] * alphabet_size + chars[1:-1]) * alphabet_size + chars[2:]
+        valid = ~ends[:-2] & ~ends[1:-1]
+        grams = grams[valid]
+        names = names[:-2][valid]
+        name_bits = max(int(len(self.keys)).bit_length(), 1)
+        if alphabet_size ** 3 < 1 << (64 - name_bits):
+            # Sorting the trigrams and the names packed together is much faster than an indirect sort
+            entries = numpy.sort((grams << numpy.uint64(name_bits)) | names.astype(numpy.uint64))
+            grams = entries >> numpy.uint64(name_bits)
+            names = entries & numpy.uint64((1 << name_bits) - 1)
+        else:
+            order = numpy.argsort(grams, kind='stable')
+            grams = grams[order]
+            names = names[order]
+        first = numpy.ones(len(grams), dtype=bool)
+        first[1:] = grams[1:] != grams[:-1]
+        unique = first.copy()
+        unique[1:] |= names[1:] != names[:-1]
+        first = first[unique]
+        self.gram_positions = names[unique].astype(numpy.uint32)
+        self.grams = grams[unique][first]
+        self.gram_starts = numpy.append(numpy.flatnonzero(first), len(self.gram_positions))
+
+    def find(self, key, value):
+        position = numpy.searchsorted(self.keys, key)
+        return position < len(self.keys) and self.keys[position] == key and self.values[position] is value
+
+    def prefix_range(self, text):
+        return numpy.searchsorted(self.keys, [text, text + self.max_key])
+
+    def best_positions(self, start, end, count):
+        """
+        Return the positions of the count best ranked entries between start and end, best first.
+        The sparsest level holding at least count entries of the range contains all the best ones.
+        """
+        candidates = None
+        if count is not None and end - start > count:
+            for level in reversed(self.levels):
+                (level_start, level_end) = numpy.searchsorted(level, [start, end])
+                if level_end - level_start >= count:
+                    candidates = level[level_start:level_end]
+                    break
+        if candidates is None:
+            candidates = numpy.arange(start, end)
+        return self.sort_positions(candidates, count)
+
+    def sort_positions(self, candidates, count):
+        """
+        Sort the given positions by rank and keep the count best ones, the ties are kept in the order of the names.
+        """
+        ranks = self.ranks[candidates]
+        if count is not None and len(candidates) > count:
+            threshold = numpy.partition(ranks, count - 1)[count - 1]
+            better = numpy.flatnonzero(ranks < threshold)
+            ties = numpy.flatnonzero(ranks == threshold)[:count - len(better)]
+            selected = numpy.concatenate((better, ties))
+            candidates = candidates[selected]
+            ranks = ranks[selected]
+        return candidates[numpy.lexsort((candidates, ranks))]
+
+    def startswith(self, text, count):
+        (start, end) = self.prefix_range(text)
+        return self.best_positions(start, end, count)
+
+    def gram_range(self, start, end):
+        (first, last) = numpy.searchsorted(self.grams, [start, end])
+        return self.gram_positions[self.gram_starts[first]:self.gram_starts[last]]
+
+    def contains(self, text, count):
+        """
+        Search the names containing text in the trigrams index.
+        """
+        if self.grams is None:
+            self.build_grams()
+        if len(text) < 2:
+            candidates = numpy.flatnonzero([text in key for key in self.keys.tolist()])
+            return self.sort_positions(candidates, count)
+        codes = [ord(c) for c in text]
+        chars = numpy.searchsorted(self.alphabet, codes)
+        if numpy.any(chars >= len(self.alphabet)) or numpy.any(self.alphabet[numpy.minimum(chars, len(self.alphabet) - 1)] != codes):
+            return numpy.empty(0, dtype=numpy.int64)
+        chars = (chars + 1).tolist()
+        alphabet_size = len(self.alphabet) + 1
+        if len(chars) == 2:
+            start = (chars[0] * alphabet_size + chars[1]) * alphabet_size
+            found = numpy.zeros(len(self.keys), dtype=bool)
+            found[self.gram_range(start, start + alphabet_size)] = True
+            candidates = numpy.flatnonzero(found)
+            return self.sort_positions(candidates, count)
+        sets = []
+        for i in range(len(chars) - 2):
+            gram = (chars[i] * alphabet_size + chars[i + 1]) * alphabet_size + chars[i + 2]
+            sets.append(self.gram_range(gram, gram + 1))
+        sets.sort(key=len)
+        candidates = sets[0]
+        for positions in sets[1:]:
+            if len(candidates) == 0: break
+            candidates = numpy.intersect1d(candidates, positions, assume_unique=True)
+        if len(chars) > 3:
+            # The trigrams can be found at other places in the name
+            candidates = candidates[[text in key for key in self.keys[candidates].tolist()]]
+        return self.sort_positions(candidates, count)
+
+    def get_entries(self, positions):
+        return list(zip(self.ranks[positions].tolist(), self.keys[positions].tolist(), self.values[positions].tolist()))
+
+class NameIndex(object):
+    """
+    Index of upper-cased names, ranked by rank_function(value), used for the name completion.
+
+    The entries are kept in a large sorted run and a small sorted run. The new entries are only sorted and merged
+    in the small run at the next search, and the small run is merged in the large one once it grows beyond
+    1 / level_factor of its size. The rank of the entries is evaluated when they are merged.
+    The removed entries are skipped during the searches and dropped when the large run is merged.
+    """
+    merge_size = 20000
+
+    def __init__(self, rank_function=None):
+        self.rank_function = rank_function
+        self.main = SortedNameRun()
+        self.recent = SortedNameRun()
+        self.pending_keys = []
+        self.pending_values = []
+        self.removed = {}
+
+    def __len__(self):
+        return len(self.main) + len(self.recent) + len(self.pending_keys) - len(self.removed)
+
+    def add(self, key, value):
+        self.removed.pop((key, id(value)), None)
+        self.pending_keys.append(key)
+        self.pending_values.append(value)
+
+    def add_many(self, keys, values, ranks=None):
+        """
+        Add the given entries and merge them immediately in the large run.
+        """
+        self.flush()
+        if len(self.removed) > 0:
+            # As with add(), the given entries are no longer removed
+            for (key, value) in zip(keys, values):
+                self.removed.pop((key, id(value)), None)
+        entries = self.sort_entries(keys, values, ranks)
+        self.recent.merge(*self.sort_entries([], []), self.removed)
+        self.main.merge(*entries, self.removed)
+        self.removed = {}
+        self.main.build_levels()
+
+    def remove(self, key, value):
+        self.removed[(key, id(value))] = value
+
+    def get_ranks(self, values):
+        if self.rank_function is None:
+            return numpy.zeros(len(values), dtype=numpy.float32)
+        return numpy.array([self.rank_function(value) for value in values], dtype=numpy.float32)
+
+    def sort_entries(self, keys, values, ranks=None):
+        """
+        Sort the entries by name, only the last entry of each name is kept.
+        """
+        last = dict(zip(keys, range(len(keys))))
+        sorted_keys = sorted(last)
+        indices = numpy.array([last[key] for key in sorted_keys], dtype=numpy.int64)
+        keys_array = numpy.empty(len(sorted_keys), dtype=object)
+        keys_array[:] = sorted_keys
+        values_array = numpy.empty(len(values), dtype=object)
+        values_array[:] = values
+        values_array = values_array[indices]
+        if ranks is not None:
+            ranks = numpy.asarray(ranks, dtype=numpy.float32)[indices]
+        else:
+            ranks = self.get_ranks(values_array)
+        return (keys_array, values_array, ranks)
+
+    def flush(self):
+        if len(self.pending_keys) == 0: return
+        keys = self.pending_keys
+        values = self.pending_values
+        if len(self.removed) > 0:
+            # The merges only drop the removed entries of the runs, the pending ones are dropped here
+            kept = [(key, id(value)) not in self.removed for (key, value) in zip(keys, values)]
+            for (key, value, keep) in zip(keys, values, kept):
+                if not keep and not self.main.find(key, value) and not self.recent.find(key, value):
+                    self.removed.pop((key, id(value)), None)
+            keys = [key for (key, keep) in zip(keys, kept) if keep]
+            values = [value for (value, keep) in zip(values, kept) if keep]
+        entries = self.sort_entries(keys, values)
+        self.pending_keys = []
+        self.pending_values = []
+        if len(self.recent) + len(entries[0]) > max(self.merge_size, len(self.main) // SortedNameRun.level_factor):
+            self.recent.merge(*entries, self.removed)
+            self.main.merge(self.recent.keys, self.recent.values, self.recent.ranks, self.removed)
+            self.main.build_levels()
+            self.recent = SortedNameRun()
+            self.removed = {}
+        else:
+            self.recent.merge(*entries, {})
+
+    def collect(self, entries, count):
+        entries.sort(key=lambda x: x[0])
+        result = []
+        seen = set()
+        for entry in entries:
+            (rank, key, value) = entry
+            if key in seen: continue
+            if len(self.removed) > 0 and (key, id(value)) in self.removed: continue
+            seen.add(key)
+            result.append(entry)
+            if count is not None and len(result) >= count: break
+        return result
+
+    def startswith(self, text, count=None):
+        """
+        Return the (rank, key, value) of the entries whose key starts with text, the best ranked first.
+        """
+        self.flush()
+        fetch = count + len(self.removed) if count is not None else None
+        entries = self.recent.get_entries(self.recent.startswith(text, fetch))
+        entries += self.main.get_entries(self.main.startswith(text, fetch))
+        return self.collect(entries, count)
+
+    def contains(self, text, count=None):
+        """
+        Return the (rank, key, value) of the entries whose key contains text, the best ranked first.
+        """
+        self.flush()
+        fetch = count + len(self.removed) if count is not None else None
+        entries = self.recent.get_entries(self.recent.contains(text, fetch))
+        entries += self.main.get_entries(self.main.contains(text, fetch))
+        return self.collect(entries, count)
@@ -18,10 +18,10 @@
 #
 
 
-from panda3d.core import TextureStage, Texture, TexGenAttrib, GeomVertexRewriter
-from panda3d.core import GeomVertexArrayFormat, InternalName, GeomVertexFormat, GeomVertexData, GeomVertexWriter, OmniBoundingVolume
+from panda3d.core import TextureStage, Texture, TexGenAttrib
+from panda3d.core import GeomVertexArrayFormat, InternalName, GeomVertexFormat, GeomVertexData, OmniBoundingVolume
 from panda3d.core import GeomPoints, Geom, GeomNode
-from panda3d.core import LVecBase3, LPoint3d, LPoint3, LColor, LVector3d
+from panda3d.core import LVecBase3, LColor, LVector3d
 from panda3d.core import NodePath, StackedPerlinNoise3
 from panda3d.core import ShaderAttrib
 
@@ -43,8 +43,10 @@ from ..parameters import AutoUserParameter, UserParameter
 from ..astro import units
 from .. import settings
 
-from math import cos, sin, pi, log, tan, tanh, sqrt, exp, atan, atanh
-from random import random, gauss, choice, seed
+from math import pi, tan, sqrt
+from random import getrandbits
+from zlib import crc32
+import numpy
 
 
 class Galaxy(DeepSpaceObject):
@@ -139,11 +141,13 @@ class GalaxyAppearance(AppearanceBase):
                 ]
 
 class GalaxyShapeBase(Shape):
+    # Generated points, colors, sizes and size of the shapes, indexed by shape id
+    points_cache = {}
     templates = {}
     def __init__(self, radius=1.0, scale=None):
         Shape.__init__(self)
         self.radius = radius
-        self.seed = random()
+        self.seed = getrandbits(32)
         if scale is None:
             self.radius = radius
             self.scale = LVecBase3(self.radius, self.radius, self.radius)
@@ -156,6 +160,9 @@ class GalaxyShapeBase(Shape):
         self.blue_color = srgb_to_linear((102.0 / 255, 153.0 / 255, 255.0 / 255, 1.0))
 
     def shape_id(self):
+        """
+        Identifier of the generated points, the shapes with the same id share the same points.
+        """
         return ''
 
     def get_apparent_radius(self):
@@ -167,9 +174,25 @@ class GalaxyShapeBase(Shape):
     def is_flat(self):
         return False
 
-    def create_points(self, radius=1.0):
+    def create_points(self, rng, radius=1.0):
+        """
+        Generate the points of the galaxy using the given NumPy random generator, return the points, colors and
+        sizes arrays.
+        """
         return None
 
+    def get_points(self):
+        shape_id = self.shape_id()
+        entry = GalaxyShapeBase.points_cache.get(shape_id)
+        if entry is None:
+            rng = numpy.random.default_rng(crc32(shape_id.encode()))
+            points, colors, sizes = self.create_points(rng)
+            entry = (points, colors, sizes, self.size)
+            GalaxyShapeBase.points_cache[shape_id] = entry
+        else:
+            points, colors, sizes, self.size = entry
+        return (points, colors, sizes)
+
     def shape_done(self):
         # Indicates that the attached shader also contro the size of the rendered points
         attrib = self.instance.getAttrib(ShaderAttrib)
@@ -180,30 +203,31 @@ class GalaxyShapeBase(Shape):
         self.instance.node().setBounds(OmniBoundingVolume())
         self.instance.node().setFinal(True)
 
+    def create_template(self, points, colors, sizes):
+        gnode = GeomNode('galaxy')
+        gnode.addGeom(self.makeGeom(points, colors, sizes))
+        return NodePath(gnode)
+
     async def create_instance(self):
         shape_id = self.shape_id()
-        if shape_id in GalaxyShapeBase.templates:
-            template =  GalaxyShapeBase.templates[shape_id]
-        else:
-            seed(self.seed)
-            self.gnode = GeomNode('galaxy')
-            self.geom = self.makeGeom(*self.create_points())
-            self.gnode.addGeom(self.geom)
-            template = NodePath(self.gnode)
-            # Disable caching
-            #GalaxyShapeBase.templates[shape_id] = template
+        points, colors, sizes = self.get_points()
+        template = GalaxyShapeBase.templates.get(shape_id)
+        if template is None:
+            template = self.create_template(points, colors, sizes)
+            GalaxyShapeBase.templates[shape_id] = template
         self.instance = NodePath('galaxy')
         template.instanceTo(self.instance)
         self.apply()
-        self.update_geom(*self.create_points())
         return self.instance
 
     def update_shape(self):
-        seed(self.seed)
-        self.update_geom(*self.create_points())
+        # The template is shared with the other galaxies of the same shape, replace it with a new geometry
+        rng = numpy.random.default_rng(self.seed)
+        template = self.create_template(*self.create_points(rng))
+        self.instance.node().remove_all_children()
+        template.instanceTo(self.instance)
 
     def makeGeom(self, points, colors, sizes):
-        #format = GeomVertexFormat.getV3c4()
         array = GeomVertexArrayFormat()
         array.addColumn(InternalName.get_vertex(), 3, Geom.NTFloat32, Geom.CPoint)
         array.addColumn(InternalName.get_color(), 4, Geom.NTFloat32, Geom.CColor)
@@ -212,35 +236,34 @@ class GalaxyShapeBase(Shape):
         format.addArray(array)
         format = GeomVertexFormat.registerFormat(format)
         vdata = GeomVertexData('vdata', format, Geom.UH_static)
-        vdata.unclean_set_num_rows(len(points))
-        self.vwriter = GeomVertexWriter(vdata, InternalName.get_vertex())
-        self.colorwriter = GeomVertexWriter(vdata, InternalName.get_color())
-        self.sizewriter = GeomVertexWriter(vdata, InternalName.get_size())
         geompoints = GeomPoints(Geom.UH_static)
-        geompoints.reserve_num_vertices(len(points))
-        index = 0
-        for (point, color, size) in zip(points, colors, sizes):
-            self.vwriter.addData3f(*point)
-            self.colorwriter.addData4f(*color)
-            self.sizewriter.addData1f(size)
-            geompoints.addVertex(index)
-            #geompoints.closePrimitive()
-            index += 1
         geom = Geom(vdata)
         geom.addPrimitive(geompoints)
+        self.fill_geom(geom, points, colors, sizes)
         return geom
 
-    def update_geom(self, points, colors, sizes):
-        geom = self.instance.children[0].node().modify_geom(0)
+    def fill_geom(self, geom, points, colors, sizes):
+        count = len(points)
         vdata = geom.modify_vertex_data()
-        vdata.unclean_set_num_rows(len(points))
-        vwriter = GeomVertexRewriter(vdata, InternalName.get_vertex())
-        colorwriter = GeomVertexWriter(vdata, InternalName.get_color())
-        sizewriter = GeomVertexWriter(vdata, InternalName.get_size())
-        for (point, color, size) in zip(points, colors, sizes):
-            vwriter.addData3f(*point)
-            colorwriter.addData4f(*color)
-            sizewriter.addData1f(size)
+        array_data = vdata.modify_array(0)
+        array_data.unclean_set_num_rows(count)
+        if count > 0:
+            array_format = array_data.get_array_format()
+            view = memoryview(array_data).cast('B')
+            data = numpy.frombuffer(view, dtype=numpy.float32).reshape(count, array_format.get_stride() // 4)
+            vertex_start = array_format.get_column(InternalName.get_vertex()).get_start() // 4
+            color_start = array_format.get_column(InternalName.get_color()).get_start() // 4
+            size_start = array_format.get_column(InternalName.get_size()).get_start() // 4
+            data[:, vertex_start:vertex_start + 3] = points
+            data[:, color_start:color_start + 4] = colors
+            data[:, size_start] = sizes
+            del data
+            view.release()
+        geompoints = geom.modify_primitive(0)
+        geompoints.set_nonindexed_vertices(0, count)
+
+    def create_sizes(self, rng, count, sprite_size, sigma):
+        return sprite_size + rng.normal(0.0, sigma, count)
 
 class EllipticalGalaxyShape(GalaxyShapeBase):
     def __init__(self, factor, radius=1.0, scale=None, nb_points=4000, spread=0.4, zspread=0.2, sprite_size=400, sersic=4.0):
@@ -254,29 +277,16 @@ class EllipticalGalaxyShape(GalaxyShapeBase):
         self.color = self.yellow_color
 
     def shape_id(self):
-        return 'elliptical-%g' % self.factor
+        return 'elliptical-%g-%d-%g-%g-%g-%g' % (self.factor, self.nb_points, self.spread, self.zspread, self.sprite_size, self.sersic)
 
-    def create_points(self, radius=1.0):
-        points = []
-        colors = []
-        sizes = []
+    def create_points(self, rng, radius=1.0):
         nb_points = self.nb_points
-        sprite_size = self.sprite_size
-        half_sprite_size = self.sprite_size / 2.0
-        color = self.color
-        spread = self.spread
-        spreadf = self.spread * self.factor
-        zspreadf = self.zspread * self.factor
-        sersic_inv = 1. / self.sersic
-        for i in range(nb_points):
-            x = gauss(0.0, spread)
-            y = gauss(0.0, spreadf)
-            z = gauss(0.0, zspreadf)
-            point = LPoint3d(x * radius, y * radius, z * radius)
-            points.append(point)
-            colors.append(color * (0.9 - pow(point.length(), sersic_inv)))
-            size = sprite_size + gauss(0, half_sprite_size)
-            sizes.append(size)
+        spread = (self.spread, self.spread * self.factor, self.zspread * self.factor)
+        color = numpy.array(tuple(self.color), dtype=numpy.float64)
+        points = rng.normal(0.0, spread, (nb_points, 3)) * radius
+        distances = numpy.sqrt(numpy.einsum('ij,ij->i', points, points))
+        colors = color * (0.9 - numpy.power(distances, 1. / self.sersic))[:, numpy.newaxis]
+        sizes = self.create_sizes(rng, nb_points, self.sprite_size, self.sprite_size / 2.0)
         return (points, colors, sizes)
 
     def get_user_parameters(self):
@@ -301,34 +311,31 @@ class IrregularGalaxyShape(GalaxyShapeBase):
         self.color2 = self.blue_color
 
     def shape_id(self):
-        return 'irregular'
+        return 'irregular-%d-%g-%g-%g-%g' % (self.nb_points, self.spread, self.zspread, self.sprite_size, self.sersic)
 
-    def create_points(self, radius=1.0):
+    def create_points(self, rng, radius=1.0):
         if IrregularGalaxyShape.noise is None:
             IrregularGalaxyShape.noise = StackedPerlinNoise3(1, 1, 1, 8, 4, 0.7)
-        points = []
-        colors = []
-        sizes = []
+        noise = self.noise
         nb_points = self.nb_points
-        sprite_size = self.sprite_size
-        colors_list = [self.color1, self.color2]
-        spread = self.spread
-        zspread = self.zspread
-        sersic_inv = 1. / self.sersic
+        spread = (self.spread, self.spread, self.zspread)
+        selected = []
         count = 0
+        # Only the points where the noise is low are kept, draw the candidates by batches until there are enough
         while count < nb_points:
-            p = LPoint3(gauss(0.0, spread), gauss(0.0, spread), gauss(0.0, zspread))
-            value = self.noise(p) * 0.5 + 0.5
-            if value < 0.5:
-                points.append(p * radius)
-                color = choice(colors_list)
-                color = color * (1 - 0.9 * pow(p.length(), sersic_inv))
-                color[3] = 1.0
-                colors.append(color)
-                size = sprite_size + gauss(0, sprite_size)
-                sizes.append(size)
-                count += 1
-        return (points, colors, sizes)
+            candidates = rng.normal(0.0, spread, (max(2 * (nb_points - count), 16), 3))
+            values = numpy.array([noise(x, y, z) for (x, y, z) in candidates.tolist()]) * 0.5 + 0.5
+            candidates = candidates[values < 0.5][:nb_points - count]
+            selected.append(candidates)
+            count += len(candidates)
+        points = numpy.concatenate(selected)
+        distances = numpy.sqrt(numpy.einsum('ij,ij->i', points, points))
+        colors_list = numpy.array([tuple(self.color1), tuple(self.color2)], dtype=numpy.float64)
+        colors = colors_list[rng.integers(0, 2, nb_points)]
+        colors *= (1 - 0.9 * numpy.power(distances, 1. / self.sersic))[:, numpy.newaxis]
+        colors[:, 3] = 1.0
+        sizes = self.create_sizes(rng, nb_points, self.sprite_size, self.sprite_size)
+        return (points * radius, colors, sizes)
 
     def get_user_parameters(self):
         return [
@@ -354,96 +361,82 @@ class SpiralGalaxyShapeBase(GalaxyShapeBase):
         self.bulge_color = self.yellow_color
         self.arms_color = self.blue_color
 
+    def parameters_id(self):
+        return '%d-%d-%g-%g-%g-%g-%g-%g' % (self.nb_points_bulge, self.nb_points_arms, self.spread, self.zspread,
+                                            self.sprite_size, self.max_angle, self.sersic_bulge, self.sersic_disk)
+
     def is_flat(self):
         return True
 
-    def create_bulge(self, count, radius, spread, zspread, points, colors, sizes):
-        sprite_size = self.sprite_size
-        bulge_color = self.bulge_color
-        sersic_inv = 1. / self.sersic_bulge
-        for i in range(count):
-            x = gauss(0.0, spread)
-            y = gauss(0.0, spread)
-            z = gauss(0.0, zspread)
-            point = LPoint3d(x * radius, y * radius, z * radius)
-            points.append(point)
-            color = bulge_color * (1 - pow(point.length(), sersic_inv)) * 2
-            color[3] = 1.0
-            colors.append(color)
-            size = sprite_size + gauss(0, sprite_size)
-            sizes.append(size)
-
-    def create_spiral(self, count,radius, spread, zspread, points, colors, sizes):
-        func = self.shape_func
-        sprite_size = self.sprite_size
-        arm_color = self.arms_color
-        sersic_inv = 1. / self.sersic_disk
-        distance = 0
-        for i in (-1.0, 1.0):
-            for c in range(count):
-                t = sqrt(random())
-                angle = t * self.max_angle
-                shape = func(angle)
-                x = i * cos(angle) * shape + gauss(0.0, spread)
-                y = i * sin(angle) * shape + gauss(0.0, spread)
-                z = gauss(0.0, zspread)
-                point = LPoint3d(x * radius, y * radius, z * radius)
-                points.append(point)
-                distance = max(distance, point.length())
-                color = arm_color * (1 - 0.9 * pow(distance, sersic_inv))
-                color[3] = 1.0
-                colors.append(color)
-                size = sprite_size + gauss(0, sprite_size)
-                sizes.append(size)
-        self.size = distance
-
-    def create_spiral_distance(self, count, radius, spread, zspread, points, colors, sizes):
-        sprite_size = self.sprite_size
-        arm_color = self.arms_color
-        disk_color = self.bulge_color
+    def create_bulge(self, rng, count, radius, spread, zspread):
+        bulge_color = numpy.array(tuple(self.bulge_color), dtype=numpy.float64)
+        points = rng.normal(0.0, numpy.abs((spread, spread, zspread)), (count, 3)) * radius
+        distances = numpy.sqrt(numpy.einsum('ij,ij->i', points, points))
+        colors = bulge_color * ((1 - numpy.power(distances, 1. / self.sersic_bulge)) * 2)[:, numpy.newaxis]
+        colors[:, 3] = 1.0
+        sizes = self.create_sizes(rng, count, self.sprite_size, self.sprite_size)
+        return (points, colors, sizes)
+
+    def create_spiral(self, rng, count, radius, spread, zspread):
+        arm_color = numpy.array(tuple(self.arms_color), dtype=numpy.float64)
+        t = numpy.sqrt(rng.random(count * 2))
+        angles = t * self.max_angle
+        shapes = self.shape_func(angles)
+        # The first half of the points are in the first arm, the other half in the opposite arm
+        signs = numpy.repeat((-1.0, 1.0), count)
+        points = numpy.empty((count * 2, 3))
+        points[:, 0] = signs * numpy.cos(angles) * shapes + rng.normal(0.0, spread, count * 2)
+        points[:, 1] = signs * numpy.sin(angles) * shapes + rng.normal(0.0, spread, count * 2)
+        points[:, 2] = rng.normal(0.0, zspread, count * 2)
+        points *= radius
+        # The color depends on the farthest distance reached by the previous points
+        distances = numpy.maximum.accumulate(numpy.sqrt(numpy.einsum('ij,ij->i', points, points)))
+        colors = arm_color * (1 - 0.9 * numpy.power(distances, 1. / self.sersic_disk))[:, numpy.newaxis]
+        colors[:, 3] = 1.0
+        sizes = self.create_sizes(rng, count * 2, self.sprite_size, self.sprite_size)
+        self.size = distances.max()
+        return (points, colors, sizes)
+
+    def create_spiral_distance(self, rng, count, radius, spread, zspread):
+        arm_color = numpy.array(tuple(self.arms_color), dtype=numpy.float64)
+        disk_color = numpy.array(tuple(self.bulge_color), dtype=numpy.float64)
         bulge_size = self.bulge_size()
-        sersic_inv = 1. / self.sersic_disk
-        distance = 0
-        for c in range(count * 2):
-            r = sqrt(random() + bulge_size*bulge_size)
-            theta = random() * 2 * pi
-            x = r * cos(theta)
-            y = r * sin(theta)
-            z = gauss(0.0, zspread)
-            coef = 0.0
-            for c in (0, 1.):
-                arm_angle = self.inv_shape_func(r) * max(self.max_angle, 0.001) / (2 * pi)
-                mtheta = c * pi + theta
-                delta = abs(mtheta - arm_angle)
-                for i in range(int(self.max_angle / (2 * pi)) + 1):
-                    delta = min(delta, abs(mtheta - arm_angle - (i + 1) * 2 * pi), abs(mtheta - arm_angle + (i  + 1) * 2 * pi))
-                coef = max(pow(max(1 - delta / pi, 0.0), self.arm_spread), coef)
-            point = LPoint3d(x * radius, y * radius, z * radius)
-            points.append(point)
-            distance = max(distance, point.length())
-            color = disk_color * (1 - coef) + arm_color * coef
-            color = color * (1 - 0.9 * pow(r, sersic_inv))
-            color[3] = 1.0
-            colors.append(color)
-            size = sprite_size + gauss(0, sprite_size)
-            sizes.append(size)
-        self.size = distance
-
-    def create_points(self, radius=1.0):
-        points = []
-        colors = []
-        sizes = []
+        r = numpy.sqrt(rng.random(count * 2) + bulge_size * bulge_size)
+        theta = rng.random(count * 2) * 2 * pi
+        points = numpy.empty((count * 2, 3))
+        points[:, 0] = r * numpy.cos(theta)
+        points[:, 1] = r * numpy.sin(theta)
+        points[:, 2] = rng.normal(0.0, zspread, count * 2)
+        points *= radius
+        arm_angle = self.inv_shape_func(r) * max(self.max_angle, 0.001) / (2 * pi)
+        coef = numpy.zeros(count * 2)
+        for c in (0, 1.):
+            mtheta = c * pi + theta
+            delta = numpy.abs(mtheta - arm_angle)
+            for i in range(int(self.max_angle / (2 * pi)) + 1):
+                delta = numpy.minimum(delta, numpy.minimum(numpy.abs(mtheta - arm_angle - (i + 1) * 2 * pi),
+                                                           numpy.abs(mtheta - arm_angle + (i  + 1) * 2 * pi)))
+            coef = numpy.maximum(numpy.power(numpy.maximum(1 - delta / pi, 0.0), self.arm_spread), coef)
+        coef = coef[:, numpy.newaxis]
+        colors = disk_color * (1 - coef) + arm_color * coef
+        colors *= (1 - 0.9 * numpy.power(r, 1. / self.sersic_disk))[:, numpy.newaxis]
+        colors[:, 3] = 1.0
+        sizes = self.create_sizes(rng, count * 2, self.sprite_size, self.sprite_size)
+        self.size = numpy.sqrt(numpy.einsum('ij,ij->i', points, points)).max()
+        return (points, colors, sizes)
+
+    def create_disk(self, rng, count, radius, spread, zspread):
+        return self.create_spiral_distance(rng, count, radius, spread, zspread)
+
+    def create_points(self, rng, radius=1.0):
         nb_points_bulge = self.nb_points_bulge
         nb_points_arms = self.nb_points_arms
         spread = self.bulge_size() / 2
         zspread = spread / 2.0
-        self.create_bulge(nb_points_bulge, radius, spread, zspread, points, colors, sizes)
-        if True:
-            self.create_spiral_distance(nb_points_arms, radius, self.spread, self.zspread, points, colors, sizes)
-        else:
-            self.create_spiral(nb_points_arms, radius, self.spread, self.zspread, points, colors, sizes)
+        bulge = self.create_bulge(rng, nb_points_bulge, radius, spread, zspread)
+        disk = self.create_disk(rng, nb_points_arms, radius, self.spread, self.zspread)
         self.nb_points = nb_points_bulge + nb_points_arms
-        return (points, colors, sizes)
+        return tuple(numpy.concatenate(arrays) for arrays in zip(bulge, disk))
 
     def get_user_parameters(self):
         return [
@@ -463,16 +456,16 @@ class FullSpiralGalaxyShape(SpiralGalaxyShapeBase):
         self.B = B
 
     def shape_id(self):
-        return 'spiral-%g-%g' % (self.N, self.B)
+        return 'spiral-%g-%g-%s' % (self.N, self.B, self.parameters_id())
 
     def bulge_size(self):
         return 2 * self.shape_func(0)
 
     def shape_func(self, angle):
-        return 1.0 / log(self.B * max(0.00001, tan(angle / (2 * self.N))))
+        return 1.0 / numpy.log(self.B * numpy.maximum(0.00001, numpy.tan(angle / (2 * self.N))))
 
     def inv_shape_func(self, distance):
-        return atan(exp(1.0 / distance) / self.B) * 2 * self.N
+        return numpy.arctan(numpy.exp(1.0 / distance) / self.B) * 2 * self.N
 
     def get_user_parameters(self):
         params = SpiralGalaxyShapeBase.get_user_parameters(self)
@@ -488,16 +481,16 @@ class FullRingGalaxyShape(SpiralGalaxyShapeBase):
         self.B = B
 
     def shape_id(self):
-        return 'ring-%g-%g' % (self.N, self.B)
+        return 'ring-%g-%g-%s' % (self.N, self.B, self.parameters_id())
 
     def bulge_size(self):
         return 2 * self.shape_func(0)
 
     def shape_func(self, angle):
-        return 1.0 / log(self.B * max(0.00001, tanh(angle / (2 * self.N))))
+        return 1.0 / numpy.log(self.B * numpy.maximum(0.00001, numpy.tanh(angle / (2 * self.N))))
 
     def inv_shape_func(self, distance):
-        return atanh(exp(1.0 / distance) / self.B) * 2 * self.N
+        return numpy.arctanh(numpy.exp(1.0 / distance) / self.B) * 2 * self.N
 
     def get_user_parameters(self):
         params = SpiralGalaxyShapeBase.get_user_parameters(self)
@@ -526,18 +519,18 @@ class SpiralGalaxyShape(SpiralGalaxyShapeBase):
         return self.max_angle * 180 / pi
 
     def shape_id(self):
-        return 'spiral-%g' % self.pitch
+        return 'spiral-%g-%g-%s' % (self.pitch, self.arm_spread, self.parameters_id())
 
     def bulge_size(self):
         return 2 * self.shape_func(0)
 
     def shape_func(self, angle):
         pitch = self.pitch
-        return self.bar_radius / (1 - pitch * tan(pitch) * log(max(0.00001, (angle / pitch))))
+        return self.bar_radius / (1 - pitch * tan(pitch) * numpy.log(numpy.maximum(0.00001, (angle / pitch))))
 
     def inv_shape_func(self, distance):
         pitch = self.pitch
-        return pitch * exp((1 - self.bar_radius / distance) / (pitch * tan(pitch)))
+        return pitch * numpy.exp((1 - self.bar_radius / distance) / (pitch * tan(pitch)))
 
     def get_user_parameters(self):
         params = SpiralGalaxyShapeBase.get_user_parameters(self)
@@ -551,28 +544,25 @@ class LenticularGalaxyShape(SpiralGalaxyShapeBase):
     bulge_radius = 0.2
 
     def shape_id(self):
-        return 'lenticular'
+        return 'lenticular-%s' % self.parameters_id()
 
     def bulge_size(self):
         return self.bulge_radius
 
-    def create_spiral(self, count, radius, spread, zspread, points, colors, sizes):
-        sprite_size = self.sprite_size
-        disk_color = self.yellow_color
-        sersic_inv = 1. / self.sersic_disk
-        for r in range(count * 2):
-            distance = self.bulge_radius + abs(gauss(0, (1 - self.bulge_radius)))
-            angle = random() * 2.0 * pi
-            x = distance * cos(angle) + gauss(0.0, spread)
-            y = distance * sin(angle) + gauss(0.0, spread)
-            z = gauss(0.0, zspread)
-            point = LPoint3d(x * radius, y * radius, z * radius)
-            points.append(point)
-            color = disk_color * (1 - 0.9 * pow(point, sersic_inv))
-            color[3] = 1.0
-            colors.append(color)
-            size = sprite_size + gauss(0, sprite_size)
-            sizes.append(size)
+    def create_disk(self, rng, count, radius, spread, zspread):
+        disk_color = numpy.array(tuple(self.yellow_color), dtype=numpy.float64)
+        distances = self.bulge_radius + numpy.abs(rng.normal(0, (1 - self.bulge_radius), count * 2))
+        angles = rng.random(count * 2) * 2.0 * pi
+        points = numpy.empty((count * 2, 3))
+        points[:, 0] = distances * numpy.cos(angles) + rng.normal(0.0, spread, count * 2)
+        points[:, 1] = distances * numpy.sin(angles) + rng.normal(0.0, spread, count * 2)
+        points[:, 2] = rng.normal(0.0, zspread, count * 2)
+        points *= radius
+        lengths = numpy.sqrt(numpy.einsum('ij,ij->i', points, points))
+        colors = disk_color * (1 - 0.9 * numpy.power(lengths, 1. / self.sersic_disk))[:, numpy.newaxis]
+        colors[:, 3] = 1.0
+        sizes = self.create_sizes(rng, count * 2, self.sprite_size, self.sprite_size)
+        return (points, colors, sizes)
 
 class GalaxyDataSource(DataSource):
     def __init__(self):
@@ -0,0 +1,413 @@
+#
+#This file is part of Cosmonium.
+#
+#Copyright (C) 2018-2022 Laurent Deru.
+#
+#Cosmonium is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#Cosmonium is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with Cosmonium.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+
+from panda3d.core import LPoint3d
+
+from .star import Star
+
+from ..astro.orbits import AbsoluteFixedPosition
+from ..astro.rotations import UnknownRotation
+from ..astro.frame import J2000BarycentricEclipticReferenceFrame
+from ..astro.astro import magnitude_brightness_ratio, app_to_abs_mag
+from ..astro.blackbody import temp_to_RGB
+from ..astro import units
+from ..catalogs import objectsDB
+from ..cache import create_path_for
+from ..engine.octree import PackedOctree
+from ..nameindex import NameIndex
+from ..pointsset import PointsSet
+from ..utils import srgb_to_linear
+from .. import settings
+
+from math import sqrt
+from sys import getsizeof
+import hashlib
+import numpy
+import os
+
+class StarTable(object):
+    """
+    Columnar storage of a star catalog.
+
+    The stars are only kept as NumPy arrays and drawn directly as points. The Star object, and its anchor,
+    is only created the first time the star is selected, resolved, needed as a light source or found by name.
+    """
+    light_source_limit = -10
+
+    def __init__(self, name, universe, catalog, positions, abs_magnitudes, spectral_indices, spectral_types, names, surface_factory):
+        self.name = name
+        self.universe = universe
+        self.catalog = catalog
+        self.positions = positions
+        self.abs_magnitudes = abs_magnitudes
+        self.spectral_indices = spectral_indices
+        self.spectral_types = spectral_types
+        self.names = names
+        self.surface_factory = surface_factory
+        self.radii = self.calc_radii()
+        self.octree = None
+        self.build_octree()
+        self.point_colors = numpy.array([srgb_to_linear(temp_to_RGB(spectral_type.temperature)) for spectral_type in spectral_types], dtype=numpy.float32).reshape(-1, 4)
+        self.catalog_order = numpy.argsort(self.catalog, kind='stable')
+        self.sorted_catalog = self.catalog[self.catalog_order]
+        self.name_index = {}
+        for cat_no, aliases in names.items():
+            for alias in aliases:
+                self.name_index[alias.upper()] = cat_no
+        self.name_search_index = self.create_name_search_index()
+        self.stars = {}
+        self.instanciated = numpy.zeros(len(catalog), dtype=bool)
+        self.removed = numpy.zeros(len(catalog), dtype=bool)
+        self.oid_start = objectsDB.reserve_oids(len(catalog), self)
+        self.frame = J2000BarycentricEclipticReferenceFrame()
+        self.visible_rows = numpy.empty(0, dtype=numpy.int64)
+        self.visible_rel_positions = numpy.empty((0, 3))
+        self.visible_distances = numpy.empty(0)
+        self.visible_app_magnitudes = numpy.empty(0)
+        self.visible_sizes = numpy.empty(0)
+        self.pointset = None
+        self.haloset = None
+        self.point_slots = numpy.full(len(self.catalog), -1, dtype=numpy.int64)
+        self.point_rows = numpy.empty(0, dtype=numpy.int64)
+        self.halo_slots = numpy.full(len(self.catalog), -1, dtype=numpy.int64)
+        self.halo_rows = numpy.empty(0, dtype=numpy.int64)
+        self.row_mask = numpy.zeros(len(self.catalog), dtype=bool)
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def get_memory_usage(self):
+        """
+        Return the number of stars and names and the approximate memory used by the table.
+        """
+        arrays = (self.catalog, self.positions, self.abs_magnitudes, self.spectral_indices, self.radii, self.point_colors,
+                  self.catalog_order, self.sorted_catalog, self.instanciated, self.removed, self.point_slots, self.halo_slots, self.row_mask)
+        size = sum(array.nbytes for array in arrays)
+        size += len(self.name_index) * objectsDB.name_entry_size + sum(getsizeof(key) for key in self.name_index)
+        return (len(self.catalog), len(self.name_index), size)
+
+    def calc_radii(self):
+        temperatures = numpy.array([spectral_type.temperature for spectral_type in self.spectral_types], dtype=numpy.float64)
+        white_dwarfs = numpy.array([spectral_type.white_dwarf for spectral_type in self.spectral_types], dtype=bool)
+        temperature_ratios = units.sun_temperature / temperatures[self.spectral_indices]
+        luminosity_ratios = numpy.power(magnitude_brightness_ratio, units.sun_abs_magnitude - self.abs_magnitudes)
+        radii = temperature_ratios * temperature_ratios * numpy.sqrt(luminosity_ratios) * units.sun_radius
+        #TODO: Find radius-luminosity relationship or use mass
+        radii[white_dwarfs[self.spectral_indices]] = 7000.0
+        return radii
+
+    def build_octree(self):
+        #TODO: Octree parameters should be shared with the universe octree
+        width = 100000.0 * units.Ly
+        center = (10 * units.Ly, 10 * units.Ly, 10 * units.Ly)
+        threshold = app_to_abs_mag(6.0, width * sqrt(3))
+        order = None
+        cache_path = None
+        if settings.cache_octree and os.path.isfile(self.name):
+            cache_path = create_path_for('octree', hashlib.md5(self.name.encode()).hexdigest())
+            key = self.octree_cache_key(center, width, threshold)
+            if not settings.rebuild_cache:
+                order = self.load_octree(cache_path, key)
+        if order is None:
+            print("Creating octree for", self.name)
+            self.octree, order = PackedOctree.build(self.positions, self.abs_magnitudes, self.radii, center, width, threshold)
+            if cache_path is not None:
+                self.store_octree(cache_path, key, order)
+        self.reorder(order)
+
+    def octree_cache_key(self, center, width, threshold):
+        stat = os.stat(self.name)
+        return "%d %d %d %r %r %r %d %d %r" % (stat.st_size, stat.st_mtime_ns, len(self.catalog), center, width, threshold,
+                                               PackedOctree.max_level, PackedOctree.max_leaves, PackedOctree.child_threshold)
+
+    def load_octree(self, cache_path, key):
+        key_file = os.path.join(cache_path, 'key')
+        if not os.path.exists(key_file): return None
+        try:
+            with open(key_file) as f:
+                if f.read() != key: return None
+            self.octree = PackedOctree.load(cache_path)
+            order = numpy.load(os.path.join(cache_path, 'order.npy'))
+        except (IOError, ValueError) as e:
+            print("Could not read octree cache for", self.name, ':', e)
+            self.octree = None
+            return None
+        print("Loaded octree for %s (cached)" % self.name)
+        return order
+
+    def store_octree(self, cache_path, key, order):
+        key_file = os.path.join(cache_path, 'key')
+        try:
+            # Invalidate the previous content until the new octree is completely written
+            if os.path.exists(key_file):
+                os.remove(key_file)
+            self.octree.save(cache_path)
+            numpy.save(os.path.join(cache_path, 'order.npy'), order)
+            with open(key_file, 'w') as f:
+                f.write(key)
+        except IOError as e:
+            print("Could not write octree cache for", self.name, ':', e)
+
+    def reorder(self, order):
+        self.catalog = self.catalog[order]
+        self.positions = self.positions[order]
+        self.abs_magnitudes = self.abs_magnitudes[order]
+        self.spectral_indices = self.spectral_indices[order]
+        self.radii = self.radii[order]
+
+    def find_row(self, cat_no):
+        index = numpy.searchsorted(self.sorted_catalog, cat_no)
+        if index < len(self.sorted_catalog) and self.sorted_catalog[index] == cat_no:
+            return int(self.catalog_order[index])
+        return None
+
+    def get_row_names(self, row):
+        cat_no = int(self.catalog[row])
+        names = self.names.get(cat_no)
+        if names is None:
+            names = ["HIP %d" % cat_no]
+        return names
+
+    def get_star(self, row):
+        star = self.stars.get(row)
+        if star is None:
+            star = self.create_star(row)
+        return star
+
+    def create_star(self, row):
+        orbit = AbsoluteFixedPosition(absolute_reference_point=LPoint3d(*self.positions[row]), frame=self.frame)
+        with objectsDB.reserved(self.oid_start + row):
+            star = Star(self.get_row_names(row), source_names=[],
+                        radius=float(self.radii[row]),
+                        surface_factory=self.surface_factory,
+                        spectral_type=self.spectral_types[self.spectral_indices[row]],
+                        abs_magnitude=float(self.abs_magnitudes[row]),
+                        orbit=orbit,
+                        rotation=UnknownRotation())
+        self.stars[row] = star
+        self.instanciated[row] = True
+        self.universe.add_child_fast(star)
+        return star
+
+    def find_name_row(self, name):
+        cat_no = self.name_index.get(name)
+        if cat_no is None and name.startswith('HIP '):
+            try:
+                cat_no = int(name[4:])
+            except ValueError:
+                pass
+        if cat_no is None:
+            return None
+        row = self.find_row(cat_no)
+        if row is None or self.removed[row]:
+            return None
+        return row
+
+    def get(self, name):
+        row = self.find_name_row(name)
+        if row is None:
+            return None
+        return self.get_star(row)
+
+    def get_oid(self, oid):
+        row = oid - self.oid_start
+        if self.removed[row]:
+            return None
+        return self.get_star(row)
+
+    def remove(self, name):
+        """
+        Remove the star known under the given upper-cased name from the table without creating it,
+        its point is removed at the next update. Return True if the star was found.
+        """
+        row = self.find_name_row(name)
+        if row is None:
+            return False
+        self.stars.pop(row, None)
+        self.removed[row] = True
+        cat_no = int(self.catalog[row])
+        for alias in self.names.get(cat_no, []):
+            key = alias.upper()
+            value = self.name_index.get(key)
+            if value == cat_no:
+                del self.name_index[key]
+                self.name_search_index.remove(key, value)
+        return True
+
+    def create_name_search_index(self):
+        """
+        Create the search index of the star names ranked by absolute magnitude, the catalog numbers are searched directly.
+        """
+        keys = [key for key in self.name_index.keys() if not key.startswith('HIP ')]
+        values = [self.name_index[key] for key in keys]
+        cat_nos = numpy.array(values, dtype=numpy.int64)
+        ranks = numpy.full(len(keys), 1000.0)
+        if len(self.sorted_catalog) > 0:
+            indices = numpy.minimum(numpy.searchsorted(self.sorted_catalog, cat_nos), len(self.sorted_catalog) - 1)
+            found = self.sorted_catalog[indices] == cat_nos
+            ranks[found] = self.abs_magnitudes[self.catalog_order[indices[found]]]
+        index = NameIndex()
+        # The values are the objects of the name dict so that they can be removed from the index
+        index.add_many(keys, values, ranks)
+        return index
+
+    def get_exact_name(self, key, cat_no):
+        for name in self.names[cat_no]:
+            if name.upper() == key:
+                return name
+        return key
+
+    def startswith(self, text, count=None):
+        """
+        Return the (rank, name, None) of the stars having a name starting with text, the brightest first.
+        """
+        result = [(rank, self.get_exact_name(key, cat_no), None) for (rank, key, cat_no) in self.name_search_index.startswith(text, count)]
+        digits = text[4:]
+        if text.startswith('HIP ') and digits.isdigit() and digits[0] != '0':
+            prefix = int(digits)
+            max_cat_no = int(self.sorted_catalog[-1]) if len(self.sorted_catalog) > 0 else 0
+            factor = 1
+            rows = []
+            while prefix * factor <= max_cat_no:
+                start = numpy.searchsorted(self.sorted_catalog, prefix * factor)
+                end = numpy.searchsorted(self.sorted_catalog, (prefix + 1) * factor)
+                rows.append(self.catalog_order[start:end])
+                factor *= 10
+            rows = numpy.concatenate(rows) if len(rows) > 0 else numpy.empty(0, dtype=numpy.int64)
+            rows = rows[~self.removed[rows]]
+            magnitudes = self.abs_magnitudes[rows]
+            if count is not None and len(rows) > count:
+                best = numpy.argpartition(magnitudes, count - 1)[:count]
+                rows = rows[best]
+                magnitudes = magnitudes[best]
+            for (cat_no, magnitude) in zip(self.catalog[rows].tolist(), magnitudes.tolist()):
+                result.append((magnitude, "HIP %d" % cat_no, None))
+        return result
+
+    def contains(self, text, count=None):
+        """
+        Return the (rank, name, None) of the stars having a name containing text, the brightest first.
+        """
+        return [(rank, self.get_exact_name(key, cat_no), None) for (rank, key, cat_no) in self.name_search_index.contains(text, count)]
+
+    def update_observer(self, observer, limit, traverser):
+        anchor = observer.anchor
+        observer_position = numpy.array(anchor.get_absolute_position())
+        camera_vector = numpy.array(anchor.camera_vector)
+        rows = self.octree.cull(observer_position, camera_vector, observer.dfov, limit, self.light_source_limit)
+        rel_positions = self.positions[rows] - observer_position
+        distances = numpy.sqrt(numpy.einsum('ij,ij->i', rel_positions, rel_positions))
+        distances = numpy.maximum(distances, 1e-6)
+        app_magnitudes = self.abs_magnitudes[rows] + 5 * (numpy.log10(distances / units.KmPerParsec) - 1)
+        visible_sizes = self.radii[rows] / (distances * anchor.pixel_size)
+        excluded = self.instanciated[rows] | self.removed[rows]
+        needed = ((app_magnitudes < self.light_source_limit) | (visible_sizes > settings.min_body_size)) & ~excluded
+        for row in rows[needed].tolist():
+            star = self.create_star(row)
+            star.anchor.traverse(traverser)
+        cos_angles = numpy.einsum('ij,j->i', rel_positions, camera_vector) / distances
+        visibles = (app_magnitudes < limit) & (cos_angles >= observer.cos_dfov) & ~excluded & ~needed
+        self.visible_rows = rows[visibles]
+        self.visible_rel_positions = rel_positions[visibles]
+        self.visible_distances = distances[visibles]
+        self.visible_app_magnitudes = app_magnitudes[visibles]
+        self.visible_sizes = visible_sizes[visibles]
+
+    def calc_scene_positions(self, scene_manager):
+        if settings.camera_at_origin:
+            obj_positions = self.visible_rel_positions
+        else:
+            obj_positions = self.positions[self.visible_rows]
+        midPlane = scene_manager.midPlane
+        distances = self.visible_distances / scene_manager.scale
+        positions = obj_positions / scene_manager.scale
+        if settings.use_depth_scaling:
+            scaled = distances > midPlane
+            if settings.use_inv_scaling:
+                scaled_distances = midPlane * (1 - midPlane / distances[scaled])
+            else:
+                scaled_distances = midPlane * (1 - numpy.log2(midPlane / distances[scaled] + 1))
+            directions = self.visible_rel_positions[scaled] / self.visible_distances[scaled, numpy.newaxis]
+            positions[scaled] = directions * (midPlane + scaled_distances)[:, numpy.newaxis]
+        return positions
+
+    def calc_oid_colors(self, rows):
+        oids = rows + self.oid_start
+        colors = numpy.empty((len(rows), 4), dtype=numpy.float32)
+        colors[:, 0] = oids & 0xFF
+        colors[:, 1] = (oids >> 8) & 0xFF
+        colors[:, 2] = (oids >> 16) & 0xFF
+        colors[:, :3] /= 255.0
+        colors[:, 3] = 1.0
+        return colors
+
+    def create_instance(self, scene_manager):
+        self.pointset = PointsSet(use_sprites=True, sprite=scene_manager.point_sprite)
+        self.haloset = PointsSet(use_sprites=True, sprite=scene_manager.halos_sprite, background=settings.halo_depth)
+
+    def update_pointset(self, pointset, row_slots, old_rows, rows, positions, colors, sizes, oids):
+        """
+        Update the slots of the pointset so that it contains the given rows, only the rows entering or leaving the set
+        and the rows whose values changed are written.
+        """
+        self.row_mask[rows] = True
+        leaving = old_rows[~self.row_mask[old_rows]]
+        self.row_mask[rows] = False
+        pointset.free_slots(row_slots[leaving])
+        row_slots[leaving] = -1
+        slots = row_slots[rows]
+        entering = slots < 0
+        slots[entering] = pointset.allocate_slots(numpy.count_nonzero(entering))
+        row_slots[rows] = slots
+        pointset.write_slots(slots[entering], positions[entering], colors[entering], sizes[entering], oids[entering])
+        staying = ~entering
+        pointset.write_slots(slots[staying], positions[staying], colors[staying], sizes[staying], oids[staying], only_changed=True)
+        if pointset.needs_compaction():
+            slot_rows = numpy.empty(pointset.num_slots, dtype=numpy.int64)
+            slot_rows[slots] = rows
+            moved, holes = pointset.compact()
+            row_slots[slot_rows[moved]] = holes
+        pointset.flush_slots()
+        return rows
+
+    def update_points(self, scene_manager):
+        if self.pointset is None:
+            self.create_instance(scene_manager)
+        scene_manager.add_background_object(self.pointset.instance)
+        scene_manager.add_background_object(self.haloset.instance)
+        app_magnitudes = self.visible_app_magnitudes
+        scales = settings.min_mag_scale + (1 - settings.min_mag_scale) * (settings.lowest_app_magnitude - app_magnitudes) / (settings.lowest_app_magnitude - settings.max_app_magnitude)
+        scales = numpy.minimum(scales, 1.0)
+        point_colors = self.point_colors[self.spectral_indices[self.visible_rows]]
+        colors = point_colors * scales[:, numpy.newaxis]
+        sizes = settings.min_point_size + scales * settings.mag_pixel_scale
+        positions = self.calc_scene_positions(scene_manager)
+        oid_colors = self.calc_oid_colors(self.visible_rows)
+        points = scales > 0
+        self.point_rows = self.update_pointset(self.pointset, self.point_slots, self.point_rows, self.visible_rows[points],
+                                               positions[points], colors[points], sizes[points], oid_colors[points])
+        if settings.show_halo:
+            halos = app_magnitudes < settings.smallest_glare_mag
+        else:
+            halos = numpy.zeros(len(app_magnitudes), dtype=bool)
+        coefs = settings.smallest_glare_mag - app_magnitudes[halos] + 6.0
+        halo_sizes = numpy.maximum(1.0, self.visible_sizes[halos]) * coefs * 4.0
+        self.halo_rows = self.update_pointset(self.haloset, self.halo_slots, self.halo_rows, self.visible_rows[halos],
+                                              positions[halos], point_colors[halos], halo_sizes, oid_colors[halos])
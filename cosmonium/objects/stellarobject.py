@@ -35,7 +35,7 @@ from ..bodyclass import bodyClasses
 from ..catalogs import objectsDB
 from ..parameters import ParametersGroup
 from .. import settings
-from ..utils import srgb_to_linear
+from ..utils import srgb_to_linear, int_to_color
 
 from math import pi, asin, atan2, sin, cos
 
@@ -70,7 +70,7 @@ class StellarObject(NamedObject):
         self.anchor = self.create_anchor(self.anchor_class, orbit, rotation, point_color)
         self.scene_anchor = SceneAnchor(self.anchor, self.support_offset_body_center, background=self.background, virtual_object=self.virtual_object)
         self.oid = None
-        self.oid_color = None
+        self._oid_color = None
         #Flags
         self.selected = False
         #Scene parameters
@@ -94,6 +94,12 @@ class StellarObject(NamedObject):
         self.components = CompositeObject(self.get_ascii_name())
         self.components.set_scene_anchor(self.scene_anchor)
 
+    @property
+    def oid_color(self):
+        if self._oid_color is None and self.oid is not None:
+            self._oid_color = int_to_color(self.oid)
+        return self._oid_color
+
     def set_parent(self, parent):
         self.parent = parent
 
@@ -155,10 +161,12 @@ class StellarObject(NamedObject):
         self.components.update_user_parameters()
         if isinstance(self.orbit, FixedPosition) and self.system is not None:
             self.system.orbit.update_user_parameters()
+            self.system.anchor.orbit_changed()
             if self.system.orbit_object is not None:
                 self.system.orbit_object.update_user_parameters()
         else:
             self.orbit.update_user_parameters()
+            self.anchor.orbit_changed()
             if self.orbit_object is not None:
                 self.orbit_object.update_user_parameters()
         self.rotation.update_user_parameters()
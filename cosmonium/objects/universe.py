@@ -35,6 +35,10 @@ class Universe(OctreeSystem):
                               rotation=FixedRotation(LQuaterniond(), frame=AbsoluteReferenceFrame()),
                               description='Universe')
         self.visible = True
+        self.star_tables = []
+
+    def add_star_table(self, star_table):
+        self.star_tables.append(star_table)
 
     def create_anchor(self, anchor_class, orbit, rotation, point_color):
         return UniverseAnchor(self, orbit, rotation, point_color)
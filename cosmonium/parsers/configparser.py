@@ -243,12 +243,14 @@ class ConfigParser(YamlParser):
         settings.debug_jump = data.get('instant-jump', settings.debug_jump)
         settings.sync_data_load = data.get('aync-data-load', settings.sync_data_load)
         settings.sync_texture_load = data.get('sync-texture-load', settings.sync_texture_load)
+        settings.texture_loader_threads = data.get('texture-loader-threads', settings.texture_loader_threads)
 
     def encode_debug(self):
         data = {}
         data['instant-jump'] = settings.debug_jump
         data['sync-data-load'] = settings.sync_data_load
         data['sync-texture-load'] = settings.sync_texture_load
+        data['texture-loader-threads'] = settings.texture_loader_threads
         return data
 
     def decode_screenshots(self, data):
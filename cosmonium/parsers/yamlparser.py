@@ -22,8 +22,10 @@ from ..dircontext import defaultDirContext, DirContext
 from ..cache import create_path_for
 from ..import settings
 
+from time import time
 import os
 import hashlib
+import marshal
 import pickle
 import io
 
@@ -111,6 +113,9 @@ class YamlModuleParser(YamlParser):
     context = defaultDirContext
     translation = None
     app = None
+    cache_version = 1
+    load_times = {}
+    include_time = 0.0
 
     @classmethod
     def set_translation(cls, translation):
@@ -151,61 +156,95 @@ class YamlModuleParser(YamlParser):
             new_context.add_path(category, os.path.join(path, category))
         return new_context
 
-    def load_from_cache(self, filename, filepath):
-        data = None
+    def get_cache_file(self, filepath):
         config_path = create_path_for('config')
         md5 = hashlib.md5(filepath.encode()).hexdigest()
-        cache_file = os.path.join(config_path, md5 + ".dat")
+        return os.path.join(config_path, md5 + ".dat")
+
+    def load_from_cache(self, filename, filepath, digest):
+        """
+        Load the parsed content of the file from the cache, the entry is only valid if it was created for the
+        same content, identified by its digest.
+        """
+        data = None
+        cache_file = self.get_cache_file(filepath)
         if os.path.exists(cache_file):
-            file_timestamp = os.path.getmtime(filepath)
-            cache_timestamp = os.path.getmtime(cache_file)
-            if cache_timestamp > file_timestamp:
-                print("Loading %s (cached)" % filepath)
-                base.splash.set_text("Loading %s (cached)" % filepath)
-                try:
-                    with open(cache_file, "rb") as f:
-                        data = pickle.load(f)
-                except (IOError, ValueError) as e:
-                    print("Could not read cache for", filename, cache_file, ':', e)
+            try:
+                with open(cache_file, "rb") as f:
+                    (version, encoding, cache_digest) = marshal.load(f)
+                    if version == self.cache_version and cache_digest == digest:
+                        print("Loading %s (cached)" % filepath)
+                        base.splash.set_text("Loading %s (cached)" % filepath)
+                        if encoding == 'marshal':
+                            data = marshal.load(f)
+                        else:
+                            data = pickle.load(f)
+            except (IOError, ValueError, TypeError, EOFError, pickle.UnpicklingError) as e:
+                print("Could not read cache for", filename, cache_file, ':', e)
         return data
 
-    def store_to_cache(self, data, filename, filepath):
-        config_path = create_path_for('config')
-        md5 = hashlib.md5(filepath.encode()).hexdigest()
-        cache_file = os.path.join(config_path, md5 + ".dat")
+    def store_to_cache(self, data, filename, filepath, digest):
+        cache_file = self.get_cache_file(filepath)
+        # marshal is faster than pickle but only supports the builtin types
+        try:
+            payload = marshal.dumps(data)
+            encoding = 'marshal'
+        except ValueError:
+            payload = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+            encoding = 'pickle'
         try:
             with open(cache_file, "wb") as f:
                 print("Caching into", cache_file)
-                pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+                marshal.dump((self.cache_version, encoding, digest), f)
+                f.write(payload)
         except IOError as e:
             print("Could not write cache for", filename, cache_file, ':', e)
 
+    @classmethod
+    def print_load_times(cls, count=10):
+        total = sum(cls.load_times.values())
+        print("Loaded %d files in %.3fs" % (len(cls.load_times), total))
+        slowest = sorted(cls.load_times.items(), key=lambda x: x[1], reverse=True)
+        for (filepath, load_time) in slowest[:count]:
+            print("\t%.3fs %s" % (load_time, filepath))
+
     def load_and_parse(self, filename, parent=None, context=None):
         data = None
         if context is None:
             context = YamlModuleParser.context
         filepath = context.find_data(filename)
         if filepath is not None:
+            start = time()
+            saved_include_time = YamlModuleParser.include_time
+            YamlModuleParser.include_time = 0.0
             saved_context = YamlModuleParser.context
             YamlModuleParser.context = self.create_new_context(context, filepath)
-            if settings.cache_yaml:
-                data = self.load_from_cache(filename, filepath)
-            if data is None:
-                print("Loading %s" % filepath)
-                base.splash.set_text("Loading %s" % filepath)
-                try:
-                    text = io.open(filepath, encoding='utf8').read()
-                    data = self.parse(text, filepath)
-                except IOError as e:
-                    print("Could not read", filename, filepath, ':', e)
-                if settings.cache_yaml and data is not None:
-                    self.store_to_cache(data, filename, filepath)
+            try:
+                content = open(filepath, 'rb').read()
+            except IOError as e:
+                print("Could not read", filename, filepath, ':', e)
+                content = None
+            if content is not None:
+                digest = hashlib.md5(content).hexdigest()
+                if settings.cache_yaml and not settings.rebuild_cache:
+                    data = self.load_from_cache(filename, filepath, digest)
+                if data is None:
+                    print("Loading %s" % filepath)
+                    base.splash.set_text("Loading %s" % filepath)
+                    data = self.parse(content.decode('utf8'), filepath)
+                    if settings.cache_yaml and data is not None:
+                        self.store_to_cache(data, filename, filepath, digest)
             if data is not None:
                 if parent is not None:
                     data = self.decode(data, parent)
                 else:
                     data =self.decode(data)
             YamlModuleParser.context = saved_context
+            # Only the time spent in this file is kept, the time of the included files is recorded with them
+            elapsed = time() - start
+            load_time = elapsed - YamlModuleParser.include_time
+            YamlModuleParser.load_times[filepath] = YamlModuleParser.load_times.get(filepath, 0.0) + load_time
+            YamlModuleParser.include_time = saved_include_time + elapsed
         else:
             print("Could not find", filename)
         return data
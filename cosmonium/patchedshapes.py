@@ -29,6 +29,8 @@ from .data_store import PatchDataStoreManager
 from .datasource import DataSource
 from .textures import TexCoord
 from .pstats import pstat
+from .lodscheduler import lodScheduler
+from .prefetcher import PatchPrefetcher
 from .geometry import geometry
 from . import settings
 
@@ -611,6 +613,7 @@ class PatchedShapeBase(Shape):
         self.culling_frustum = None
         self.frustum_node = None
         self.frustum_rel_position = None
+        self.prefetcher = PatchPrefetcher(self) if settings.prefetch_patches else None
 
     #TODO: Ugly workaround until we get rid of surface in PatchFactory
     def set_owner(self, owner):
@@ -741,8 +744,23 @@ class PatchedShapeBase(Shape):
         self.remove_all_patches_instances()
         if self.data_store is not None:
             self.data_store.clear()
+        if self.prefetcher is not None:
+            self.prefetcher.cancel_all()
         Shape.remove_instance(self)
 
+    def get_prefetch_sources(self, appearance):
+        sources = []
+        if appearance is not None:
+            for texture in getattr(appearance, 'textures', []):
+                source = getattr(texture, 'source', None)
+                if source is not None and source.is_patched():
+                    sources.append(source)
+        data_source = getattr(self.factory.heightmap, 'data_source', None)
+        source = getattr(data_source, 'source', None)
+        if source is not None and source.is_patched():
+            sources.append(source)
+        return sources
+
     def patch_done(self, patch):
         for linked_object in self.linked_objects:
             linked_object.patch_done(patch)
@@ -798,7 +816,6 @@ class PatchedShapeBase(Shape):
         self.to_merge = []
         self.to_show = []
         self.to_remove = []
-        process_nb = 0
         self.new_max_lod = 0
         frame = globalClock.getFrameCount()
         if appearance is not None and appearance.texture is not None:
@@ -809,69 +826,96 @@ class PatchedShapeBase(Shape):
         for patch in self.root_patches:
             patch.quadtree_node.check_lod(lod_result, self.culling_frustum, LPoint2d(*coord), LPoint3d(model_camera_pos), LVector3d(model_camera_vector), altitude_to_ground, pixel_size, self.lod_control)
         lod_result.sort_by_distance()
-        apply_appearance = False
-        update = []
-        for node in lod_result.to_split:
-            patch = node.patch
-            process_nb += 1
-            if settings.debug_lod_split_merge: print(frame, "Split", patch.str_id())
-            self.split_patch(patch)
-            patch.split_neighbours(update)
-            for linked_object in self.linked_objects:
-                linked_object.split_patch(patch)
-                linked_object.remove_patch_instance(patch)
-            for child in patch.children:
-                child.quadtree_node.check_visibility(self.culling_frustum, coord, model_camera_pos, model_camera_vector, altitude_to_ground, pixel_size)
-                #print(child.str_id(), child.visible)
-                if self.lod_control.should_instanciate(child.quadtree_node, 0, 0):
-                    self.create_patch_instance(child)
-                    if settings.debug_lod_split_merge: print(frame, "Show child", child.str_id(), child.instance_ready)
-                    for linked_object in self.linked_objects:
-                        linked_object.create_patch_instance(child)
-            self.remove_patch_instance(patch)
-            apply_appearance = True
-            patch.last_split = frame
-            if process_nb > 2:
-                break
+        self.lod_update = []
+        self.lod_apply_appearance = False
+        self.lod_frame = frame
+        self.lod_context = (coord, model_camera_pos, model_camera_vector, altitude_to_ground, pixel_size)
         for node in lod_result.to_show:
-            patch = node.patch
-            if settings.debug_lod_split_merge: print(frame, "Show", patch.str_id(), patch.quadtree_node.patch_in_view, patch.instance_ready)
-            if patch.lod == 0:
-                self.add_root_patches(patch, update)
-            self.create_patch_instance(patch)
-            apply_appearance = True
-            for linked_object in self.linked_objects:
-                linked_object.create_patch_instance(patch)
+            self.do_show(node.patch)
         for node in lod_result.to_remove:
-            patch = node.patch
-            if settings.debug_lod_split_merge: print(frame, "Remove", patch.str_id(), patch.quadtree_node.patch_in_view)
-            for linked_object in self.linked_objects:
-                linked_object.remove_patch_instance(patch)
-            self.remove_patch_instance(patch)
-        for node in lod_result.to_merge:
-            patch = node.patch
-            #Dampen high frequency split-merge anomaly
-            if frame - patch.last_split < 5: continue
-            if settings.debug_lod_split_merge: print(frame, "Merge", patch.str_id(), patch.quadtree_node.visible)
-            self.merge_patch(patch)
-            patch.merge_neighbours(update)
-            if patch.quadtree_node.visible:
-                self.create_patch_instance(patch)
-                apply_appearance = True
-                for linked_object in self.linked_objects:
-                    linked_object.create_patch_instance(patch)
-            for linked_object in self.linked_objects:
-                linked_object.merge_patch(patch)
-            for child in patch.children:
-                for linked_object in self.linked_objects:
-                    linked_object.remove_patch_instance(child)
-                self.remove_patch_instance(child)
-            patch.remove_children()
+            self.do_remove(node.patch)
+        #Dampen high frequency split-merge anomaly
+        to_merge = [node for node in lod_result.to_merge if frame - node.patch.last_split >= 5]
+        # The splits and merges of all the shapes are done later in the frame by the LOD scheduler
+        lodScheduler.add_operations(self, lod_result.to_split, to_merge)
+        update = self.lod_update
+        apply_appearance = self.lod_apply_appearance
+        self.lod_update = []
+        self.lod_apply_appearance = False
         self.max_lod = self.new_max_lod
         self.update_patch_instances(update)
+        if self.prefetcher is not None:
+            self.prefetcher.update(pixel_size, self.get_prefetch_sources(appearance))
         #Return True when new instances have been created
         return apply_appearance or len(update) > 0
 
+    def apply_lod_operations(self):
+        """
+        Update the instances of the patches modified by the splits and merges done by the LOD scheduler.
+        The shape has already been placed for this frame, the new patches must be placed before they are rendered.
+        """
+        update = self.lod_update
+        apply_appearance = self.lod_apply_appearance
+        self.lod_update = []
+        self.lod_apply_appearance = False
+        self.update_patch_instances(update)
+        if self.owner is not None:
+            self.place_patches(self.owner)
+        if (apply_appearance or len(update) > 0) and self.parent is not None:
+            self.parent.schedule_jobs()
+
+    def do_split(self, patch):
+        (coord, model_camera_pos, model_camera_vector, altitude_to_ground, pixel_size) = self.lod_context
+        if settings.debug_lod_split_merge: print(self.lod_frame, "Split", patch.str_id())
+        self.split_patch(patch)
+        patch.split_neighbours(self.lod_update)
+        for linked_object in self.linked_objects:
+            linked_object.split_patch(patch)
+            linked_object.remove_patch_instance(patch)
+        for child in patch.children:
+            child.quadtree_node.check_visibility(self.culling_frustum, coord, model_camera_pos, model_camera_vector, altitude_to_ground, pixel_size)
+            #print(child.str_id(), child.visible)
+            if self.lod_control.should_instanciate(child.quadtree_node, 0, 0):
+                self.create_patch_instance(child)
+                if settings.debug_lod_split_merge: print(self.lod_frame, "Show child", child.str_id(), child.instance_ready)
+                for linked_object in self.linked_objects:
+                    linked_object.create_patch_instance(child)
+        self.remove_patch_instance(patch)
+        self.lod_apply_appearance = True
+        patch.last_split = self.lod_frame
+
+    def do_show(self, patch):
+        if settings.debug_lod_split_merge: print(self.lod_frame, "Show", patch.str_id(), patch.quadtree_node.patch_in_view, patch.instance_ready)
+        if patch.lod == 0:
+            self.add_root_patches(patch, self.lod_update)
+        self.create_patch_instance(patch)
+        self.lod_apply_appearance = True
+        for linked_object in self.linked_objects:
+            linked_object.create_patch_instance(patch)
+
+    def do_remove(self, patch):
+        if settings.debug_lod_split_merge: print(self.lod_frame, "Remove", patch.str_id(), patch.quadtree_node.patch_in_view)
+        for linked_object in self.linked_objects:
+            linked_object.remove_patch_instance(patch)
+        self.remove_patch_instance(patch)
+
+    def do_merge(self, patch):
+        if settings.debug_lod_split_merge: print(self.lod_frame, "Merge", patch.str_id(), patch.quadtree_node.visible)
+        self.merge_patch(patch)
+        patch.merge_neighbours(self.lod_update)
+        if patch.quadtree_node.visible:
+            self.create_patch_instance(patch)
+            self.lod_apply_appearance = True
+            for linked_object in self.linked_objects:
+                linked_object.create_patch_instance(patch)
+        for linked_object in self.linked_objects:
+            linked_object.merge_patch(patch)
+        for child in patch.children:
+            for linked_object in self.linked_objects:
+                linked_object.remove_patch_instance(child)
+            self.remove_patch_instance(child)
+        patch.remove_children()
+
     def _find_patch_at(self, patch, x, y):
         if x >= patch.x0 and x <= patch.x1 and y >= patch.y0 and y <= patch.y1:
             #print("In", patch, patch.x0, patch.x1, patch.y0, patch.y1)
@@ -18,7 +18,7 @@
 #
 
 
-from panda3d.core import GeomVertexArrayFormat, InternalName, GeomVertexFormat, GeomVertexData, GeomVertexWriter
+from panda3d.core import GeomVertexArrayFormat, InternalName, GeomVertexFormat, GeomVertexData
 from panda3d.core import GeomPoints, Geom, GeomNode
 from panda3d.core import NodePath, OmniBoundingVolume, DrawMask, ShaderAttrib
 from .foundation import VisibleObject
@@ -28,6 +28,8 @@ from .shaders.lighting.flat import FlatLightingModel
 from .shaders.point_control import StaticSizePointControl
 from .sprites import SimplePoint, RoundDiskPointSprite
 
+import numpy
+
 class PointsSet(VisibleObject):
     default_camera_mask = VisibleObject.DefaultCameraFlag
     tex = None
@@ -44,6 +46,7 @@ class PointsSet(VisibleObject):
         self.shader = shader
 
         self.reset()
+        self.slots_data = None
 
         self.geom = self.makeGeom([], [], [], [])
         self.gnode.addGeom(self.geom)
@@ -91,7 +94,7 @@ class PointsSet(VisibleObject):
     def update(self):
         self.update_arrays(self.points, self.colors, self.sizes, self.oids)
 
-    def makeGeom(self, points, colors, sizes, oids):
+    def make_format(self):
         array = GeomVertexArrayFormat()
         array.addColumn(InternalName.get_vertex(), 3, Geom.NTFloat32, Geom.CPoint)
         array.addColumn(InternalName.get_color(), 4, Geom.NTFloat32, Geom.CColor)
@@ -102,34 +105,185 @@ class PointsSet(VisibleObject):
             array.addColumn(oids_column_name, 4, Geom.NTFloat32, Geom.COther)
         format = GeomVertexFormat()
         format.addArray(array)
-        format = GeomVertexFormat.registerFormat(format)
-        vdata = GeomVertexData('vdata', format, Geom.UH_static)
-        vdata.unclean_set_num_rows(len(points))
-        self.vwriter = GeomVertexWriter(vdata, InternalName.get_vertex())
-        self.colorwriter = GeomVertexWriter(vdata, InternalName.get_color())
-        if self.use_sizes:
-            self.sizewriter = GeomVertexWriter(vdata, InternalName.get_size())
-        if self.use_oids:
-            self.oidwriter = GeomVertexWriter(vdata, oids_column_name)
+        return GeomVertexFormat.registerFormat(format)
+
+    def makeGeom(self, points, colors, sizes, oids):
+        vdata = GeomVertexData('vdata', self.make_format(), Geom.UH_static)
         geompoints = GeomPoints(Geom.UH_static)
-        geompoints.reserve_num_vertices(len(points))
-        index = 0
-        for (point, color, size, oid) in zip(points, colors, sizes, oids):
-            self.vwriter.addData3(*point)
-            #self.colorwriter.addData3f(color[0], color[1], color[2])
-            self.colorwriter.addData4(color)
-            if self.use_sizes:
-                self.sizewriter.addData1(size)
-            if self.use_oids:
-                self.oidwriter.addData4(oid)
-            geompoints.addVertex(index)
-            geompoints.closePrimitive()
-            index += 1
         geom = Geom(vdata)
         geom.addPrimitive(geompoints)
+        self.fill_geom(geom, points, colors, sizes, oids)
         return geom
 
+    def fill_geom(self, geom, points, colors, sizes, oids):
+        """
+        Copy the points into the vertex data of the geom, the points are drawn as a non-indexed range of vertices.
+        """
+        count = len(points)
+        vdata = geom.modify_vertex_data()
+        array_data = vdata.modify_array(0)
+        array_data.unclean_set_num_rows(count)
+        if count > 0:
+            array_format = array_data.get_array_format()
+            stride = array_format.get_stride() // 4
+            view = memoryview(array_data).cast('B')
+            data = numpy.frombuffer(view, dtype=numpy.float32).reshape(count, stride)
+            self.copy_columns(data, array_format, points, colors, sizes, oids)
+            del data
+            view.release()
+        geompoints = geom.modify_primitive(0)
+        geompoints.set_nonindexed_vertices(0, count)
+
+    def copy_columns(self, data, array_format, points, colors, sizes, oids):
+        self.copy_column(data, array_format, InternalName.get_vertex(), points, 3)
+        self.copy_column(data, array_format, InternalName.get_color(), colors, 4)
+        if self.use_sizes:
+            self.copy_column(data, array_format, InternalName.get_size(), sizes, 1)
+        if self.use_oids:
+            self.copy_column(data, array_format, InternalName.make('oid'), oids, 4)
+
+    def copy_column(self, data, array_format, name, values, num_components):
+        start = array_format.get_column(name).get_start() // 4
+        values = numpy.asarray(values, dtype=numpy.float32)
+        data[:, start:start + num_components] = values.reshape(len(data), num_components)
+
     def update_arrays(self, points, colors, sizes, oids):
-        self.gnode.removeAllGeoms()
-        self.geom = self.makeGeom(points, colors, sizes, oids)
-        self.gnode.addGeom(self.geom)
+        """
+        Replace the points of the set, each parameter can be a NumPy array or a sequence of vectors or values.
+        The existing vertex data is reused and only resized when the number of points changes.
+        """
+        self.slots_data = None
+        self.fill_geom(self.geom, points, colors, sizes, oids)
+        if not self.use_sprites:
+            self.gnode.mark_bounds_stale()
+
+    # Incremental updates
+    #
+    # Each point is stored in a slot of the vertex data. The slots of the removed points are cleared and put
+    # in a free list to be reused by the next added points. A copy of the vertex data is kept so that
+    # only the modified slots are written, and the vertex data is left untouched when nothing changed.
+
+    def init_slots(self):
+        array_format = self.geom.get_vertex_data().get_format().get_array(0)
+        self.slots_format = array_format
+        self.slots_data = numpy.zeros((64, array_format.get_stride() // 4), dtype=numpy.float32)
+        self.num_slots = 0
+        self.free_slots_list = []
+        self.dirty_start = None
+        self.dirty_end = None
+        self.slots_resized = True
+
+    def get_num_points(self):
+        if self.slots_data is None:
+            return self.geom.get_vertex_data().get_num_rows()
+        return self.num_slots - len(self.free_slots_list)
+
+    def allocate_slots(self, count):
+        """
+        Return the indices of count empty slots, the free slots are reused before the vertex data is extended.
+        """
+        if self.slots_data is None:
+            self.init_slots()
+        count = int(count)
+        slots = numpy.empty(count, dtype=numpy.int64)
+        reused = min(count, len(self.free_slots_list))
+        if reused > 0:
+            slots[:reused] = self.free_slots_list[-reused:]
+            del self.free_slots_list[-reused:]
+        added = count - reused
+        if added > 0:
+            slots[reused:] = numpy.arange(self.num_slots, self.num_slots + added)
+            self.num_slots += added
+            if self.num_slots > len(self.slots_data):
+                data = numpy.zeros((max(self.num_slots, len(self.slots_data) * 2), self.slots_data.shape[1]), dtype=numpy.float32)
+                data[:len(self.slots_data)] = self.slots_data
+                self.slots_data = data
+            self.slots_resized = True
+        return slots
+
+    def free_slots(self, slots):
+        """
+        Clear the given slots, a cleared point has a null size and a transparent color, and add them to the free list.
+        """
+        if len(slots) == 0: return
+        self.slots_data[slots] = 0.0
+        self.free_slots_list.extend(slots.tolist())
+        self.mark_dirty(slots)
+
+    def write_slots(self, slots, points, colors, sizes, oids, only_changed=False):
+        """
+        Write the given points in their slots. If only_changed is True, the slots already containing the same values
+        are not marked as modified.
+        Return the number of slots written.
+        """
+        if len(slots) == 0: return 0
+        rows = numpy.empty((len(slots), self.slots_data.shape[1]), dtype=numpy.float32)
+        self.copy_columns(rows, self.slots_format, points, colors, sizes, oids)
+        if only_changed:
+            changed = (self.slots_data[slots] != rows).any(axis=1)
+            slots = slots[changed]
+            rows = rows[changed]
+        self.slots_data[slots] = rows
+        self.mark_dirty(slots)
+        return len(slots)
+
+    def mark_dirty(self, slots):
+        if len(slots) == 0: return
+        start = int(slots.min())
+        end = int(slots.max()) + 1
+        if self.dirty_start is None:
+            self.dirty_start = start
+            self.dirty_end = end
+        else:
+            self.dirty_start = min(self.dirty_start, start)
+            self.dirty_end = max(self.dirty_end, end)
+
+    def needs_compaction(self):
+        return len(self.free_slots_list) > max(1024, self.num_slots // 2)
+
+    def compact(self):
+        """
+        Move the points stored after the last needed slot into the free slots and shrink the vertex data.
+        Return the slots that were moved and their new location.
+        """
+        free = numpy.sort(numpy.array(self.free_slots_list, dtype=numpy.int64))
+        count = self.num_slots - len(free)
+        holes = free[free < count]
+        used = numpy.ones(self.num_slots - count, dtype=bool)
+        used[free[free >= count] - count] = False
+        moved = numpy.arange(count, self.num_slots)[used]
+        self.slots_data[holes] = self.slots_data[moved]
+        self.slots_data[count:self.num_slots] = 0.0
+        self.num_slots = count
+        self.free_slots_list = []
+        self.slots_resized = True
+        return moved, holes
+
+    def flush_slots(self):
+        """
+        Copy the modified slots into the vertex data of the geom.
+        """
+        if self.slots_data is None: return
+        if self.slots_resized:
+            start = 0
+            end = self.num_slots
+        elif self.dirty_start is not None:
+            start = self.dirty_start
+            end = min(self.dirty_end, self.num_slots)
+        else:
+            return
+        array_data = self.geom.modify_vertex_data().modify_array(0)
+        if self.slots_resized:
+            array_data.unclean_set_num_rows(self.num_slots)
+            self.geom.modify_primitive(0).set_nonindexed_vertices(0, self.num_slots)
+        if end > start:
+            view = memoryview(array_data).cast('B')
+            data = numpy.frombuffer(view, dtype=numpy.float32).reshape(self.num_slots, self.slots_data.shape[1])
+            data[start:end] = self.slots_data[start:end]
+            del data
+            view.release()
+        self.dirty_start = None
+        self.dirty_end = None
+        self.slots_resized = False
+        if not self.use_sprites:
+            self.gnode.mark_bounds_stale()
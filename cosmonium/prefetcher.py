@@ -0,0 +1,182 @@
+#
+#This file is part of Cosmonium.
+#
+#Copyright (C) 2018-2022 Laurent Deru.
+#
+#Cosmonium is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#Cosmonium is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with Cosmonium.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+
+from panda3d.core import LVector3d
+
+from . import workers
+from . import settings
+
+from math import inf
+import numpy
+
+def ease_in_out(t):
+    # Same curve as the easeInOut blend of the intervals
+    return t * t * (3.0 - 2.0 * t)
+
+class MotionPredictor(object):
+    """
+    Extrapolate the local position of the observer from its smoothed velocity or, while the autopilot is moving it,
+    from the remaining autopilot move.
+    """
+    smoothing = 0.3
+
+    def __init__(self):
+        self.observer = None
+        self.autopilot = None
+        self.last_position = None
+        self.last_time = None
+        self.velocity = LVector3d()
+
+    def set_observer(self, observer, autopilot=None):
+        self.observer = observer
+        self.autopilot = autopilot
+        self.reset()
+
+    def reset(self):
+        self.last_position = None
+        self.last_time = None
+        self.velocity = LVector3d()
+
+    def update(self, time):
+        if self.observer is None: return
+        position = self.observer.get_local_position()
+        if self.last_position is not None and time > self.last_time:
+            velocity = (position - self.last_position) / (time - self.last_time)
+            self.velocity = self.velocity * (1.0 - self.smoothing) + velocity * self.smoothing
+        self.last_position = LVector3d(position)
+        self.last_time = time
+
+    def is_moving(self):
+        return self.velocity.length_squared() > 0.0 or (self.autopilot is not None and self.autopilot.is_moving())
+
+    def predict(self, delay):
+        """
+        Return the predicted local position of the observer in delay seconds, or None if the observer is not known.
+        """
+        if self.observer is None: return None
+        position = self.observer.get_local_position()
+        if self.autopilot is not None:
+            move = self.autopilot.predict_local_move(delay)
+            if move is not None:
+                return position + move
+        return position + self.velocity * delay
+
+motionPredictor = MotionPredictor()
+
+class PatchCoord(object):
+    """
+    Coordinates of a patch which is not yet created, as used by the virtual texture sources.
+    """
+    __slots__ = ('face', 'lod', 'x', 'y')
+
+    def __init__(self, face, lod, x, y):
+        self.face = face
+        self.lod = lod
+        self.x = x
+        self.y = y
+
+    def get_key(self):
+        return (self.face, self.lod, self.x, self.y)
+
+class PatchPrefetcher(object):
+    """
+    Prefetch the data of the children of the patches of a shape that will be split in the next seconds.
+
+    The leaves of the shape are evaluated with the lod control at the predicted positions of the observer,
+    the tiles of the children of the first patches expected to split are loaded in the texture cache with
+    a priority lower than the regular loads. The prefetches no longer expected are cancelled.
+    """
+    def __init__(self, shape):
+        self.shape = shape
+        self.pending = {}
+        self.next_update = 0.0
+
+    def get_delays(self):
+        steps = settings.prefetch_steps
+        return [settings.prefetch_horizon * (i + 1) / steps for i in range(steps)]
+
+    def find_splits(self, leaves, pixel_size):
+        """
+        Return the leaves expected to split and the delay after which they will, the earliest first.
+        """
+        lod_control = self.shape.lod_control
+        nodes = [patch.quadtree_node for patch in leaves]
+        centres = numpy.array([tuple(node.centre) for node in nodes], dtype=numpy.float64)
+        half_diagonals = numpy.array([node.length for node in nodes], dtype=numpy.float64) * 0.7071067811865476
+        remaining = list(range(len(nodes)))
+        splits = []
+        for delay in self.get_delays():
+            future_pos = motionPredictor.predict(delay)
+            if future_pos is None: break
+            (model_camera_pos, model_camera_vector, coord) = self.shape.xform_cam_to_model(future_pos)
+            vectors = centres - tuple(model_camera_pos)
+            distances = numpy.maximum(numpy.sqrt(numpy.einsum('ij,ij->i', vectors, vectors)) - half_diagonals, 1e-9)
+            still_remaining = []
+            for i in remaining:
+                node = nodes[i]
+                distance = distances[i]
+                if lod_control.should_split(node, node.length / (distance * pixel_size), distance):
+                    splits.append((delay, leaves[i]))
+                else:
+                    still_remaining.append(i)
+            remaining = still_remaining
+            if len(splits) >= settings.prefetch_max_patches: break
+        return splits[:settings.prefetch_max_patches]
+
+    def update(self, pixel_size, sources):
+        now = globalClock.get_real_time()
+        if now < self.next_update: return
+        self.next_update = now + settings.prefetch_interval
+        if len(sources) == 0 or not motionPredictor.is_moving():
+            self.cancel_all()
+            return
+        lod_control = self.shape.lod_control
+        leaves = []
+        for patch in self.shape.patches:
+            node = patch.quadtree_node
+            if len(patch.children) != 0 or not node.visible: continue
+            # The leaves already being split are loaded by the regular path
+            if lod_control.should_split(node, node.apparent_size, node.distance): continue
+            leaves.append(patch)
+        wanted = {}
+        if len(leaves) > 0:
+            for (delay, patch) in self.find_splits(leaves, pixel_size):
+                for (i, j) in ((0, 0), (1, 0), (0, 1), (1, 1)):
+                    child = PatchCoord(patch.face, patch.lod + 1, patch.x * 2 + i, patch.y * 2 + j)
+                    for source in sources:
+                        key = (id(source), child.get_key())
+                        if key in wanted: continue
+                        future = self.pending.get(key)
+                        if future is None or future.cancelled():
+                            future = source.prefetch(child, (inf, delay, child.lod))
+                        if future is not None:
+                            wanted[key] = future
+        for (key, future) in self.pending.items():
+            if key not in wanted and not future.done():
+                workers.asyncTextureLoader.cancel_prefetch(future)
+        self.pending = {key: future for (key, future) in wanted.items() if not future.done()}
+        workers.asyncTextureLoader.clear_unused_prefetched()
+
+    def cancel_all(self):
+        for future in self.pending.values():
+            if not future.done():
+                workers.asyncTextureLoader.cancel_prefetch(future)
+        self.pending = {}
+
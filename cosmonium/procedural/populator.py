@@ -27,8 +27,8 @@ from ..datasource import DataSource
 from .. import settings
 
 from random import random, uniform
-from array import array
-from itertools import chain
+from math import ceil
+import numpy
 
 class TerrainObjectFactory(object):
     def __init__(self):
@@ -70,17 +70,13 @@ class TerrainPopulatorBase(object):
         return self.count
 
     def generate_object_instances_info_for(self, patch):
-        nb_of_instances = self.calc_nb_of_instances(patch)
+        """
+        Return the instances of the patch as an array of (x, y, height, scale) rows.
+        """
+        nb_of_instances = int(ceil(self.calc_nb_of_instances(patch)))
         if self.max_instances is not None:
             nb_of_instances = min(nb_of_instances, self.max_instances)
-        count = 0
-        offsets = []
-        while count < nb_of_instances:
-            offset = self.placer.place_new(self.terrain, count, patch)
-            if offset is not None:
-                offsets.append(offset)
-            count += 1
-        return offsets
+        return self.placer.place_many(self.terrain, nb_of_instances, patch)
 
     async def create_object_template(self, scene_anchor):
         if self.object_template.instance is None:
@@ -149,25 +145,15 @@ class PatchedTerrainPopulatorBase(TerrainPopulatorBase):
         patch = self.patch_map[terrain_patch]
         if patch.data is None:
             self.create_data_for(patch, terrain_patch)
-        bl = []
-        br = []
-        tr = []
-        tl = []
         #TODO: Terrain scale should be retrieved properly...
         size = self.terrain.size
-        for data in patch.data:
-            (x, y, height, scale) = data
-            (u, v) = terrain_patch.coord_to_uv((x / size, y / size))
-            if u < 0.5:
-                if v < 0.5:
-                    bl.append(data)
-                else:
-                    tl.append(data)
-            else:
-                if v < 0.5:
-                    br.append(data)
-                else:
-                    tr.append(data)
+        data = patch.data
+        (u, v) = terrain_patch.coord_to_uv((data[:, 0] / size, data[:, 1] / size))
+        # Quadrant index is 0 for bottom-left, 1 for bottom-right, 2 for top-left and 3 for top-right
+        quadrants = (u >= 0.5).astype(numpy.int8) | ((v >= 0.5).astype(numpy.int8) << 1)
+        order = numpy.argsort(quadrants, kind='stable')
+        bounds = numpy.searchsorted(quadrants[order], numpy.arange(5))
+        (bl, br, tl, tr) = [data[order[bounds[i]:bounds[i + 1]]] for i in range(4)]
         #print(len(bl), len(br), len(tr), len(tl))
         self.patch_map[terrain_patch.children[0]] = TerrainPopulatorPatch(bl)
         self.patch_map[terrain_patch.children[1]] = TerrainPopulatorPatch(br)
@@ -228,7 +214,7 @@ class CpuTerrainPopulator(PatchedTerrainPopulatorBase):
 
     def create_object_instances(self, scene_anchor, patch, terrain_patch):
         instances = []
-        for (i, offset) in enumerate(patch.data):
+        for (i, offset) in enumerate(patch.data.tolist()):
             (x, y, height, scale) = offset
             child = scene_anchor.unshifted_instance.attach_new_node('instance_%d' % i)
             self.object_template.instance.instance_to(child)
@@ -274,27 +260,23 @@ class GpuTerrainPopulator(PatchedTerrainPopulatorBase):
         self.rebuild = True
 
     def generate_table(self):
-        data = []
-        for patch in self.visible_patches.values():
-            data += patch.data
+        patches_data = [patch.data for patch in self.visible_patches.values()]
+        if len(patches_data) > 0:
+            data = numpy.concatenate(patches_data)
+        else:
+            data = numpy.empty((0, 4), dtype=numpy.float32)
         offsets_nb = len(data)
         if settings.debug_lod_split_merge:
             print("Populator regenerate", offsets_nb)
-        if settings.instancing_use_tex:
-            offsets = data
-        else:
-            offsets = PTAVecBase4f.emptyArray(offsets_nb)
-            for offset in data:
-                    offsets[offsets_nb] = offset
+        data_source = self.object_template.get_source('offsets')
         if settings.instancing_use_tex:
             texture = Texture()
-            texture.setup_buffer_texture(len(offsets), Texture.T_float, Texture.F_rgba32, GeomEnums.UH_static)
-            flattened_data = list(chain.from_iterable(offsets))
-            data = array("f", flattened_data)
-            texture.set_ram_image(data.tobytes())
-            data_source = self.object_template.get_source('offsets')
+            texture.setup_buffer_texture(offsets_nb, Texture.T_float, Texture.F_rgba32, GeomEnums.UH_static)
+            texture.set_ram_image(numpy.ascontiguousarray(data, dtype=numpy.float32))
             data_source.set_offsets(texture)
         else:
+            offsets = PTAVecBase4f.empty_array(offsets_nb)
+            numpy.frombuffer(offsets, dtype=numpy.float32).reshape(-1, 4)[:] = data
             data_source.set_offsets(offsets)
         self.object_template.instance.set_instance_count(offsets_nb)
         self.object_template.update_shader()
@@ -317,10 +299,22 @@ class ObjectPlacer(object):
     def __init__(self):
         pass
 
-    def place_new(self, count):
+    def place_new(self, terrain, count, patch=None):
         return None
 
+    def place_many(self, terrain, count, patch=None):
+        """
+        Place count objects and return the placed ones as an array of (x, y, height, scale) rows.
+        """
+        offsets = [self.place_new(terrain, i, patch) for i in range(count)]
+        offsets = [offset for offset in offsets if offset is not None]
+        return numpy.array(offsets, dtype=numpy.float32).reshape(-1, 4)
+
 class RandomObjectPlacer(ObjectPlacer):
+    def __init__(self):
+        ObjectPlacer.__init__(self)
+        self.rng = numpy.random.default_rng()
+
     def place_new(self, terrain, count, patch=None):
         if patch is not None:
             u = random()
@@ -340,3 +334,16 @@ class RandomObjectPlacer(ObjectPlacer):
             return (x, y, height, scale)
         else:
             return None
+
+    def place_many(self, terrain, count, patch=None):
+        if patch is None:
+            return ObjectPlacer.place_many(self, terrain, count, patch)
+        us = self.rng.random(count)
+        vs = self.rng.random(count)
+        offsets = numpy.empty((count, 4), dtype=numpy.float32)
+        offsets[:, 2] = terrain.get_heights_patch(patch, us, vs)
+        (xs, ys) = patch.get_xy_for(us, vs)
+        offsets[:, 0] = xs * terrain.size
+        offsets[:, 1] = ys * terrain.size
+        offsets[:, 3] = self.rng.uniform(0.1, 0.5, count)
+        return offsets
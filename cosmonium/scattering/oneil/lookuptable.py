@@ -0,0 +1,129 @@
+#
+#This file is part of Cosmonium.
+#
+#Copyright (C) 2018-2022 Laurent Deru.
+#
+#Cosmonium is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#Cosmonium is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with Cosmonium.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+
+from panda3d.core import Texture
+
+from ...cache import create_path_for
+from ...textures import TextureConfiguration
+from ... import settings
+
+import hashlib
+import numpy
+import os
+import pickle
+
+cache_version = 1
+
+# Offset added to the height of the viewpoint to avoid starting exactly on the ground
+DELTA = 1e-6
+
+def generate_optical_depth_table(ratio, rayleigh_scale_depth, mie_scale_depth, size, samples):
+    """
+    Compute the optical depth lookup table of an atmosphere whose outer radius is ratio times its inner radius.
+
+    The table is indexed by [angle, altitude], the altitude goes from the bottom to the top of the atmosphere
+    and the cosine of the angle between the ray and the vertical from 1 to -1. Each texel holds the Rayleigh density ratio,
+    the Rayleigh optical depth, the Mie density ratio and the Mie optical depth.
+    The lengths are expressed in atmosphere height, the result does then only depend on the ratio of the radii.
+    """
+    inner_radius = 1.0 / (ratio - 1.0)
+    outer_radius = inner_radius + 1.0
+    coords = (numpy.arange(size, dtype=numpy.float64) + 0.5) / size
+    cos_angle = (1.0 - 2.0 * coords)[:, numpy.newaxis]
+    height = (DELTA + inner_radius + coords)[numpy.newaxis, :]
+    b = 2.0 * height * cos_angle
+    b_sq = b * b
+    det = b_sq - 4.0 * (height * height - inner_radius * inner_radius)
+    sqrt_det = numpy.sqrt(numpy.maximum(det, 0.0))
+    # The ray is not visible if it hits the ground
+    visible = (det < 0.0) | ((-b - sqrt_det <= 0.0) & (-b + sqrt_det <= 0.0))
+    altitude = height - inner_radius
+    rayleigh_density = numpy.where(visible, numpy.exp(-altitude / rayleigh_scale_depth), 0.0)
+    mie_density = numpy.where(visible, numpy.exp(-altitude / mie_scale_depth), 0.0)
+    far = 0.5 * (-b + numpy.sqrt(b_sq - 4.0 * (height * height - outer_radius * outer_radius)))
+    sample_length = far / samples
+    rayleigh_depth = numpy.zeros(b.shape)
+    mie_depth = numpy.zeros(b.shape)
+    for i in range(samples):
+        distance = sample_length * (i + 0.5)
+        sample_height = numpy.sqrt(height * height + 2.0 * height * distance * cos_angle + distance * distance)
+        sample_altitude = numpy.maximum(sample_height - inner_radius, 0.0)
+        rayleigh_depth += numpy.exp(-sample_altitude / rayleigh_scale_depth)
+        mie_depth += numpy.exp(-sample_altitude / mie_scale_depth)
+    rayleigh_depth *= sample_length
+    mie_depth *= sample_length
+    return numpy.stack([rayleigh_density, rayleigh_depth, mie_density, mie_depth], axis=-1).astype(numpy.float32)
+
+def load_from_cache(key):
+    cache_file = get_cache_file(key)
+    if not os.path.exists(cache_file): return None
+    try:
+        with open(cache_file, "rb") as f:
+            if pickle.load(f) != key: return None
+            return pickle.load(f)
+    except (IOError, ValueError, EOFError, pickle.UnpicklingError) as e:
+        print("Could not read lookup table cache", cache_file, ':', e)
+    return None
+
+def store_to_cache(key, table):
+    cache_file = get_cache_file(key)
+    try:
+        with open(cache_file, "wb") as f:
+            pickle.dump(key, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(table, f, pickle.HIGHEST_PROTOCOL)
+    except IOError as e:
+        print("Could not write lookup table cache", cache_file, ':', e)
+
+def get_cache_file(key):
+    cache_path = create_path_for('oneil')
+    return os.path.join(cache_path, hashlib.md5(repr(key).encode()).hexdigest() + ".dat")
+
+def create_texture(table, name):
+    (height, width, components) = table.shape
+    texture = Texture(name)
+    texture.setup_2d_texture(width, height, Texture.T_float, Texture.F_rgba32)
+    texture_config = TextureConfiguration(wrap_u=Texture.WM_clamp, wrap_v=Texture.WM_clamp,
+                                          minfilter=Texture.FT_linear, magfilter=Texture.FT_linear)
+    texture_config.apply(texture)
+    # Panda stores the components in BGRA order
+    texture.set_ram_image(numpy.ascontiguousarray(table[:, :, [2, 1, 0, 3]]))
+    return texture
+
+lookup_tables = {}
+
+def get_optical_depth_texture(inner_radius, outer_radius, rayleigh_scale_depth, mie_scale_depth, size, samples):
+    """
+    Return the optical depth lookup texture for the given parameters, the texture is shared between
+    the atmospheres with the same parameters and the table is cached on disk.
+    """
+    key = (cache_version, outer_radius / inner_radius, rayleigh_scale_depth, mie_scale_depth, size, samples)
+    texture = lookup_tables.get(key)
+    if texture is not None:
+        return texture
+    table = None
+    if settings.cache_scattering and not settings.rebuild_cache:
+        table = load_from_cache(key)
+    if table is None:
+        table = generate_optical_depth_table(*key[1:])
+        if settings.cache_scattering:
+            store_to_cache(key, table)
+    texture = create_texture(table, 'oneil-lookup-%d' % len(lookup_tables))
+    lookup_tables[key] = texture
+    return texture
@@ -18,21 +18,16 @@
 #
 
 
-from panda3d.core import Texture, LVector3d, LPoint3, LMatrix4, LQuaternion
+from panda3d.core import LVector3d, LPoint3, LMatrix4, LQuaternion
 
 from ...components.elements.atmosphere import Atmosphere
 from ...datasource import DataSource
-from ...textures import TextureConfiguration
-from ...shaders.base import StructuredShader, ShaderProgram
 from ...shaders.rendering import RenderingShader
 from ...shaders.lighting.base import LightingModel
 from ...shaders.scattering import AtmosphericScattering
 from ...utils import TransparencyBlend
 from ...parameters import AutoUserParameter, UserParameter
-from ...pipeline.shaders import GeneratorVertexShader
-from ...pipeline.target import ProcessTarget
-from ...pipeline.stage import ProcessStage
-from ...pipeline.factory import PipelineFactory
+from .lookuptable import get_optical_depth_texture
 
 from math import pow, pi
 
@@ -163,24 +158,12 @@ class ONeilAtmosphere(ONeilAtmosphereBase):
         self.height = height
         self.lookup_size = lookup_size
         self.lookup_samples = lookup_samples
-        self.lookuptable_generator = None
         self.pbOpticalDepth = None
         shader = RenderingShader(lighting_model=LightingModel(), scattering=self.create_scattering_shader(atmosphere=True, displacement=False, extinction=False))
         self.set_shader(shader)
 
-    def create_generator(self):
-        self.lookuptable_generator = PipelineFactory.instance().create_simple_pipeline()
-        stage = ONeilLookupTableRenderStage(self.lookup_size)
-        self.lookuptable_generator.add_stage(stage)
-        self.lookuptable_generator.create()
-        self.lookuptable_generator.trigger({'shader': {'lookuptable': {'parameters': self}}})
-        self.pbOpticalDepth = self.lookuptable_generator.gather().get('lookuptable').get('color')
-
     def remove_instance(self):
         ONeilAtmosphereBase.remove_instance(self)
-        if self.lookuptable_generator is not None:
-            self.lookuptable_generator.remove()
-            self.lookuptable_generator = None
         self.pbOpticalDepth = None
 
     def set_body(self, body):
@@ -201,11 +184,13 @@ class ONeilAtmosphere(ONeilAtmosphereBase):
         return ONeilScatteringDataSource(self)
 
     def generate_lookup_table(self):
-        self.lookuptable_generator.trigger({'parameters': self})
+        self.pbOpticalDepth = get_optical_depth_texture(self.body_radius, self.radius,
+                                                        self.rayleigh_scale_depth, self.mie_scale_depth,
+                                                        self.lookup_size, self.lookup_samples)
 
     def get_lookup_table(self):
         if self.pbOpticalDepth is None:
-            self.create_generator()
+            self.generate_lookup_table()
         return self.pbOpticalDepth
 
     def set_rayleigh_scale_depth(self, rayleigh_scale_depth):
@@ -569,146 +554,6 @@ class ONeilSimpleScatteringDataSource(ONeilScatteringDataSourceBase):
         shape.instance.setShaderInput("fScaleDepth", parameters.ScaleDepth)
         shape.instance.setShaderInput("fScaleOverScaleDepth", scale / parameters.ScaleDepth)
 
-class ONeilLookupTableFragmentShader(ShaderProgram):
-    def __init__(self):
-        ShaderProgram.__init__(self, 'fragment')
-
-    def create_uniforms(self, code):
-        code.append("uniform float fOuterRadius;")     # The outer (atmosphere) radius
-        code.append("uniform float fInnerRadius; ")    # The inner (planetary) radius
-        code.append("uniform float fScale;")           # 1 / (fOuterRadius - fInnerRadius)
-        code.append("uniform float fRayleighScaleHeight;")      # The Rayleigh scattering scale height
-        code.append("uniform float fMieScaleHeight;")           # The Mie scattering scale height
-        code.append("uniform int nSamples;")           # The number of samples
-
-        code.append("#define DELTA 1e-6")
-
-    def create_extra(self, code):
-        self.pi(code)
-
-    def create_inputs(self, code):
-        code.append("in vec2 texcoord;")
-
-    def create_outputs(self, code):
-        if self.version >= 130:
-            code.append("out vec4 frag_output;")
-
-    def lookup_code(self, code):
-        code.append("// As the y tex coord goes from 0 to 1, the angle goes from 0 to 180 degrees")
-        code.append("float fCos = 1.0 - 2 * (texcoord.y);")
-        code.append("float fAngle = acos(fCos);")
-        code.append("vec3 v3Ray = vec3(sin(fAngle), cos(fAngle), 0);    // Ray pointing to the viewpoint")
-        code.append("// As the x tex coord goes from 0 to 1, the height goes from the bottom of the atmosphere to the top")
-        code.append("float fHeight = DELTA + fInnerRadius + ((fOuterRadius - fInnerRadius) * texcoord.x);")
-        code.append("vec3 v3Pos = vec3(0, fHeight, 0);                // The position of the camera")
-
-        code.append("// If the ray from vPos heading in the vRay direction intersects the inner radius (i.e. the planet), then this spot is not visible from the viewpoint")
-        code.append("float B = 2.0f * dot(v3Pos, v3Ray);")
-        code.append("float Bsq = B * B;")
-        code.append("float Cpart = dot(v3Pos,v3Pos);")
-        code.append("float C = Cpart - fInnerRadius*fInnerRadius;")
-        code.append("float fDet = Bsq - 4.0f * C;")
-        code.append("bool bVisible = (fDet < 0.0 || (0.5f * (-B - sqrt(fDet)) <= 0.0) && (0.5 * (-B + sqrt(fDet)) <= 0.0));")
-        code.append("float fRayleighDensityRatio;")
-        code.append("float fMieDensityRatio;")
-        code.append("if(bVisible)")
-        code.append("{")
-        code.append("    fRayleighDensityRatio = exp(-(fHeight - fInnerRadius) * fScale / fRayleighScaleHeight);")
-        code.append("    fMieDensityRatio = exp(-(fHeight - fInnerRadius) * fScale / fMieScaleHeight);")
-        code.append("}")
-        code.append("else")
-        code.append("{")
-        code.append("    fRayleighDensityRatio = 0.0;")
-        code.append("    fMieDensityRatio = 0.0;")
-        code.append("}")
-
-        code.append("// Determine where the ray intersects the outer radius (the top of the atmosphere)")
-        code.append("// This is the end of our ray for determining the optical depth (vPos is the start)")
-        code.append("C = Cpart - fOuterRadius*fOuterRadius;")
-        code.append("fDet = Bsq - 4.0 * C;")
-        code.append("float fFar = 0.5 * (-B + sqrt(fDet));")
-
-        code.append("// Next determine the length of each sample, scale the sample ray, and make sure position checks are at the center of a sample ray")
-        code.append("float fSampleLength = fFar / nSamples;")
-        code.append("float fScaledLength = fSampleLength * fScale;")
-        code.append("vec3 v3SampleRay = v3Ray * fSampleLength;")
-        code.append("v3Pos += v3SampleRay * 0.5;")
-
-        code.append("// Iterate through the samples to sum up the optical depth for the distance the ray travels through the atmosphere")
-        code.append("float fRayleighDepth = 0;")
-        code.append("float fMieDepth = 0;")
-        code.append("for(int i=0; i<nSamples; i++)")
-        code.append("{")
-        code.append("    float fHeight = length(v3Pos);")
-        code.append("    float fAltitude = (fHeight - fInnerRadius) * fScale;")
-        code.append("    fAltitude = max(fAltitude, 0.0);")
-        code.append("    fRayleighDepth += exp(-fAltitude / fRayleighScaleHeight);")
-        code.append("    fMieDepth += exp(-fAltitude / fMieScaleHeight);")
-        code.append("    v3Pos += v3SampleRay;")
-        code.append("}")
-
-        code.append("// Multiply the sums by the length the ray traveled")
-        code.append("fRayleighDepth *= fScaledLength;")
-        code.append("fMieDepth *= fScaledLength;")
-
-        code.append("// Store the results for Rayleigh to the light source, Rayleigh to the camera, Mie to the light source, and Mie to the camera")
-        code.append("frag_output = vec4(fRayleighDensityRatio, fRayleighDepth, fMieDensityRatio, fMieDepth);")
-
-    def create_body(self, code):
-        if self.version < 130:
-            code.append('vec4 frag_output;')
-        self.lookup_code(code)
-        if self.version < 130:
-            code.append('gl_FragColor = frag_output;')
-
-class ONeilLookupTableShader(StructuredShader):
-    def __init__(self):
-        StructuredShader.__init__(self)
-        self.vertex_shader = GeneratorVertexShader()
-        self.fragment_shader = ONeilLookupTableFragmentShader()
-
-    def get_shader_id(self):
-        name = 'oneil'
-        return name
-
-    def update(self, instance, parameters):
-        body_radius = parameters.body_radius
-        inner_radius = body_radius
-        outer_radius = parameters.radius
-
-        scale = 1.0 / (outer_radius - inner_radius)
-
-        instance.setShaderInput("nSamples", parameters.lookup_samples)
-        instance.setShaderInput("fOuterRadius", outer_radius)
-        instance.setShaderInput("fInnerRadius", inner_radius)
-        instance.setShaderInput("fRayleighScaleHeight", parameters.rayleigh_scale_depth)
-        instance.setShaderInput("fMieScaleHeight", parameters.mie_scale_depth)
-        instance.setShaderInput("fScale", scale)
-
-class ONeilLookupTableRenderStage(ProcessStage):
-    def __init__(self, size):
-        ProcessStage.__init__(self, "lookuptable")
-        self.size = (size, size)
-
-    def provides(self):
-        return {'lookuptable': 'color'}
-
-    def create_shader(self):
-        shader = ONeilLookupTableShader()
-        shader.create_and_register_shader(None, None)
-        return shader
-
-    def create(self, pipeline):
-        target = ProcessTarget(self.name)
-        target.set_one_shot(True)
-        self.add_target(target)
-        target.set_fixed_size(self.size)
-        texture_config = TextureConfiguration(wrap_u=Texture.WM_clamp, wrap_v=Texture.WM_clamp,
-                                              minfilter=Texture.FT_linear, magfilter=Texture.FT_linear)
-        target.add_color_target((32, 32, 32, 0), srgb_colors=False, to_ram=False, config=texture_config)
-        target.create(pipeline)
-        target.set_shader(self.create_shader())
-
 class ONeilScattering(ONeilScatteringBase):
     str_id = 'oneil'
 
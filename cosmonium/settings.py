@@ -32,6 +32,12 @@ app_name = 'cosmonium'
 
 use_double = LPoint3 == LPoint3d
 cache_yaml = True
+cache_octree = True
+cache_celestia = True
+cache_tile_index = True
+cache_scattering = True
+#Ignore the existing cache entries and recreate them
+rebuild_cache = False
 prc_file = 'config.prc'
 
 panda11 = PandaSystem.getMajorVersion() >= 1 and PandaSystem.getMinorVersion() >= 11
@@ -106,6 +112,12 @@ shadow_size = 1024
 shadows_slope_scale_bias = True
 shadows_pcf_16 = True
 shadows_snap_cam = False
+#Find the shadow casters of all the receivers with a bounding sphere hierarchy per system
+shadow_casters_index = True
+#Fraction of the receiver radius the geometry can move before the shadow caster candidates are searched again
+shadow_cache_tolerance = 0.1
+#Rebuild the hierarchy of a system when its refitted spheres grew by this ratio
+shadow_index_rebuild_ratio = 2.0
 
 hud_font = 'DejaVuSans'
 markdown_font = 'DejaVuSans'
@@ -164,9 +176,36 @@ debug_lod_frustum = False
 dump_shaders = True
 dump_panda_shaders = False
 debug_shadow_frustum = False
+#Print the load time of the configuration files and the memory used by the objects registry
+debug_load_stats = False
 
 sync_data_load = False
 sync_texture_load = False
+texture_loader_threads = 2
+#Index the tiles of the virtual texture directories instead of looking up each tile file
+use_tile_index = True
+#Maximum size in bytes of the decoded textures kept after their patch is removed
+texture_cache_size = 256 * 1024 * 1024
+#Prefetch the tiles of the patches expected to split from the motion of the observer
+prefetch_patches = True
+#Time in s ahead of which the motion of the observer is predicted
+prefetch_horizon = 2.0
+#Number of predicted positions evaluated within the horizon
+prefetch_steps = 4
+#Time in s between two evaluations of the patches to prefetch
+prefetch_interval = 0.2
+#Maximum number of patches prefetched per shape
+prefetch_max_patches = 16
+#Time in ms allowed per frame for the split and merge of patches
+lod_frame_budget = 4.0
+#Instantiate the catalog objects progressively, nearest first, once the scene is running
+catalog_streaming = True
+#Distance in ly from the home object under which the catalog objects are created during the startup
+catalog_preload_distance = 10.0
+#Time in ms allowed per frame for the creation of the catalog objects
+catalog_stream_budget = 4.0
+#Minimum number of elliptical orbits in a system for their positions to be evaluated in a single batch
+orbit_set_min_size = 32
 
 debug_jump = False
 
@@ -232,6 +271,8 @@ query_color = LColor(0.7, 0.7, 1.0, 1.0)
 query_delay = 0.333
 query_text_size = 18
 query_suggestion_text_size = 12
+#Maximum number of suggestions, ranked by brightness, of the name completion
+query_max_results = 96
 
 default_window_width = 800
 default_window_height = 600
@@ -0,0 +1,347 @@
+#
+#This file is part of Cosmonium.
+#
+#Copyright (C) 2018-2022 Laurent Deru.
+#
+#Cosmonium is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#Cosmonium is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with Cosmonium.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+
+from .engine.anchors import StellarAnchor
+from .pstats import levelpstat
+from . import settings
+
+from math import asin, pi
+import numpy
+
+# The shadow coef of an occluder whose umbra is smaller than this is not visible
+min_shadow_ratio = 1.0 / 255
+# Relative decrease of the angular radius of the light source allowed before the cached candidates are invalid
+light_tolerance = 0.01
+
+class ShadowQueries(object):
+    """
+    Shadow cylinders of a set of (light source, receiver) pairs, stored as arrays.
+    """
+    def __init__(self, receivers, directions, distances, light_radii):
+        self.receivers = receivers
+        self.positions = numpy.array([tuple(receiver.get_local_position()) for receiver in receivers], dtype=numpy.float64).reshape(-1, 3)
+        self.radii = numpy.array([receiver.get_bounding_radius() for receiver in receivers], dtype=numpy.float64)
+        self.directions = numpy.array([tuple(direction) for direction in directions], dtype=numpy.float64).reshape(-1, 3)
+        self.distances = numpy.array(distances, dtype=numpy.float64)
+        self.light_angular_radii = numpy.array([asin(light_radius / (distance - radius)) for (light_radius, distance, radius) in zip(light_radii, distances, self.radii)], dtype=numpy.float64)
+        self.parent_systems = []
+        for receiver in receivers:
+            parents = set()
+            parent = receiver.parent
+            while parent is not None and parent.content != ~0:
+                parents.add(parent)
+                parent = parent.parent
+            self.parent_systems.append(parents)
+
+    def __len__(self):
+        return len(self.receivers)
+
+def spheres_cast_shadow(queries, query_ids, centres, radii, max_radii, margins):
+    """
+    Conservative test of the shadow cylinders of the queries against spheres holding occluders whose
+    radius is at most max_radii, the cylinders are inflated by the margins.
+    """
+    relative_positions = centres - queries.positions[query_ids]
+    directions = queries.directions[query_ids]
+    t = numpy.einsum('ij,ij->i', relative_positions, directions)
+    slack = radii + margins
+    inside = (t + slack >= 0) & (t - slack <= queries.distances[query_ids] + margins)
+    receiver_radii = queries.radii[query_ids]
+    min_distances = numpy.sqrt(numpy.einsum('ij,ij->i', relative_positions, relative_positions)) - slack - receiver_radii
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        angular_radii = numpy.where(max_radii < min_distances, numpy.arcsin(numpy.minimum(max_radii / min_distances, 1.0)), pi / 2)
+    ar_ratios = angular_radii / (queries.light_angular_radii[query_ids] * (1.0 - light_tolerance))
+    projections = relative_positions - directions * t[:, numpy.newaxis]
+    distances_to_projection = numpy.sqrt(numpy.einsum('ij,ij->i', projections, projections))
+    return inside & (distances_to_projection - slack < (1 + ar_ratios) * max_radii + receiver_radii)
+
+def occluders_cast_shadow(queries, query_ids, positions, radii):
+    """
+    Exact test of the occluders against the shadow cylinders of the queries, same as FindShadowCastersTraverser.
+    """
+    relative_positions = positions - queries.positions[query_ids]
+    directions = queries.directions[query_ids]
+    t = numpy.einsum('ij,ij->i', relative_positions, directions)
+    inside = (t >= 0) & (t <= queries.distances[query_ids])
+    receiver_radii = queries.radii[query_ids]
+    distances = numpy.sqrt(numpy.einsum('ij,ij->i', relative_positions, relative_positions)) - receiver_radii
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        angular_radii = numpy.where(radii < distances, numpy.arcsin(numpy.minimum(radii / distances, 1.0)), pi / 2)
+    ar_ratios = angular_radii / queries.light_angular_radii[query_ids]
+    projections = relative_positions - directions * t[:, numpy.newaxis]
+    distances_to_projection = numpy.sqrt(numpy.einsum('ij,ij->i', projections, projections))
+    return inside & (ar_ratios * ar_ratios > min_shadow_ratio) & (distances_to_projection < (1 + ar_ratios) * radii + receiver_radii)
+
+class SystemShadowIndex(object):
+    """
+    Bounding sphere hierarchy over the reflective children of a system anchor.
+
+    The tree is built by median split of the positions of the children and is refitted each frame, it is rebuilt
+    when the children change or when the refitted spheres grew too loose. The candidate occluders found for a query
+    are kept, using an inflated cylinder, while the geometry relative to the receiver moves less than the inflation.
+    """
+    def __init__(self, system):
+        self.system = system
+        self.children = None
+        self.items = []
+        self.others = []
+        self.version = 0
+        self.cache = {}
+
+    def build(self):
+        self.children = list(self.system.children)
+        self.items = [child for child in self.children if child.content & StellarAnchor.Reflective != 0]
+        self.others = [child for child in self.children if child.content & StellarAnchor.System != 0 and child.content & StellarAnchor.Reflective == 0]
+        self.is_system = numpy.array([item.content & StellarAnchor.System != 0 for item in self.items], dtype=bool)
+        self.version += 1
+        self.cache = {}
+        self.refit_items()
+        self.build_tree()
+
+    def build_tree(self):
+        # Nodes are stored parent first, a leaf refers to an item and an internal node to its two children
+        self.node_item = []
+        self.node_children = []
+        self.levels = []
+        if len(self.items) > 0:
+            self.build_node(numpy.arange(len(self.items)), 0)
+        self.node_item = numpy.array(self.node_item, dtype=numpy.int64)
+        self.node_children = numpy.array(self.node_children, dtype=numpy.int64).reshape(-1, 2)
+        self.levels = [numpy.array(level, dtype=numpy.int64) for level in self.levels]
+        self.refit_nodes()
+        self.built_radius = self.node_radii.sum()
+        self.nodes_dirty = False
+
+    def build_node(self, item_ids, depth):
+        node = len(self.node_item)
+        self.node_item.append(-1)
+        self.node_children.append((-1, -1))
+        if len(item_ids) == 1:
+            self.node_item[node] = item_ids[0]
+            return node
+        if len(self.levels) <= depth:
+            self.levels.append([])
+        self.levels[depth].append(node)
+        positions = self.positions[item_ids]
+        axis = numpy.argmax(positions.max(axis=0) - positions.min(axis=0))
+        order = item_ids[numpy.argsort(positions[:, axis], kind='stable')]
+        half = len(order) // 2
+        self.node_children[node] = (self.build_node(order[:half], depth + 1), self.build_node(order[half:], depth + 1))
+        return node
+
+    def refit_items(self):
+        self.positions = numpy.array([tuple(item.get_local_position()) for item in self.items], dtype=numpy.float64).reshape(-1, 3)
+        self.radii = numpy.array([item.get_bounding_radius() for item in self.items], dtype=numpy.float64)
+
+    def refit_nodes(self):
+        count = len(self.node_item)
+        self.node_centres = numpy.zeros((count, 3))
+        self.node_radii = numpy.zeros(count)
+        self.node_max_radii = numpy.zeros(count)
+        leaves = self.node_item >= 0
+        self.node_centres[leaves] = self.positions[self.node_item[leaves]]
+        self.node_radii[leaves] = self.radii[self.node_item[leaves]]
+        self.node_max_radii[leaves] = self.radii[self.node_item[leaves]]
+        for level in reversed(self.levels):
+            children = self.node_children[level]
+            centres = self.node_centres[children]
+            radii = self.node_radii[children][:, :, numpy.newaxis]
+            lower = numpy.minimum(centres[:, 0] - radii[:, 0], centres[:, 1] - radii[:, 1])
+            upper = numpy.maximum(centres[:, 0] + radii[:, 0], centres[:, 1] + radii[:, 1])
+            centre = (lower + upper) / 2
+            self.node_centres[level] = centre
+            self.node_radii[level] = (numpy.linalg.norm(centres - centre[:, numpy.newaxis], axis=2) + radii[:, :, 0]).max(axis=1)
+            self.node_max_radii[level] = self.node_max_radii[children].max(axis=1)
+
+    def refit(self):
+        if self.children != self.system.children:
+            self.build()
+        else:
+            self.refit_items()
+            self.nodes_dirty = True
+
+    def update_nodes(self):
+        """
+        Refit the spheres of the tree to the current positions, the tree is rebuilt if they grew too loose.
+        """
+        if not self.nodes_dirty: return
+        self.refit_nodes()
+        self.nodes_dirty = False
+        if self.node_radii.sum() > settings.shadow_index_rebuild_ratio * self.built_radius:
+            self.build_tree()
+
+    def find_candidates(self, queries, query_ids, margins):
+        """
+        Return the pairs of query and item whose occluder could cast a shadow, descending the tree level by level.
+        """
+        self.update_nodes()
+        if len(self.node_item) == 0:
+            return (numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64))
+        node_ids = numpy.zeros(len(query_ids), dtype=numpy.int64)
+        found_queries = []
+        found_items = []
+        while len(node_ids) > 0:
+            hits = spheres_cast_shadow(queries, query_ids, self.node_centres[node_ids], self.node_radii[node_ids], self.node_max_radii[node_ids], margins)
+            query_ids = query_ids[hits]
+            node_ids = node_ids[hits]
+            margins = margins[hits]
+            items = self.node_item[node_ids]
+            leaves = items >= 0
+            found_queries.append(query_ids[leaves])
+            found_items.append(items[leaves])
+            internal = ~leaves
+            query_ids = numpy.repeat(query_ids[internal], 2)
+            margins = numpy.repeat(margins[internal], 2)
+            node_ids = self.node_children[node_ids[internal]].reshape(-1)
+        return (numpy.concatenate(found_queries), numpy.concatenate(found_items))
+
+    def get_candidates(self, queries, query_ids, keys):
+        """
+        Return the candidate items of each query, reusing the cached candidates when the geometry barely changed.
+        """
+        candidates = {}
+        to_find = []
+        cached = []
+        for (query_id, key) in zip(query_ids.tolist(), keys):
+            entry = self.cache.get(key)
+            if entry is not None and entry[1] == self.version:
+                cached.append((query_id, key, entry))
+            else:
+                to_find.append((query_id, key))
+        if len(cached) > 0:
+            valid = self.check_cache(queries, cached)
+            for ((query_id, key, entry), is_valid) in zip(cached, valid.tolist()):
+                if is_valid:
+                    candidates[query_id] = entry[0]
+                else:
+                    to_find.append((query_id, key))
+        if len(to_find) > 0:
+            find_ids = numpy.array([query_id for (query_id, key) in to_find], dtype=numpy.int64)
+            margins = queries.radii[find_ids] * settings.shadow_cache_tolerance
+            (found_queries, found_items) = self.find_candidates(queries, find_ids, margins)
+            order = numpy.argsort(found_queries, kind='stable')
+            found_queries = found_queries[order]
+            found_items = found_items[order]
+            starts = numpy.searchsorted(found_queries, find_ids, side='left').tolist()
+            ends = numpy.searchsorted(found_queries, find_ids, side='right').tolist()
+            for (i, (query_id, key)) in enumerate(to_find):
+                items = numpy.sort(found_items[starts[i]:ends[i]])
+                candidates[query_id] = items
+                self.cache[key] = (items, self.version, self.positions - queries.positions[query_id],
+                                   queries.directions[query_id], queries.distances[query_id],
+                                   queries.light_angular_radii[query_id], margins[i])
+        return candidates
+
+    def check_cache(self, queries, cached):
+        """
+        Return for each cached entry if the geometry moved less than the margin of the entry since it was stored.
+        """
+        cached_ids = numpy.array([query_id for (query_id, key, entry) in cached], dtype=numpy.int64)
+        (items, versions, relative_positions, directions, distances, light_angular_radii, margins) = zip(*[entry for (query_id, key, entry) in cached])
+        margins = numpy.array(margins)
+        valid = numpy.abs(queries.distances[cached_ids] - numpy.array(distances)) <= margins
+        valid &= queries.light_angular_radii[cached_ids] >= numpy.array(light_angular_radii) * (1.0 - light_tolerance)
+        if len(self.items) > 0:
+            current = self.positions[numpy.newaxis, :, :] - queries.positions[cached_ids][:, numpy.newaxis, :]
+            rotations = numpy.linalg.norm(queries.directions[cached_ids] - numpy.array(directions), axis=1)
+            moves = numpy.linalg.norm(current - numpy.array(relative_positions), axis=2) + rotations[:, numpy.newaxis] * numpy.linalg.norm(current, axis=2)
+            valid &= moves.max(axis=1) <= margins
+        return valid
+
+class ShadowCastersFinder(object):
+    """
+    Find the shadow casters of all the (light source, receiver) pairs in a single pass over the systems.
+
+    The result is the same as traversing the system with a FindShadowCastersTraverser for each pair.
+    """
+    def __init__(self):
+        self.indexes = {}
+        self.candidates_pstat = levelpstat('candidates', 'Shadows')
+
+    def find(self, root, queries, keys):
+        """
+        Return for each query the list of its occluders, ordered as a traversal of the system would.
+        The force_update flag of the visited systems is set if any query entered them.
+        """
+        self.nb_candidates = 0
+        self.used = set()
+        query_ids = numpy.arange(len(queries))
+        entered = numpy.array([root in parents for parents in queries.parent_systems], dtype=bool)
+        if root.content & StellarAnchor.Reflective != 0:
+            positions = numpy.repeat(numpy.array([tuple(root.get_local_position())], dtype=numpy.float64), len(queries), axis=0)
+            entered |= occluders_cast_shadow(queries, query_ids, positions, numpy.full(len(queries), root.get_bounding_radius()))
+        root.force_update = bool(entered.any())
+        results = {}
+        if root.force_update:
+            results = self.traverse_system(root, queries, query_ids[entered], keys)
+        current_keys = set(keys)
+        for (system, index) in list(self.indexes.items()):
+            if system not in self.used:
+                del self.indexes[system]
+            elif len(index.cache) > len(current_keys):
+                index.cache = {key: entry for (key, entry) in index.cache.items() if key in current_keys}
+        self.candidates_pstat.set_level(self.nb_candidates)
+        return [results.get(query_id, []) for query_id in range(len(queries))]
+
+    def traverse_system(self, system, queries, query_ids, keys):
+        self.used.add(system)
+        index = self.indexes.get(system)
+        if index is None:
+            index = SystemShadowIndex(system)
+            self.indexes[system] = index
+            index.build()
+        else:
+            index.refit()
+        for other in index.others:
+            other.force_update = False
+        query_list = query_ids.tolist()
+        candidates = index.get_candidates(queries, query_ids, [keys[query_id] for query_id in query_list])
+        query_candidates = [candidates[query_id] for query_id in query_list]
+        pair_queries = numpy.repeat(query_ids, [len(items) for items in query_candidates])
+        pair_items = numpy.concatenate(query_candidates).astype(numpy.int64)
+        self.nb_candidates += len(pair_items)
+        hits = occluders_cast_shadow(queries, pair_queries, index.positions[pair_items], index.radii[pair_items])
+        hit_items = {query_id: set() for query_id in query_list}
+        for (query_id, item_id) in zip(pair_queries[hits].tolist(), pair_items[hits].tolist()):
+            hit_items[query_id].add(item_id)
+        # The systems holding a receiver are always entered
+        system_items = {item: item_id for (item_id, item) in enumerate(index.items) if index.is_system[item_id]}
+        for query_id in query_list:
+            for parent in queries.parent_systems[query_id]:
+                item_id = system_items.get(parent)
+                if item_id is not None:
+                    hit_items[query_id].add(item_id)
+        sub_results = {}
+        for (item, item_id) in system_items.items():
+            entering = [query_id for query_id in query_list if item_id in hit_items[query_id]]
+            item.force_update = len(entering) > 0
+            if item.force_update:
+                sub_results[item_id] = self.traverse_system(item, queries, numpy.array(entering, dtype=numpy.int64), keys)
+        results = {}
+        for query_id in query_list:
+            receiver = queries.receivers[query_id]
+            occluders = []
+            for item_id in sorted(hit_items[query_id]):
+                if item_id in sub_results:
+                    occluders += sub_results[item_id].get(query_id, [])
+                elif not index.is_system[item_id] and index.items[item_id] is not receiver:
+                    occluders.append(index.items[item_id])
+            results[query_id] = occluders
+        return results
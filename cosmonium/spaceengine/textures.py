@@ -20,6 +20,7 @@
 
 from ..textures import VirtualTextureSource, TextureSourceFactory, AutoTextureSource
 from ..dircontext import defaultDirContext
+from ..tilearchive import open_archive, is_archive, open_tile_index, scan_se_tiles
 
 import os
 
@@ -69,6 +70,22 @@ class SpaceEngineVirtualTextureSource(VirtualTextureSource):
             y = (1 << patch.lod) - patch.y - 1
             return self.root + '/' + dir_name + "/%d_%d_%d%s.%s" % (patch.lod, y, x, self.alpha_channel_text, self.ext)
 
+    def create_tile_index(self, path):
+        return open_tile_index(path, scan_se_tiles, self.ext)
+
+    def child_texture_key(self, patch):
+        y = (1 << patch.lod) - patch.y - 1
+        return (patch.face, patch.lod + 1, patch.x * 2, y * 2, self.channel or '')
+
+    def texture_key(self, patch):
+        y = (1 << patch.lod) - patch.y - 1
+        return (patch.face, patch.lod, patch.x, y, self.channel or '')
+
+    def alpha_texture_key(self, patch):
+        if self.alpha_channel is not None:
+            y = (1 << patch.lod) - patch.y - 1
+            return (patch.face, patch.lod, patch.x, y, self.alpha_channel)
+
     def get_recommended_shape(self):
         return 'se-sphere'
 
@@ -76,6 +93,12 @@ class SpaceEngineTextureSourceFactory(TextureSourceFactory):
     def create_source(self, filename, context=defaultDirContext):
         filename = context.find_texture(filename)
         if filename is None: return None
+        if is_archive(filename):
+            archive = open_archive(filename)
+            if archive.metadata.get('layout') != 'se': return None
+            channel = 'c' if 'c' in archive.channels else None
+            alpha_channel = 'a' if 'a' in archive.channels else None
+            return SpaceEngineVirtualTextureSource(filename, archive.tile_ext, archive.metadata.get('size', 258), channel, alpha_channel)
         if os.path.isdir(filename):
             all_faces = True
             for face in SpaceEngineVirtualTextureSource.face_str:
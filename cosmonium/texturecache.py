@@ -0,0 +1,94 @@
+#
+#This file is part of Cosmonium.
+#
+#Copyright (C) 2018-2022 Laurent Deru.
+#
+#Cosmonium is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#Cosmonium is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with Cosmonium.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+
+from .pstats import levelpstat
+
+from collections import OrderedDict
+
+class TextureCache(object):
+    """
+    Least recently used cache of decoded textures, limited by the total size of their RAM images.
+
+    The textures are kept in the cache after the patch using them has been merged or removed, so they don't
+    need to be read and decoded again when the patch comes back. The RAM image of a heightmap is kept
+    in its texture, so the heightmaps are cached the same way.
+    The textures are copied when they are added and returned, so that each user can apply its own
+    configuration to its texture. The copies share the RAM image of the cached texture.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.hits_pstat = levelpstat('hits', 'TextureCache')
+        self.misses_pstat = levelpstat('misses', 'TextureCache')
+        self.evictions_pstat = levelpstat('evictions', 'TextureCache')
+        self.size_pstat = levelpstat('size', 'TextureCache')
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def calc_texture_size(self, texture):
+        if texture.has_ram_image():
+            return texture.get_ram_image_size()
+        else:
+            return texture.get_expected_ram_image_size()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.hits_pstat.set_level(self.hits)
+            return entry[0].make_copy()
+        else:
+            self.misses += 1
+            self.misses_pstat.set_level(self.misses)
+            return None
+
+    def add(self, key, texture):
+        if texture is None: return
+        size = self.calc_texture_size(texture)
+        if size > self.max_size: return
+        self.remove(key)
+        self.entries[key] = (texture.make_copy(), size)
+        self.size += size
+        while self.size > self.max_size:
+            (old_key, (old_texture, old_size)) = self.entries.popitem(last=False)
+            self.size -= old_size
+            self.evictions += 1
+        self.evictions_pstat.set_level(self.evictions)
+        self.size_pstat.set_level(self.size)
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+            self.size_pstat.set_level(self.size)
+
+    def clear(self):
+        self.entries = OrderedDict()
+        self.size = 0
+        self.size_pstat.set_level(self.size)
@@ -22,6 +22,7 @@
 from panda3d.core import TextureStage, Texture, LColor, PNMImage
 
 from .dircontext import defaultDirContext
+from .tilearchive import open_archive, is_archive
 from .utils import TransparencyBlend
 from . import workers
 from . import settings
@@ -177,6 +178,12 @@ class TextureSource(object):
     def can_split(self, patch):
         return False
 
+    def prefetch(self, patch, priority):
+        """
+        Start loading the texture of the patch in the texture cache, return the future of the load or None.
+        """
+        return None
+
     def get_texture(self, patch):
         return (None, 0, 0)
 
@@ -264,6 +271,11 @@ class AutoTextureSource(TextureSource):
             self.create_source()
         return self.source.can_split(patch)
 
+    def prefetch(self, patch, priority):
+        if self.source is None:
+            self.create_source()
+        return self.source.prefetch(patch, priority)
+
     def get_texture(self, patch):
         if self.source is None:
             self.create_source()
@@ -299,7 +311,7 @@ class TextureFileSource(TextureSource):
                 if settings.sync_texture_load:
                     texture = workers.syncTextureLoader.load_texture(filename)
                 else:
-                    texture = await workers.asyncTextureLoader.load_texture(filename, None)
+                    texture = await workers.asyncTextureLoader.load_texture(filename, None, patch)
                 if texture is not None:
                     if texture_config is not None:
                         texture_config.apply(texture)
@@ -583,7 +595,7 @@ class TextureArray(TextureBase):
             if settings.sync_texture_load:
                 texture = workers.syncTextureLoader.load_texture_array(self.textures)
             else:
-                texture = await workers.asyncTextureLoader.load_texture_array(self.textures)
+                texture = await workers.asyncTextureLoader.load_texture_array(self.textures, patch)
             if texture is not None:
                 self.texture = texture
                 texture_config.apply(texture)
@@ -611,6 +623,11 @@ class HeightMapTexture(DataTexture):
         return (0, 0, 0, 0)
 
 class VirtualTextureSource(TextureSource):
+    """
+    Source of the tiles of a virtual texture, the tiles are either files under root
+    or, if root is a tile archive, the entries of the archive.
+    The tile files are looked up in an index of the root directory when the source provides one.
+    """
     cached = False
     def __init__(self, root, ext, size, attribution=None, context=defaultDirContext):
         TextureSource.__init__(self, attribution)
@@ -619,6 +636,9 @@ class VirtualTextureSource(TextureSource):
         self.ext = ext
         self.texture_size = size
         self.context = context
+        self.archive = None
+        self.tile_index = None
+        self.root_resolved = False
 
     def is_patched(self):
         return True
@@ -632,11 +652,73 @@ class VirtualTextureSource(TextureSource):
     def alpha_texture_name(self, patch):
         return None
 
+    def child_texture_key(self, patch):
+        return None
+
+    def texture_key(self, patch):
+        return None
+
+    def alpha_texture_key(self, patch):
+        return None
+
+    def create_tile_index(self, path):
+        return None
+
+    def resolve_root(self):
+        self.root_resolved = True
+        if self.root is None: return
+        path = self.context.find_texture(self.root)
+        if path is None:
+            print("Virtual texture", self.root, "not found")
+        elif is_archive(path):
+            self.archive = open_archive(path)
+        elif settings.use_tile_index and os.path.isdir(path):
+            self.tile_index = self.create_tile_index(path)
+
+    def get_archive(self):
+        if not self.root_resolved:
+            self.resolve_root()
+        return self.archive
+
+    def get_tile_index(self):
+        if not self.root_resolved:
+            self.resolve_root()
+        return self.tile_index
+
     def can_split(self, patch):
+        archive = self.get_archive()
+        if archive is not None:
+            return archive.has_tile(self.child_texture_key(patch))
+        tile_index = self.get_tile_index()
+        if tile_index is not None:
+            return tile_index.has_tile(self.child_texture_key(patch))
         tex_name = self.child_texture_name(patch)
         exists = os.path.isfile(tex_name)
         return exists
 
+    def prefetch(self, patch, priority):
+        # Only the tiles that can be located without touching the file system are prefetched
+        if settings.sync_texture_load or workers.asyncTextureLoader is None:
+            return None
+        archive = self.get_archive()
+        if archive is not None:
+            key = self.texture_key(patch)
+            data = archive.get_tile(key)
+            if data is None:
+                return None
+            alpha_key = self.alpha_texture_key(patch)
+            alpha_data = archive.get_tile(alpha_key) if alpha_key is not None else None
+            return workers.asyncTextureLoader.prefetch_texture_data(archive.get_tile_name(key), data, alpha_data, priority)
+        tile_index = self.get_tile_index()
+        if tile_index is not None:
+            filename = tile_index.tile_path(self.texture_key(patch))
+            if filename is None:
+                return None
+            alpha_key = self.alpha_texture_key(patch)
+            alpha_filename = tile_index.tile_path(alpha_key) if alpha_key is not None else None
+            return workers.asyncTextureLoader.prefetch_texture(filename, alpha_filename, priority)
+        return None
+
     def find_parent_texture_for(self, patch):
         parent_patch = patch.parent
         while parent_patch is not None and parent_patch.str_id() not in self.map_patch:
@@ -644,18 +726,49 @@ class VirtualTextureSource(TextureSource):
         if parent_patch is not None:
             return self.map_patch[parent_patch.str_id()]
 
+    async def load_archive_texture(self, archive, patch):
+        key = self.texture_key(patch)
+        data = archive.get_tile(key)
+        if data is None:
+            print("Tile", archive.get_tile_name(key), "not found")
+            return None
+        alpha_key = self.alpha_texture_key(patch)
+        alpha_data = archive.get_tile(alpha_key) if alpha_key is not None else None
+        name = archive.get_tile_name(key)
+        if settings.sync_texture_load:
+            return workers.syncTextureLoader.load_texture_data(name, data, alpha_data)
+        else:
+            return await workers.asyncTextureLoader.load_texture_data(name, data, alpha_data, patch)
+
     async def load(self, tasks_tree, patch, texture_config=None):
         texture_info = None
         if not patch.str_id() in self.map_patch:
+            archive = self.get_archive()
+            if archive is not None:
+                texture = await self.load_archive_texture(archive, patch)
+                if texture is not None:
+                    if texture_config is not None:
+                        texture_config.apply(texture)
+                    texture_info = (texture, self.texture_size, patch.lod)
+                    self.map_patch[patch.str_id()] = texture_info
+                if texture_info is None:
+                    texture_info = self.find_parent_texture_for(patch)
+                return texture_info
             tex_name = self.texture_name(patch)
-            filename = self.context.find_texture(tex_name)
-            alpha_tex_name = self.alpha_texture_name(patch)
-            alpha_filename = self.context.find_texture(alpha_tex_name)
+            tile_index = self.get_tile_index()
+            if tile_index is not None:
+                filename = tile_index.tile_path(self.texture_key(patch))
+                alpha_key = self.alpha_texture_key(patch)
+                alpha_filename = tile_index.tile_path(alpha_key) if alpha_key is not None else None
+            else:
+                filename = self.context.find_texture(tex_name)
+                alpha_tex_name = self.alpha_texture_name(patch)
+                alpha_filename = self.context.find_texture(alpha_tex_name)
             if filename is not None:
                 if settings.sync_texture_load:
                     texture = workers.syncTextureLoader.load_texture(filename, alpha_filename)
                 else:
-                    texture = await workers.asyncTextureLoader.load_texture(filename, alpha_filename)
+                    texture = await workers.asyncTextureLoader.load_texture(filename, alpha_filename, patch)
                 if texture is not None:
                     if texture_config is not None:
                         texture_config.apply(texture)
@@ -0,0 +1,280 @@
+#
+#This file is part of Cosmonium.
+#
+#Copyright (C) 2018-2022 Laurent Deru.
+#
+#Cosmonium is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#Cosmonium is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with Cosmonium.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+
+from .cache import create_path_for
+from . import settings
+
+import hashlib
+import json
+import mmap
+import numpy
+import os
+import pickle
+import re
+import struct
+
+# Magic, version, number of tiles, offset and size of the index, offset and size of the metadata
+header_format = '<8sHQQQQQ'
+header_size = struct.calcsize(header_format)
+magic = b'CTILES\x00\x00'
+version = 1
+
+index_dtype = numpy.dtype([('face', '<i1'), ('channel', '<u1'), ('lod', '<u1'), ('pad', '<u1'),
+                           ('x', '<u4'), ('y', '<u4'), ('length', '<u4'), ('offset', '<u8')])
+
+class TileArchiveError(Exception):
+    pass
+
+class TileArchive(object):
+    """
+    Read-only archive of the tiles of a virtual texture.
+
+    The tiles are identified by (face, lod, x, y, channel), x and y are the column and the row of the tile
+    as used in the name of the tile files, face is -1 for the textures without faces and channel is '' for
+    the tiles without channel. The tiles keep their original encoding, ext is the extension of their files.
+    The archive is memory-mapped and the tiles are returned as buffers over the mapping, without copy.
+    """
+    ext = '.tiles'
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as archive_file:
+            self.mmap = mmap.mmap(archive_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mmap) < header_size:
+            raise TileArchiveError("Truncated tile archive %s" % path)
+        (file_magic, file_version, count, index_offset, index_size, metadata_offset, metadata_size) = struct.unpack_from(header_format, self.mmap)
+        if file_magic != magic or file_version != version:
+            raise TileArchiveError("Invalid tile archive %s" % path)
+        self.metadata = json.loads(self.mmap[metadata_offset:metadata_offset + metadata_size].decode('utf-8'))
+        self.tile_ext = self.metadata.get('ext', '')
+        self.channels = self.metadata.get('channels', [''])
+        index = numpy.frombuffer(self.mmap, dtype=index_dtype, count=count, offset=index_offset)
+        faces = index['face'].tolist()
+        channels = [self.channels[channel] for channel in index['channel'].tolist()]
+        lods = index['lod'].tolist()
+        xs = index['x'].tolist()
+        ys = index['y'].tolist()
+        self.tiles = dict(zip(zip(faces, lods, xs, ys, channels), zip(index['offset'].tolist(), index['length'].tolist())))
+        del index
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def get_keys(self):
+        return self.tiles.keys()
+
+    def has_tile(self, key):
+        return key in self.tiles
+
+    def get_tile(self, key):
+        """
+        Return the encoded tile as a read-only buffer, or None if the tile is not in the archive.
+        """
+        entry = self.tiles.get(key)
+        if entry is None:
+            return None
+        (offset, length) = entry
+        return memoryview(self.mmap)[offset:offset + length]
+
+    def get_tile_name(self, key):
+        """
+        Return a unique name for the tile, used as cache key and to detect its format.
+        """
+        (face, lod, x, y, channel) = key
+        return "%s/%d/%d_%d_%d%s.%s" % (self.path, face, lod, y, x, '_' + channel if channel else '', self.tile_ext)
+
+class TileArchiveWriter(object):
+    """
+    Create a tile archive, the tiles are written as they are added and the index when the archive is closed.
+    """
+    def __init__(self, path, ext, metadata=None):
+        self.path = path
+        self.metadata = dict(metadata) if metadata is not None else {}
+        self.metadata['ext'] = ext
+        self.channels = ['']
+        self.entries = []
+        self.keys = set()
+        self.output = open(path, 'wb')
+        self.output.write(b'\x00' * header_size)
+        self.offset = header_size
+
+    def add_tile(self, key, data):
+        (face, lod, x, y, channel) = key
+        if key in self.keys:
+            raise TileArchiveError("Duplicate tile %s" % str(key))
+        self.keys.add(key)
+        if channel not in self.channels:
+            self.channels.append(channel)
+        self.entries.append((face, self.channels.index(channel), lod, 0, x, y, len(data), self.offset))
+        self.output.write(data)
+        self.offset += len(data)
+
+    def close(self):
+        index = numpy.array(self.entries, dtype=index_dtype)
+        index_offset = self.offset
+        self.output.write(index.tobytes())
+        self.metadata['channels'] = self.channels
+        metadata = json.dumps(self.metadata).encode('utf-8')
+        metadata_offset = index_offset + index.nbytes
+        self.output.write(metadata)
+        self.output.seek(0)
+        self.output.write(struct.pack(header_format, magic, version, len(index), index_offset, index.nbytes, metadata_offset, len(metadata)))
+        self.output.close()
+
+class TileDirectoryIndex(object):
+    """
+    In-memory index of the tile files of a virtual texture directory, using the same keys as TileArchive.
+
+    The index is built with a single walk of the directory and is cached on disk. The cache is invalidated
+    when the modification time of the root or of one of the tile directories changes.
+    """
+    cache_version = 1
+
+    def __init__(self, root, scan_function, *args):
+        self.root = root
+        self.tiles = None
+        self.dirs = None
+        cache_key = (self.cache_version, root, scan_function.__name__, args)
+        if settings.cache_tile_index and not settings.rebuild_cache:
+            self.load_cache(cache_key)
+        if self.tiles is None:
+            self.scan(scan_function, *args)
+            if settings.cache_tile_index:
+                self.store_cache(cache_key)
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def has_tile(self, key):
+        return key in self.tiles
+
+    def tile_path(self, key):
+        """
+        Return the full path of the tile or None if there is no such tile.
+        """
+        relative_path = self.tiles.get(key)
+        if relative_path is None:
+            return None
+        return os.path.join(self.root, relative_path)
+
+    def scan(self, scan_function, *args):
+        self.tiles = dict(scan_function(self.root, *args))
+        with os.scandir(self.root) as entries:
+            dirs = sorted(entry.name for entry in entries if entry.is_dir())
+        self.dirs = self.get_dirs_mtime([''] + dirs)
+
+    def get_dirs_mtime(self, dirs):
+        return [(path, os.stat(os.path.join(self.root, path)).st_mtime_ns) for path in dirs]
+
+    def get_cache_file(self):
+        cache_path = create_path_for('tiles')
+        return os.path.join(cache_path, hashlib.md5(self.root.encode()).hexdigest() + '.dat')
+
+    def load_cache(self, cache_key):
+        cache_file = self.get_cache_file()
+        if not os.path.exists(cache_file): return
+        try:
+            with open(cache_file, 'rb') as f:
+                key = pickle.load(f)
+                if key != cache_key: return
+                dirs = pickle.load(f)
+                if self.get_dirs_mtime([path for (path, mtime) in dirs]) != dirs: return
+                self.tiles = pickle.load(f)
+                self.dirs = dirs
+        except (IOError, OSError, ValueError, EOFError, pickle.UnpicklingError) as e:
+            print("Could not read tile index cache for", self.root, ':', e)
+            self.tiles = None
+
+    def store_cache(self, cache_key):
+        cache_file = self.get_cache_file()
+        try:
+            with open(cache_file, 'wb') as f:
+                pickle.dump(cache_key, f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(self.dirs, f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(self.tiles, f, pickle.HIGHEST_PROTOCOL)
+        except IOError as e:
+            print("Could not write tile index cache for", self.root, ':', e)
+
+se_faces = ['pos_x', 'neg_x', 'pos_z', 'neg_z', 'pos_y', 'neg_y']
+
+def scan_se_tiles(root, ext):
+    """
+    Return the key and the path relative to root of the tiles of a SpaceEngine virtual texture.
+    """
+    tile_re = re.compile(r'^(\d+)_(\d+)_(\d+)(?:_(\w+))?\.' + re.escape(ext) + '$')
+    for (face, face_dir) in enumerate(se_faces):
+        path = os.path.join(root, face_dir)
+        if not os.path.isdir(path): continue
+        with os.scandir(path) as entries:
+            names = sorted(entry.name for entry in entries)
+        for name in names:
+            match = tile_re.match(name)
+            if match is None: continue
+            (lod, y, x, channel) = match.groups()
+            yield ((face, int(lod), int(x), int(y), channel or ''), os.path.join(face_dir, name))
+
+def scan_celestia_tiles(root, ext, prefix):
+    """
+    Return the key and the path relative to root of the tiles of a Celestia virtual texture.
+    """
+    level_re = re.compile(r'^level(\d+)$')
+    tile_re = re.compile('^' + re.escape(prefix) + r'(\d+)_(\d+)\.' + re.escape(ext) + '$')
+    with os.scandir(root) as entries:
+        levels = sorted(entry.name for entry in entries if entry.is_dir())
+    for level_dir in levels:
+        level_match = level_re.match(level_dir)
+        if level_match is None: continue
+        lod = int(level_match.group(1))
+        with os.scandir(os.path.join(root, level_dir)) as entries:
+            names = sorted(entry.name for entry in entries)
+        for name in names:
+            match = tile_re.match(name)
+            if match is None: continue
+            (x, y) = match.groups()
+            yield ((-1, lod, int(x), int(y), ''), os.path.join(level_dir, name))
+
+archives = {}
+tile_indexes = {}
+
+def open_archive(path):
+    """
+    Return the archive stored at path, the archives are opened only once.
+    """
+    path = os.path.abspath(path)
+    archive = archives.get(path)
+    if archive is None:
+        archive = TileArchive(path)
+        archives[path] = archive
+    return archive
+
+def open_tile_index(root, scan_function, *args):
+    """
+    Return the index of the tile directory root, the indexes are built only once.
+    """
+    root = os.path.abspath(root)
+    key = (root, scan_function, args)
+    index = tile_indexes.get(key)
+    if index is None:
+        index = TileDirectoryIndex(root, scan_function, *args)
+        tile_indexes[key] = index
+    return index
+
+def is_archive(path):
+    return path is not None and path.endswith(TileArchive.ext)
@@ -26,9 +26,11 @@ class StellarObjectEditor:
         self.stellar_object = stellar_object
         orbit = self.stellar_object.anchor.orbit
         if isinstance(orbit, FixedPosition) and self.stellar_object.system is not None:
+            self.orbit_anchor = self.stellar_object.system.anchor
             if self.stellar_object.system.orbit_object is not None:
                 self.orbit_object = self.stellar_object.system.orbit_object
         else:
+            self.orbit_anchor = self.stellar_object.anchor
             self.orbit_object = self.stellar_object.orbit_object
 
     def get_user_parameters(self):
@@ -51,6 +53,7 @@ class StellarObjectEditor:
 
     def update_user_parameters(self):
         self.orbit_editor.update_user_parameters()
+        self.orbit_anchor.orbit_changed()
         if self.orbit_object is not None:
             self.orbit_object.update_user_parameters()
         self.rotation_editor.update_user_parameters()
@@ -47,7 +47,10 @@ class Query:
         body = None
         if self.current_selection is not None:
             if self.current_selection < len(self.current_list):
-                body = self.current_list[self.current_selection][1]
+                name, body = self.current_list[self.current_selection]
+                if body is None:
+                    # Lazily created object, retrieve it using its name
+                    body = self.owner.get_object(name)
         else:
             text = self.query.get()
             body = self.owner.get_object(text)
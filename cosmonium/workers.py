@@ -18,20 +18,71 @@
 #
 
 
-from panda3d.core import Texture, Filename
+from panda3d.core import Texture, Filename, PNMImage, StringStream
 from direct.task.Task import Task, AsyncFuture
 
 try:
     import queue
 except ImportError:
     import Queue as queue
+import heapq
+import itertools
 import traceback
 
+from .pstats import levelpstat
 from . import settings
 
 # These will be initialized in cosmonium base class
 asyncTextureLoader = None
 syncTextureLoader = None
+textureCache = None
+
+class PrefetchStats(object):
+    """
+    Counters of the prefetched textures. A prefetch is late when the texture is requested before it is loaded,
+    the request then waits for the prefetch. It is evicted when it leaves the texture cache before being used.
+    """
+    def __init__(self):
+        self.counters = {'requested': 0, 'cancelled': 0, 'completed': 0, 'hits': 0, 'late': 0, 'evicted': 0}
+        self.pstats = {name: levelpstat(name, 'Prefetch') for name in self.counters}
+
+    def count(self, name):
+        self.counters[name] += 1
+        self.pstats[name].set_level(self.counters[name])
+
+    def requested(self):
+        self.count('requested')
+
+    def cancelled(self):
+        self.count('cancelled')
+
+    def completed(self):
+        self.count('completed')
+
+    def hit(self):
+        self.count('hits')
+
+    def late(self):
+        self.count('late')
+
+    def evicted(self):
+        self.count('evicted')
+
+    def get_hit_rate(self):
+        if self.counters['completed'] == 0:
+            return 0.0
+        return self.counters['hits'] / self.counters['completed']
+
+    def get_wasted(self):
+        return self.counters['cancelled'] + self.counters['evicted']
+
+    def print_stats(self):
+        print("Prefetch:")
+        print("\tRequested", self.counters['requested'], "Completed", self.counters['completed'], "Hits", self.counters['hits'],
+              "Late", self.counters['late'], "Hit rate %.1f%%" % (self.get_hit_rate() * 100))
+        print("\tWasted", self.get_wasted(), "(Cancelled", self.counters['cancelled'], "Evicted", self.counters['evicted'], ')')
+
+prefetchStats = PrefetchStats()
 
 class AsyncMethod():
     def __init__(self, name, base, method, callback):
@@ -68,45 +119,69 @@ class AsyncMethod():
             return task.done
 
 class AsyncLoader():
-    def __init__(self, base, name):
+    # Maximum time a worker waits for a new job before yielding back to its task chain
+    wait_timeout = 0.5
+
+    def __init__(self, base, name, num_threads=1):
         self.base = base
-        self.in_queue = queue.Queue()
+        self.in_queue = queue.PriorityQueue()
         self.cb_queue = queue.Queue()
+        self.sequence = itertools.count()
         self.base.taskMgr.setupTaskChain(name,
-                                         numThreads = 1,
+                                         numThreads = num_threads,
                                          tickClock = False,
                                          threadPriority = None,
                                          frameBudget = -1,
                                          frameSync = False,
                                          timeslicePriority = True)
 
-        self.process_task = self.base.taskMgr.add(self.processTask, name + 'ProcessTask', taskChain=name)
+        self.process_tasks = []
+        for i in range(num_threads):
+            self.process_tasks.append(self.base.taskMgr.add(self.processTask, name + 'ProcessTask%d' % i, taskChain=name))
         self.callback_task = self.base.taskMgr.add(self.callbackTask, name + 'CallbackTask')
 
     def remove(self):
-        self.base.taskMgr.remove(self.process_task)
-        self.process_task = None
+        for process_task in self.process_tasks:
+            self.base.taskMgr.remove(process_task)
+        self.process_tasks = []
         self.base.taskMgr.remove(self.callback_task)
         self.callback_task = None
 
-    def add_job(self, func, fargs):
+    def add_job(self, func, fargs, priority=0, callback=None):
+        """
+        Queue a job, the jobs with the lowest priority value are processed first.
+        Jobs with the same priority are processed in their submission order.
+        If given, callback(result) is called in the main thread when the job is done and was not cancelled.
+        """
         future = AsyncFuture()
-        job = [func, fargs, future]
+        job = [priority, next(self.sequence), func, fargs, future, callback]
         self.in_queue.put(job)
         return future
 
+    def raise_priority(self, future, priority):
+        """
+        Give the queued job of the future the given priority if it is lower than its current one.
+        """
+        with self.in_queue.mutex:
+            jobs = self.in_queue.queue
+            for job in jobs:
+                if job[4] is future:
+                    if priority < job[0]:
+                        job[0] = priority
+                        heapq.heapify(jobs)
+                    break
+
     def processTask(self, task):
         try:
-            #A small but not null timeout is required to avoid draining CPU resources
-            job = self.in_queue.get(timeout=0.001)
-            (func, fargs, future) = job
-            if not settings.panda11 or not future.cancelled():
-                result = func(*fargs)
-                self.cb_queue.put([future, result])
-            else:
-                #print("job cancelled")
-                pass
+            job = self.in_queue.get(timeout=self.wait_timeout)
         except queue.Empty:
+            return Task.cont
+        (priority, sequence, func, fargs, future, callback) = job
+        if not future.cancelled():
+            result = func(*fargs)
+            self.cb_queue.put([future, result, callback])
+        else:
+            #print("job cancelled")
             pass
         return Task.cont
 
@@ -114,8 +189,10 @@ class AsyncLoader():
         try:
             while True:
                 job = self.cb_queue.get_nowait()
-                (future, result) = job
-                if not settings.panda11 or not future.cancelled():
+                (future, result, callback) = job
+                if not future.cancelled():
+                    if callback is not None:
+                        callback(result)
                     future.set_result(result)
                 else:
                     #print("Result cancelled")
@@ -124,15 +201,152 @@ class AsyncLoader():
             pass
         return Task.cont
 
+def load_texture_data(name, data, alpha_data=None):
+    """
+    Create a texture from an encoded image held in memory, the extension of name gives the format of the image.
+    """
+    tex = Texture(name)
+    if name.lower().endswith('.dds'):
+        if not tex.read_dds(StringStream(data), name):
+            return None
+        return tex
+    image = PNMImage()
+    if not image.read(StringStream(data), name):
+        print("Could not load texture", name)
+        return None
+    if alpha_data is not None:
+        alpha_image = PNMImage()
+        if alpha_image.read(StringStream(alpha_data), name):
+            image.add_alpha()
+            image.copy_channel(alpha_image, 0, 3)
+    tex.load(image)
+    return tex
+
+def texture_priority(patch):
+    """
+    Loading priority of the texture of a patch, the patches closest to the camera are loaded first
+    and, at equal distance, the coarsest ones.
+    """
+    quadtree_node = getattr(patch, 'quadtree_node', None)
+    if quadtree_node is None:
+        # Textures not bound to a patch are needed before any tile
+        return (-1.0, 0)
+    return (quadtree_node.distance, patch.lod)
+
 class AsyncTextureLoader(AsyncLoader):
+    """
+    Load textures in worker threads.
+
+    The textures can also be prefetched, they are then loaded in the texture cache with a low priority.
+    If a texture is requested before its prefetch is done, the request waits for the prefetch
+    whose priority is raised to the one of the request.
+    """
     def __init__(self, base):
-        AsyncLoader.__init__(self, base, 'TextureLoader')
+        AsyncLoader.__init__(self, base, 'TextureLoader', settings.texture_loader_threads)
+        self.prefetching = {}
+        self.prefetched = set()
+        self.requested = set()
+
+    def check_prefetch(self, key, texture, patch):
+        """
+        Update the prefetch state of a requested texture, return the future of its prefetch if it is still loading.
+        """
+        if texture is not None:
+            if key in self.prefetched:
+                self.prefetched.discard(key)
+                prefetchStats.hit()
+            return None
+        future = self.prefetching.get(key)
+        if future is not None:
+            # The prefetch can no longer be cancelled
+            self.requested.add(future)
+            self.raise_priority(future, texture_priority(patch))
+            prefetchStats.late()
+        return future
+
+    async def wait_prefetch(self, key, future):
+        try:
+            texture = await future
+        finally:
+            self.requested.discard(future)
+        self.prefetched.discard(key)
+        # Several requests can wait for the same prefetch
+        if texture is not None:
+            texture = texture.make_copy()
+        return texture
+
+    def prefetch_done(self, key, texture):
+        self.prefetching.pop(key, None)
+        if texture is None: return
+        textureCache.add(key, texture)
+        if key in textureCache:
+            self.prefetched.add(key)
+        prefetchStats.completed()
+
+    def do_prefetch(self, key, func, fargs, priority):
+        if textureCache is None or key in textureCache:
+            return None
+        future = self.prefetching.get(key)
+        if future is None:
+            future = self.add_job(func, fargs, priority, lambda texture: self.prefetch_done(key, texture))
+            self.prefetching[key] = future
+            prefetchStats.requested()
+        return future
 
-    async def load_texture(self, filename, alpha_filename):
-        return await self.add_job(self.do_load_texture, [filename, alpha_filename])
+    def prefetch_texture(self, filename, alpha_filename, priority):
+        """
+        Load the texture in the texture cache, return the future of the load or None if the texture is already loaded.
+        """
+        return self.do_prefetch((filename, alpha_filename), self.do_load_texture, [filename, alpha_filename], priority)
 
-    async def load_texture_array(self, textures):
-        return await self.add_job(self.do_load_texture_array, [textures])
+    def prefetch_texture_data(self, name, data, alpha_data, priority):
+        return self.do_prefetch((name, None), load_texture_data, [name, data, alpha_data], priority)
+
+    def cancel_prefetch(self, future):
+        if not future.done() and future not in self.requested:
+            future.cancel()
+            prefetchStats.cancelled()
+        for (key, prefetch_future) in list(self.prefetching.items()):
+            if prefetch_future is future:
+                del self.prefetching[key]
+
+    def clear_unused_prefetched(self):
+        """
+        Forget the prefetched textures which have been evicted from the cache before being used.
+        """
+        evicted = [key for key in self.prefetched if key not in textureCache]
+        for key in evicted:
+            self.prefetched.discard(key)
+            prefetchStats.evicted()
+
+    async def load_texture(self, filename, alpha_filename, patch=None):
+        if textureCache is not None:
+            texture = textureCache.get((filename, alpha_filename))
+            future = self.check_prefetch((filename, alpha_filename), texture, patch)
+            if texture is not None:
+                return texture
+            if future is not None:
+                return await self.wait_prefetch((filename, alpha_filename), future)
+        texture = await self.add_job(self.do_load_texture, [filename, alpha_filename], texture_priority(patch))
+        if textureCache is not None:
+            textureCache.add((filename, alpha_filename), texture)
+        return texture
+
+    async def load_texture_data(self, name, data, alpha_data=None, patch=None):
+        if textureCache is not None:
+            texture = textureCache.get((name, None))
+            future = self.check_prefetch((name, None), texture, patch)
+            if texture is not None:
+                return texture
+            if future is not None:
+                return await self.wait_prefetch((name, None), future)
+        texture = await self.add_job(load_texture_data, [name, data, alpha_data], texture_priority(patch))
+        if textureCache is not None and texture is not None:
+            textureCache.add((name, None), texture)
+        return texture
+
+    async def load_texture_array(self, textures, patch=None):
+        return await self.add_job(self.do_load_texture_array, [textures], texture_priority(patch))
 
     def do_load_texture(self, filename, alpha_filename):
         tex = Texture()
@@ -161,6 +375,10 @@ class AsyncTextureLoader(AsyncLoader):
 
 class SyncTextureLoader():
     def load_texture(self, filename, alpha_filename=None):
+        if textureCache is not None:
+            texture = textureCache.get((filename, alpha_filename))
+            if texture is not None:
+                return texture
         texture = None
         try:
             panda_filename = Filename.from_os_specific(filename).get_fullpath()
@@ -171,6 +389,18 @@ class SyncTextureLoader():
             texture = loader.loadTexture(panda_filename, alphaPath=panda_alpha_filename)
         except IOError:
             print("Could not load texture", filename)
+        if textureCache is not None:
+            textureCache.add((filename, alpha_filename), texture)
+        return texture
+
+    def load_texture_data(self, name, data, alpha_data=None):
+        if textureCache is not None:
+            texture = textureCache.get((name, None))
+            if texture is not None:
+                return texture
+        texture = load_texture_data(name, data, alpha_data)
+        if textureCache is not None and texture is not None:
+            textureCache.add((name, None), texture)
         return texture
 
     def load_texture_array(self, textures):
@@ -35,8 +35,9 @@ sys.path.insert(1, 'third-party/gltf')
 
 from cosmonium.cosmonium import Cosmonium
 
-from cosmonium.parsers.yamlparser import YamlParser
+from cosmonium.parsers.yamlparser import YamlParser, YamlModuleParser
 from cosmonium.parsers.objectparser import ObjectYamlParser, universeYamlParser
+from cosmonium.catalogs import objectsDB
 from cosmonium.celestia import ssc_parser
 from cosmonium.celestia import stc_parser
 from cosmonium.celestia import star_parser
@@ -44,6 +45,7 @@ from cosmonium.celestia import dsc_parser
 from cosmonium.celestia import asterisms_parser
 from cosmonium.celestia import boundaries_parser
 from cosmonium.dircontext import defaultDirContext
+from cosmonium.astro import units
 
 #import textures to register celestia texture parser
 from cosmonium.celestia import textures
@@ -85,6 +87,8 @@ class CosmoniumConfig(object):
         self.celestia_start_script = 'start.cel'
         self.prc_file = 'config.prc'
         self.test_start = False
+        self.rebuild_cache = False
+        self.load_stats = False
 
     def update_from_args(self, args):
         #TODO: add input checking here
@@ -111,6 +115,8 @@ class CosmoniumConfig(object):
         if self.celestia and self.script is None and self.default_target is None:
             self.script = self.celestia_start_script
         self.test_start = args.test_start
+        self.rebuild_cache = args.rebuild_cache
+        self.load_stats = args.load_stats
 
 class CosmoniumConfigParser(YamlParser):
     def __init__(self, config_file):
@@ -162,6 +168,8 @@ class CosmoniumApp(Cosmonium):
         self.app_config = parser.load()
         self.app_config.update_from_args(args)
         settings.prc_file = self.app_config.prc_file
+        settings.rebuild_cache = self.app_config.rebuild_cache
+        settings.debug_load_stats = self.app_config.load_stats
         Cosmonium.__init__(self)
 
     def find_celestia_data(self):
@@ -196,8 +204,17 @@ class CosmoniumApp(Cosmonium):
                 star_parser.load_bin(self.app_config.celestia_stars_catalog, names, self.universe)
             else:
                 star_parser.load_text(self.app_config.celestia_stars_catalog, names, self.universe)
-        stc_parser.load(self.app_config.celestia_stc, self.universe)
-        ssc_parser.load(self.app_config.celestia_ssc, self.universe)
+        if settings.catalog_streaming:
+            home = self.universe.find_by_path(self.app_config.default_home or _("Sol"))
+            if home is not None:
+                self.catalog_streamer.set_origin(home.anchor.orbit.get_absolute_reference_point_at(0.0))
+            stc_parser.stream(self.app_config.celestia_stc, self.catalog_streamer)
+            ssc_parser.stream(self.app_config.celestia_ssc, self.catalog_streamer)
+            self.splash.set_text("Loading nearby systems...")
+            self.catalog_streamer.load_until(settings.catalog_preload_distance * units.Ly)
+        else:
+            stc_parser.load(self.app_config.celestia_stc, self.universe)
+            ssc_parser.load(self.app_config.celestia_ssc, self.universe)
         asterisms_parser.load(self.app_config.celestia_asterisms, self.universe)
         boundaries_parser.load(self.app_config.celestia_boundaries, self.universe)
         #dsc_parser.load(self.celestia_dsc, self.universe)
@@ -239,6 +256,9 @@ class CosmoniumApp(Cosmonium):
             self.load_universe_celestia()
         else:
             self.load_universe_cosmonium()
+        if settings.debug_load_stats:
+            YamlModuleParser.print_load_times()
+            objectsDB.print_memory_usage()
         if self.app_config.default_home is None:
             self.app_config.default_home = _("Sol")
 
@@ -288,6 +308,14 @@ parser.add_argument("--extra",
                     help="Extra configuration files or directories to load",
                     nargs='+',
                     default=None)
+parser.add_argument("--rebuild-cache",
+                    help="Ignore the cached configuration and catalogs and recreate them",
+                    action='store_true',
+                    default=False)
+parser.add_argument("--load-stats",
+                    help="Print the load time of the configuration files and the memory used by the objects",
+                    action='store_true',
+                    default=False)
 parser.add_argument("--test-start",
                     help=argparse.SUPPRESS,
                     action='store_true',
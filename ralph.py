@@ -62,6 +62,7 @@ from cosmonium.shapes.shape_object import ShapeObject
 from cosmonium.components.elements.surfaces import HeightmapFlatSurface
 from cosmonium.tiles import Tile, TiledShape, GpuPatchTerrainLayer, MeshTerrainLayer
 from cosmonium.patchedshapes import PatchFactory, PatchLayer, VertexSizeMaxDistanceLodControl
+from cosmonium.lodscheduler import lodScheduler
 from cosmonium.shadows import ShadowMapDataSource, CustomShadowMapShadowCaster, PSSMShadowMapShadowCaster, PSSMShadowMapDataSource
 from cosmonium.camera import CameraHolder, SurfaceFollowCameraController, EventsControllerBase
 from cosmonium.nav import ControlNav
@@ -824,6 +825,7 @@ class RoamingRalphDemo(CosmoniumBase):
         self.scene_manager.update_scene_and_camera(0, self.c_camera_holder)
 
         self.worlds.check_and_update_instance(self.scene_manager, self.observer.anchor.get_local_position(), self.observer.anchor.get_absolute_orientation())
+        lodScheduler.process()
 
         self.scene_manager.build_scene(self.common_state, self.c_camera_holder, SceneAnchorCollection(), SceneAnchorCollection())
 
@@ -48,6 +48,18 @@ OctreeAnchor::OctreeAnchor(PyObject *ref_object,
   recreate_octree = true;
 }
 
+void
+OctreeAnchor::add_child(StellarAnchor *child)
+{
+  SystemAnchor::add_child(child);
+  if (!recreate_octree) {
+    //The octree is already created, insert the new child directly
+    child->update(0, 0);
+    child->rebuild();
+    octree->add(child);
+  }
+}
+
 void
 OctreeAnchor::traverse(AnchorTraverser &visitor)
 {
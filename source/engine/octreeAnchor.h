@@ -32,6 +32,8 @@ PUBLISHED:
       RotationBase *rotation,
       LColor point_color);
 
+  void add_child(StellarAnchor *child);
+
   virtual void traverse(AnchorTraverser &visitor);
   virtual void rebuild(void);
 
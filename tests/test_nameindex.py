@@ -0,0 +1,66 @@
+import random
+
+from cosmonium.nameindex import NameIndex
+
+
+class Value(object):
+    def __init__(self, rank):
+        self.rank = rank
+
+
+def create_index(merge_size):
+    index = NameIndex(lambda value: value.rank)
+    index.merge_size = merge_size
+    return index
+
+def test_remove_pending():
+    index = create_index(1)
+    foo = Value(0)
+    foobar = Value(1)
+    index.add('FOO', foo)
+    index.add('FOOBAR', foobar)
+    index.remove('FOO', foo)
+    assert [key for (rank, key, value) in index.startswith('FOO')] == ['FOOBAR']
+    assert [key for (rank, key, value) in index.contains('OO')] == ['FOOBAR']
+    assert len(index) == 1
+
+def test_remove_pending_small_run():
+    index = create_index(1000)
+    foo = Value(0)
+    index.add('FOO', foo)
+    index.add('FOOBAR', Value(1))
+    index.remove('FOO', foo)
+    assert [key for (rank, key, value) in index.startswith('FOO')] == ['FOOBAR']
+    assert len(index) == 1
+
+def test_add_again_after_remove():
+    index = create_index(1)
+    foo = Value(0)
+    index.add('FOO', foo)
+    index.startswith('FOO')
+    index.remove('FOO', foo)
+    index.add_many(['FOO'], [foo])
+    assert [key for (rank, key, value) in index.startswith('FOO')] == ['FOO']
+
+def test_random_against_brute_force():
+    rng = random.Random(1)
+    index = create_index(2000)
+    entries = {}
+    for i in range(20000):
+        key = '%s %d' % (rng.choice(['HIP', 'HD', 'GAIA', 'ALPHA CEN']), rng.randrange(100000))
+        value = Value(i)
+        if key in entries:
+            # Like the objects database, the previous entry of a name is removed
+            index.remove(key, entries[key])
+        entries[key] = value
+        index.add(key, value)
+    removed = rng.sample(sorted(entries), 500)
+    for key in removed:
+        index.remove(key, entries.pop(key))
+    for text in ['HIP 1', 'HD', 'GAIA 99', 'ALPHA']:
+        expected = sorted((value.rank, key) for (key, value) in entries.items() if key.startswith(text))
+        assert [(rank, key) for (rank, key, value) in index.startswith(text)] == [(rank, key) for (rank, key) in expected]
+    for text in ['12', 'CEN 5', '999']:
+        expected = sorted((value.rank, key) for (key, value) in entries.items() if text in key)
+        assert [(rank, key) for (rank, key, value) in index.contains(text)] == [(rank, key) for (rank, key) in expected]
+    assert len(index) == len(entries)
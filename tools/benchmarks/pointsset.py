@@ -0,0 +1,71 @@
+#
+#This file is part of Cosmonium.
+#
+#Copyright (C) 2018-2022 Laurent Deru.
+#
+#Cosmonium is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#Cosmonium is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with Cosmonium.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Benchmark of the creation of the geometry of a PointsSet.
+# Usage: python3 tools/benchmarks/pointsset.py [point count]
+
+import sys
+import os
+
+filepath = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+sys.path.insert(0, filepath)
+sys.path.insert(1, os.path.join(filepath, 'lib'))
+sys.path.insert(1, os.path.join(filepath, 'third-party'))
+sys.path.insert(1, os.path.join(filepath, 'third-party/gltf'))
+
+
+from panda3d.core import LPoint3, LColor
+from time import time
+
+import numpy
+
+from cosmonium.pointsset import PointsSet
+from cosmonium import settings
+
+def run(count):
+    settings.shader_version = 330
+    settings.dump_shaders = False
+    rng = numpy.random.default_rng(0)
+    positions = rng.uniform(-1000.0, 1000.0, (count, 3)).astype(numpy.float32)
+    colors = rng.uniform(0.0, 1.0, (count, 4)).astype(numpy.float32)
+    sizes = rng.uniform(1.0, 10.0, count).astype(numpy.float32)
+    oids = rng.uniform(0.0, 1.0, (count, 4)).astype(numpy.float32)
+    pointsset = PointsSet(use_sprites=True)
+    start = time()
+    pointsset.update_arrays(positions, colors, sizes, oids)
+    print("Arrays, first update: %.3fs" % (time() - start))
+    start = time()
+    pointsset.update_arrays(positions, colors, sizes, oids)
+    print("Arrays, same size: %.3fs" % (time() - start))
+    start = time()
+    pointsset.update_arrays(positions[:count // 2], colors[:count // 2], sizes[:count // 2], oids[:count // 2])
+    print("Arrays, half size: %.3fs" % (time() - start))
+    pointsset.reset()
+    start = time()
+    for i in range(count):
+        pointsset.add_point(LPoint3(*positions[i]), LColor(*colors[i]), float(sizes[i]), LColor(*oids[i]))
+    pointsset.update()
+    print("Per point: %.3fs" % (time() - start))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    else:
+        count = 1000000
+    run(count)
@@ -0,0 +1,94 @@
+#
+#This file is part of Cosmonium.
+#
+#Copyright (C) 2018-2022 Laurent Deru.
+#
+#Cosmonium is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#Cosmonium is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with Cosmonium.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Load-time benchmark of the Celestia binary star catalog reader.
+# Usage: python3 tools/benchmarks/stars_dat.py [star count]
+
+import sys
+import os
+
+filepath = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+sys.path.insert(0, filepath)
+sys.path.insert(1, os.path.join(filepath, 'lib'))
+sys.path.insert(1, os.path.join(filepath, 'third-party'))
+sys.path.insert(1, os.path.join(filepath, 'third-party/gltf'))
+
+import builtins
+import struct
+import tempfile
+from time import time
+
+import numpy
+
+from cosmonium.celestia import star_parser
+from cosmonium.objects.universe import Universe
+from cosmonium.ui.splash import NoSplash
+
+class FakeBase:
+    splash = NoSplash()
+    def destroy(self):
+        pass
+
+def create_synthetic_catalog(path, count, seed=0):
+    rng = numpy.random.default_rng(seed)
+    records = numpy.empty(count, dtype=star_parser.star_record_dtype)
+    records['catalog'] = numpy.arange(1, count + 1)
+    records['position'] = rng.normal(0.0, 1000.0, (count, 3))
+    records['abs_magnitude'] = rng.uniform(-5.0, 15.0, count) * 256
+    # Normal stars of class O to M with luminosity class I-a0 to VI
+    records['spectral_type'] = (rng.integers(0, 7, count) << 8) | (rng.integers(0, 10, count) << 4) | rng.integers(0, 8, count)
+    with open(path, 'wb') as output:
+        output.write(struct.pack("<8shi", b"CELSTARS", 0x0100, count))
+        records.tofile(output)
+
+def read_per_record(path):
+    data = open(path, 'rb')
+    header, version, count = struct.unpack("<8shi", data.read(8+2+4))
+    fmt="<ifffhh"
+    size=struct.calcsize(fmt)
+    result = []
+    for i in range(count):
+        catNo, x, y, z, abs_magnitude, spectral_type = struct.unpack(fmt, data.read(size))
+        result.append((catNo, x, y, z, abs_magnitude / 256.0, star_parser.spectralTypeIntDecoder.decode(spectral_type)))
+    data.close()
+    return result
+
+def run(count):
+    builtins.base = FakeBase()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'stars.dat')
+        start = time()
+        create_synthetic_catalog(path, count)
+        print("Created synthetic catalog of %d stars in %.3fs" % (count, time() - start))
+        start = time()
+        read_per_record(path)
+        print("Per-record struct.unpack: %.3fs" % (time() - start))
+        start = time()
+        star_parser.read_bin(path)
+        print("Bulk numpy read: %.3fs" % (time() - start))
+        start = time()
+        star_parser.do_load_bin(path, {}, Universe(None))
+        print("Star table creation: %.3fs" % (time() - start))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    else:
+        count = 2000000
+    run(count)
@@ -0,0 +1,135 @@
+#
+#This file is part of Cosmonium.
+#
+#Copyright (C) 2018-2022 Laurent Deru.
+#
+#Cosmonium is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#Cosmonium is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with Cosmonium.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Microbenchmark of the visibility and resolved state transitions of the frame loop.
+# Usage: python3 tools/benchmarks/visibility.py [visible count]
+
+import sys
+import os
+
+filepath = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+sys.path.insert(0, filepath)
+sys.path.insert(1, os.path.join(filepath, 'lib'))
+sys.path.insert(1, os.path.join(filepath, 'third-party'))
+sys.path.insert(1, os.path.join(filepath, 'third-party/cefpanda'))
+sys.path.insert(1, os.path.join(filepath, 'third-party/gltf'))
+
+import random
+from time import time
+
+from cosmonium.cosmonium import Cosmonium
+from cosmonium import settings
+
+class FakeAnchor:
+    def __init__(self, app_magnitude, resolved):
+        self._app_magnitude = app_magnitude
+        self.resolved = resolved
+        self.visible = False
+        self.was_visible = False
+        self.was_resolved = False
+
+class FakeWorlds:
+    worlds = []
+
+class FakeApp:
+    def __init__(self):
+        self.worlds = FakeWorlds()
+        self.extra = []
+        self.old_visibles = []
+        self.old_resolved = []
+        self.start_frame()
+
+    def start_frame(self):
+        self.becoming_visibles = []
+        self.no_longer_visibles = []
+        self.becoming_resolved = []
+        self.no_longer_resolved = []
+
+    def end_frame(self):
+        for anchor in self.visibles:
+            anchor.was_visible = anchor.visible
+            anchor.was_resolved = anchor.resolved
+        self.old_visibles = self.visibles
+        self.old_resolved = self.resolved
+
+def update_states_lists(self):
+    # Previous implementation, using membership tests on lists
+    visibles = []
+    resolved = []
+    for anchor in self.visibles:
+        visible = anchor.resolved or anchor._app_magnitude < settings.lowest_app_magnitude
+        if visible:
+            visibles.append(anchor)
+            if not anchor.was_visible:
+                self.becoming_visibles.append(anchor)
+            if anchor.resolved:
+                resolved.append(anchor)
+        else:
+            if anchor.was_visible:
+                self.no_longer_visibles.append(anchor)
+        anchor.visible = visible
+    for anchor in self.extra:
+        if anchor in self.visibles: continue
+        if not (anchor._app_magnitude < settings.lowest_app_magnitude):
+            if anchor.was_visible:
+                self.no_longer_visibles.append(anchor)
+            anchor.visible = False
+    for world in self.worlds.worlds:
+        resolved.append(world.anchor)
+    for anchor in self.old_visibles:
+        if not anchor in self.visibles:
+            self.no_longer_visibles.append(anchor)
+            anchor.was_visible = anchor.visible
+            anchor.visible = False
+    self.visibles = visibles
+    self.resolved = resolved
+    for anchor in resolved:
+        if not anchor.was_resolved:
+            self.becoming_resolved.append(anchor)
+    for anchor in self.old_resolved:
+        if not anchor in self.resolved:
+            self.no_longer_resolved.append(anchor)
+
+def run_frames(update_states, count, frames):
+    rng = random.Random(0)
+    anchors = [FakeAnchor(rng.uniform(0, 10), rng.random() < 0.1) for i in range(count + count // 10)]
+    app = FakeApp()
+    start = time()
+    transitions = 0
+    for i in range(frames):
+        # Shift the visible window to have objects entering and leaving each frame
+        offset = rng.randint(0, count // 10)
+        app.visibles = anchors[offset:offset + count]
+        app.start_frame()
+        update_states(app)
+        transitions += len(app.becoming_visibles) + len(app.no_longer_visibles) + len(app.becoming_resolved) + len(app.no_longer_resolved)
+        app.end_frame()
+    return (time() - start) / frames, transitions
+
+def run(count, frames=10):
+    for name, update_states in (('Sets', Cosmonium.update_states), ('Lists', update_states_lists)):
+        duration, transitions = run_frames(update_states, count, frames)
+        print("%s: %.2fms per frame (%d transitions)" % (name, duration * 1000, transitions))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    else:
+        count = 10000
+    run(count)
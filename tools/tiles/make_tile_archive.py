@@ -0,0 +1,71 @@
+#
+#This file is part of Cosmonium.
+#
+#Copyright (C) 2018-2022 Laurent Deru.
+#
+#Cosmonium is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#Cosmonium is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with Cosmonium.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Convert a SpaceEngine or Celestia virtual texture directory into a tile archive.
+# Usage: python3 tools/tiles/make_tile_archive.py [--ext jpg] [--prefix tx_] [--size 258] <tile directory> <archive.tiles>
+#
+# The archive can then be used as the root of the virtual texture, in place of the tile directory.
+
+import sys
+import os
+
+filepath = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+sys.path.insert(0, filepath)
+sys.path.insert(1, os.path.join(filepath, 'third-party'))
+
+import argparse
+
+from cosmonium.tilearchive import TileArchiveWriter, TileArchive, se_faces, scan_se_tiles, scan_celestia_tiles
+
+def convert(root, output, ext, prefix, size):
+    if all(os.path.isdir(os.path.join(root, face_dir)) for face_dir in se_faces):
+        layout = 'se'
+        tiles = scan_se_tiles(root, ext)
+    else:
+        layout = 'celestia'
+        tiles = scan_celestia_tiles(root, ext, prefix)
+    writer = TileArchiveWriter(output, ext, {'layout': layout, 'size': size})
+    count = 0
+    total_size = 0
+    for (key, path) in tiles:
+        with open(os.path.join(root, path), 'rb') as tile_file:
+            data = tile_file.read()
+        writer.add_tile(key, data)
+        count += 1
+        total_size += len(data)
+    writer.close()
+    print("Stored %d %s tiles (%.1f MB) in %s" % (count, layout, total_size / 1024 / 1024, output))
+    archive = TileArchive(output)
+    if len(archive) != count:
+        print("ERROR: The archive holds %d tiles instead of %d" % (len(archive), count))
+        return False
+    return True
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert a virtual texture directory into a tile archive")
+    parser.add_argument('--ext', default='jpg', help="Extension of the tile files")
+    parser.add_argument('--prefix', default='tx_', help="Prefix of the Celestia tile files")
+    parser.add_argument('--size', type=int, default=258, help="Size of the tiles")
+    parser.add_argument('root', help="Tile directory")
+    parser.add_argument('output', help="Tile archive to create, should end with " + TileArchive.ext)
+    args = parser.parse_args()
+    if not args.output.endswith(TileArchive.ext):
+        print("WARNING: The tile archive will not be recognized without the %s extension" % TileArchive.ext)
+    if not convert(args.root, args.output, args.ext, args.prefix, args.size):
+        sys.exit(1)